@@ -0,0 +1,336 @@
+"""
+Read-only Binary Snapshot of the MatLib Database
+A fixed-layout index of the asset records opened via mmap - farm and batch sessions look up
+assets without parsing library.json and share the pages of the file through the OS page cache
+"""
+
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from collections.abc import Iterator
+
+from matlib.core import fileio, migrations
+
+SNAPSHOT_FILE = "library.snapshot"
+
+MAGIC = b"MATLIBSN"
+FORMAT_VERSION = 1
+
+# magic, format version, schema version, revision,
+# number of sources, categories, tags, assets, refs and strings,
+# offsets of the sources, categories, tags, assets, name index, id index, refs, string offsets and string data
+_HEADER = struct.Struct("<8sIIq6I9Q")
+# library file the snapshot was compiled from: name, mtime_ns, size (-1 if it did not exist)
+_SOURCE = struct.Struct("<Iqq")
+# id, name, renderer, date, favorite, usd, builder, first category ref, categories, first tag ref, tags
+_ASSET = struct.Struct("<4IIii4I")
+# sort key, asset index
+_INDEX = struct.Struct("<II")
+_U32 = struct.Struct("<I")
+
+
+class _StringTable:
+    """Deduplicated utf-8 strings referenced by their index"""
+
+    def __init__(self) -> None:
+        self._index = {}
+        self._data = []
+
+    def add(self, value) -> int:
+        value = str(value)
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self._data)
+            self._data.append(value.encode("utf-8"))
+        return index
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def encode(self) -> tuple[bytes, bytes]:
+        """Return the offsets (one more than strings) and the concatenated string data"""
+        offsets = [0]
+        for value in self._data:
+            offsets.append(offsets[-1] + len(value))
+        return struct.pack(f"<{len(offsets)}I", *offsets), b"".join(self._data)
+
+
+def encode(data: dict, sources: dict[str, tuple[int, int] | None]) -> bytes:
+    """
+    Compile library data into the binary snapshot layout
+
+    :param data: Library data in the layout of library.json
+    :type data: dict
+    :param sources: Stat signatures of the files the data was read from, keyed by file name
+    :type sources: dict[str, tuple[int, int] | None]
+    :return: Snapshot file content
+    :rtype: bytes
+    """
+    strings = _StringTable()
+    source_part = b"".join(
+        _SOURCE.pack(strings.add(name), *(signature or (0, -1)))
+        for name, signature in sources.items()
+    )
+    categories = [strings.add(c) for c in data.get("categories", [])]
+    tags = [strings.add(t) for t in data.get("tags", [])]
+
+    assets = data.get("assets", [])
+    records = []
+    refs = []
+    names = []
+    ids = []
+    for index, asset in enumerate(assets):
+        asset_cats = [strings.add(c) for c in asset.get("categories", [])]
+        asset_tags = [strings.add(t) for t in asset.get("tags", [])]
+        name = str(asset.get("name", ""))
+        mat_id = strings.add(asset["id"])
+        records.append(
+            _ASSET.pack(
+                mat_id,
+                strings.add(name),
+                strings.add(asset.get("renderer", "")),
+                strings.add(asset.get("date", "")),
+                int(bool(asset.get("favorite", False))),
+                int(asset.get("usd", 1)),
+                int(asset.get("builder", 0)),
+                len(refs),
+                len(asset_cats),
+                len(refs) + len(asset_cats),
+                len(asset_tags),
+            )
+        )
+        refs.extend(asset_cats)
+        refs.extend(asset_tags)
+        names.append((name.casefold(), index))
+        ids.append((str(asset["id"]), index))
+
+    names.sort()
+    ids.sort()
+    name_part = b"".join(_INDEX.pack(strings.add(key), i) for key, i in names)
+    id_part = b"".join(_INDEX.pack(strings.add(key), i) for key, i in ids)
+    string_offsets, string_data = strings.encode()
+
+    parts = [
+        source_part,
+        struct.pack(f"<{len(categories)}I", *categories),
+        struct.pack(f"<{len(tags)}I", *tags),
+        b"".join(records),
+        name_part,
+        id_part,
+        struct.pack(f"<{len(refs)}I", *refs),
+        string_offsets,
+        string_data,
+    ]
+    offsets = []
+    position = _HEADER.size
+    for part in parts:
+        offsets.append(position)
+        position += len(part)
+
+    header = _HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        migrations.version(data),
+        data.get("revision", 0),
+        len(sources),
+        len(categories),
+        len(tags),
+        len(assets),
+        len(refs),
+        len(strings),
+        *offsets,
+    )
+    return header + b"".join(parts)
+
+
+def write(directory: str, data: dict, sources: list[str]) -> None:
+    """
+    Compile the library data and replace the snapshot in directory
+
+    :param directory: Library directory
+    :type directory: str
+    :param data: Library data in the layout of library.json
+    :type data: dict
+    :param sources: Files in directory the data has been written to - a change to any of them makes the snapshot stale
+    :type sources: list[str]
+    """
+    signatures = {name: fileio.stat_signature(directory + name) for name in sources}
+    fileio.atomic_write(directory + SNAPSHOT_FILE, encode(data, signatures))
+
+
+def open_snapshot(directory: str) -> Snapshot | None:
+    """
+    Open the snapshot of the library in directory
+    Returns None if there is none or the library has been written since it was compiled
+
+    :param directory: Library directory
+    :type directory: str
+    :return: The opened snapshot - close it or use it as a context manager
+    :rtype: Snapshot | None
+    """
+    try:
+        snapshot = Snapshot(directory + SNAPSHOT_FILE)
+    except (OSError, ValueError):
+        return None
+    if not snapshot.is_current():
+        snapshot.close()
+        return None
+    return snapshot
+
+
+class Snapshot:
+    """
+    Read-only view of a binary library snapshot
+    Assets are returned as dicts in the layout of library.json and decoded on access only
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        with open(path, "rb") as snapshot_file:
+            # mmap needs a non-empty file
+            if os.fstat(snapshot_file.fileno()).st_size < _HEADER.size:
+                raise ValueError(f"MatLib: {path} is not a library snapshot")
+            self._map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._map, 0)
+        if header[0] != MAGIC or header[1] != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"MatLib: {path} is not a library snapshot of version {FORMAT_VERSION}")
+        (
+            self._schema_version,
+            self._revision,
+            self._source_count,
+            self._category_count,
+            self._tag_count,
+            self._asset_count,
+            _ref_count,
+            _string_count,
+            self._sources_at,
+            self._categories_at,
+            self._tags_at,
+            self._assets_at,
+            self._names_at,
+            self._ids_at,
+            self._refs_at,
+            self._string_offsets_at,
+            self._string_data_at,
+        ) = header[2:]
+
+    def __enter__(self) -> Snapshot:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._asset_count
+
+    def close(self) -> None:
+        self._map.close()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def revision(self) -> int:
+        """Library revision the snapshot was compiled from"""
+        return self._revision
+
+    @property
+    def schema_version(self) -> int:
+        """Schema version of the library data the snapshot was compiled from"""
+        return self._schema_version
+
+    def is_current(self) -> bool:
+        """Return True if none of the library files has changed since the snapshot was compiled"""
+        directory = os.path.dirname(self._path)
+        for index in range(self._source_count):
+            name, mtime, size = _SOURCE.unpack_from(
+                self._map, self._sources_at + index * _SOURCE.size
+            )
+            signature = fileio.stat_signature(os.path.join(directory, self._string(name)))
+            if signature != ((mtime, size) if size >= 0 else None):
+                return False
+        return True
+
+    def _string(self, index: int) -> str:
+        start, end = struct.unpack_from("<II", self._map, self._string_offsets_at + index * 4)
+        at = self._string_data_at
+        return self._map[at + start : at + end].decode("utf-8")
+
+    def _u32(self, at: int, count: int) -> tuple[int, ...]:
+        return struct.unpack_from(f"<{count}I", self._map, at)
+
+    @property
+    def categories(self) -> list[str]:
+        return [self._string(i) for i in self._u32(self._categories_at, self._category_count)]
+
+    @property
+    def tags(self) -> list[str]:
+        return [self._string(i) for i in self._u32(self._tags_at, self._tag_count)]
+
+    def asset(self, index: int) -> dict:
+        """Return the asset at index in library order"""
+        if not 0 <= index < self._asset_count:
+            raise IndexError(index)
+        (
+            mat_id,
+            name,
+            renderer,
+            date,
+            favorite,
+            usd,
+            builder,
+            cat_start,
+            cat_count,
+            tag_start,
+            tag_count,
+        ) = _ASSET.unpack_from(self._map, self._assets_at + index * _ASSET.size)
+        return {
+            "id": self._string(mat_id),
+            "name": self._string(name),
+            "categories": [
+                self._string(i) for i in self._u32(self._refs_at + cat_start * 4, cat_count)
+            ],
+            "tags": [
+                self._string(i) for i in self._u32(self._refs_at + tag_start * 4, tag_count)
+            ],
+            "favorite": bool(favorite),
+            "date": self._string(date),
+            "renderer": self._string(renderer),
+            "usd": usd,
+            "builder": builder,
+        }
+
+    def __iter__(self) -> Iterator[dict]:
+        for index in range(self._asset_count):
+            yield self.asset(index)
+
+    def _search(self, at: int, key: str) -> Iterator[int]:
+        """Binary search a sorted index for key - yields the indices of all matching assets"""
+        low, high = 0, self._asset_count
+        while low < high:
+            middle = (low + high) // 2
+            (string,) = _U32.unpack_from(self._map, at + middle * _INDEX.size)
+            if self._string(string) < key:
+                low = middle + 1
+            else:
+                high = middle
+        while low < self._asset_count:
+            string, index = _INDEX.unpack_from(self._map, at + low * _INDEX.size)
+            if self._string(string) != key:
+                return
+            yield index
+            low += 1
+
+    def find(self, name: str) -> list[dict]:
+        """Return all assets with the given name - case insensitive"""
+        return [self.asset(i) for i in self._search(self._names_at, name.casefold())]
+
+    def get(self, mat_id: str) -> dict | None:
+        """Return the asset with the given id - None if there is none"""
+        for index in self._search(self._ids_at, str(mat_id)):
+            return self.asset(index)
+        return None
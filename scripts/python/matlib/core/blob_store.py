@@ -0,0 +1,290 @@
+"""
+Content-addressed Blob Store for the MatLib Asset Files
+Identical .mat, .interface and image files are stored once under blobs/ by their hash,
+the files in the asset and image directories are hard links to those blobs
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from typing import TYPE_CHECKING
+
+from matlib.core import fileio
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+BLOB_DIR = "blobs/"
+MANIFEST_DIR = BLOB_DIR + "manifests/"
+HASH_CHUNK = 1024 * 1024
+
+
+def file_hash(path: str) -> str:
+    """Return the sha256 hex digest of the file at path"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> BlobStore | None:
+    """
+    Return the blob store of the library in the preferences - None if it is switched off
+    Pass directory for a library other than the one in the preferences
+    """
+    if not preferences.blob_store:
+        return None
+    return BlobStore(fileio.LibraryLayout.from_prefs(preferences, directory))
+
+
+def _replace_with_link(blob: str, path: str) -> bool:
+    """
+    Make path a hard link to blob - copies if the file system has no hard links
+    Returns True if a link has been made
+    """
+    if os.path.exists(path) and os.path.samefile(blob, path):
+        return True
+    tmp_path = path + ".link.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(blob, tmp_path)
+        linked = True
+    except OSError:
+        shutil.copyfile(blob, tmp_path)
+        linked = False
+    os.replace(tmp_path, path)
+    return linked
+
+
+class BlobStore:
+    """
+    Content-addressed Store for the files of the assets of one library
+    Every asset has a manifest listing the hash of its .mat, .interface and image file,
+    copying an asset within or between libraries on the same disk only adds links
+    """
+
+    def __init__(self, layout: fileio.LibraryLayout) -> None:
+        self._layout = layout
+        self._path = layout.path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def layout(self) -> fileio.LibraryLayout:
+        return self._layout
+
+    def blob_path(self, digest: str) -> str:
+        """Return the file a blob is stored in"""
+        return self._path + BLOB_DIR + digest[:2] + "/" + digest
+
+    def manifest_path(self, mat_id: str) -> str:
+        return self._path + MANIFEST_DIR + str(mat_id) + ".json"
+
+    def asset_files(self, mat_id: str) -> dict[str, str]:
+        """Return the files of an asset keyed by their role"""
+        return self._layout.asset_files(mat_id)
+
+    def manifest(self, mat_id: str) -> dict[str, dict] | None:
+        """
+        Return the stored files of an asset as role -> {"hash", "size"}
+        None if the asset is not in the store
+        """
+        try:
+            with open(self.manifest_path(mat_id), encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)["files"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write_manifest(self, mat_id: str, files: dict[str, dict]) -> None:
+        os.makedirs(self._path + MANIFEST_DIR, exist_ok=True)
+        data = {"id": str(mat_id), "files": files}
+        fileio.atomic_write(
+            self.manifest_path(mat_id), json.dumps(data, indent=4).encode("utf-8")
+        )
+
+    def store_file(self, path: str) -> str:
+        """
+        Move the content of path into the store and replace path with a link to the blob
+        A blob with the same content is reused - the file then costs no extra space
+
+        :param path: File to store
+        :type path: str
+        :return: Hash of the content
+        :rtype: str
+        """
+        digest = file_hash(path)
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            # The file itself becomes the blob
+            _replace_with_link(path, blob)
+        else:
+            _replace_with_link(blob, path)
+        return digest
+
+    def add_asset(self, mat_id: str) -> dict[str, dict]:
+        """
+        Store the current files of an asset and write its manifest
+        Call after the files have been written, e.g. when a material has been saved or rendered
+
+        :param mat_id: Id of the asset
+        :type mat_id: str
+        :return: The manifest - role -> {"hash", "size"}
+        :rtype: dict[str, dict]
+        """
+        files = {}
+        for role, path in self.asset_files(mat_id).items():
+            if os.path.exists(path):
+                files[role] = {"hash": self.store_file(path), "size": os.path.getsize(path)}
+        self._write_manifest(mat_id, files)
+        return files
+
+    def detach_asset(self, mat_id: str) -> None:
+        """
+        Give the files of an asset their own copy of the content
+        Required before a file is rewritten in place, e.g. by saveItemsToFile or a thumbnail render,
+        which would otherwise change every asset sharing the blob
+        """
+        for path in self.asset_files(mat_id).values():
+            try:
+                if os.stat(path).st_nlink < 2:
+                    continue
+            except OSError:
+                continue
+            tmp_path = path + ".detach.tmp"
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, path)
+
+    def remove_asset(self, mat_id: str) -> None:
+        """Forget the manifest of an asset - its blobs are removed by collect_garbage()"""
+        try:
+            os.remove(self.manifest_path(mat_id))
+        except OSError:
+            pass
+
+    def link_file(self, digest: str, path: str) -> bool:
+        """Make path a link to the stored blob - returns False if it is not in the store"""
+        blob = self.blob_path(digest)
+        if not os.path.exists(blob):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _replace_with_link(blob, path)
+        return True
+
+    def import_file(self, source: str, path: str) -> str:
+        """
+        Copy a file from outside the store to path
+        Content already in the store is only linked, new content is copied once
+
+        :param source: File to import, e.g. of another library
+        :type source: str
+        :param path: Target file in this library
+        :type path: str
+        :return: Hash of the content
+        :rtype: str
+        """
+        digest = file_hash(source)
+        if not self.link_file(digest, path):
+            blob = self.blob_path(digest)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            tmp_path = blob + ".tmp"
+            shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, blob)
+            self.link_file(digest, path)
+        return digest
+
+    def import_asset(self, mat_id: str, sources: dict[str, str]) -> dict[str, dict]:
+        """
+        Import the files of an asset from outside the store, e.g. from a library of an older MatLib
+
+        :param mat_id: Id of the asset in this library
+        :type mat_id: str
+        :param sources: Files to import keyed by their role ("mat", "interface", "image")
+        :type sources: dict[str, str]
+        :return: The manifest - role -> {"hash", "size"}
+        :rtype: dict[str, dict]
+        """
+        paths = self.asset_files(mat_id)
+        files = {}
+        for role, source in sources.items():
+            files[role] = {
+                "hash": self.import_file(source, paths[role]),
+                "size": os.path.getsize(source),
+            }
+        self._write_manifest(mat_id, files)
+        return files
+
+    def copy_asset(self, mat_id: str, new_id: str, target: BlobStore | None = None) -> bool:
+        """
+        Give the files of an asset to another asset, in this library or the target library
+        Only links are added if both libraries are on the same disk
+
+        :param mat_id: Id of the stored asset
+        :type mat_id: str
+        :param new_id: Id of the asset receiving the files
+        :type new_id: str
+        :param target: Store of the target library - this one if None
+        :type target: BlobStore | None
+        :return: False if the asset is not stored
+        :rtype: bool
+        """
+        files = self.manifest(mat_id)
+        if files is None:
+            return False
+        target = target or self
+        paths = target.asset_files(new_id)
+        for role, entry in files.items():
+            if not target.link_file(entry["hash"], paths[role]):
+                # Share the blob itself with the other library
+                blob = target.blob_path(entry["hash"])
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                _replace_with_link(self.blob_path(entry["hash"]), blob)
+                target.link_file(entry["hash"], paths[role])
+        target._write_manifest(new_id, files)
+        return True
+
+    def referenced(self) -> set[str]:
+        """Return the hashes listed in any manifest"""
+        digests = set()
+        directory = self._path + MANIFEST_DIR
+        if not os.path.isdir(directory):
+            return digests
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".json"):
+                digests.update(f["hash"] for f in (self.manifest(entry.name[:-5]) or {}).values())
+        return digests
+
+    def collect_garbage(self) -> tuple[int, int]:
+        """
+        Remove blobs no manifest refers to anymore
+
+        :return: Number of removed blobs and bytes freed
+        :rtype: tuple[int, int]
+        """
+        referenced = self.referenced()
+        removed = 0
+        freed = 0
+        directory = self._path + BLOB_DIR
+        if not os.path.isdir(directory):
+            return removed, freed
+        for bucket in os.scandir(directory):
+            if not bucket.is_dir() or len(bucket.name) != 2:
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name in referenced:
+                    continue
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                except OSError:
+                    continue
+                removed += 1
+                freed += size
+        return removed, freed
@@ -7,7 +7,7 @@ from typing import Any
 from PySide6 import QtCore
 
 from matlib.prefs import prefs
-from matlib.core import database
+from matlib.core import database, events
 
 
 class Categories(QtCore.QAbstractListModel):
@@ -16,14 +16,23 @@ class Categories(QtCore.QAbstractListModel):
     Uses QtCore.QAbstractListModel as a Base Class
     """
 
-    def __init__(self, parent: QtCore.QObject | None = None) -> None:
+    def __init__(
+        self,
+        parent: QtCore.QObject | None = None,
+        connection: database.DatabaseConnector | None = None,
+    ) -> None:
         super().__init__()
 
         self.preferences = prefs.Prefs()
         self.preferences.load()
-        db = database.DatabaseConnector()
-        self._data = db.load(self.preferences.dir)
-        self._categories = self._data["categories"]
+        # Models bound to a connection stay on that library, others follow the preferences
+        self._bound = connection is not None
+        self.db = connection or database.connect(self.preferences.dir)
+        self.db.configure(self.preferences)
+        self._data = self.db.load()
+        self.db.subscribe(self._on_library_changed)
+        # Own copy - edits go through the database, which tells the other models
+        self._categories = list(self._data["categories"])
         self.CatSortRole = QtCore.Qt.ItemDataRole.UserRole  # 256
 
     def rowCount(
@@ -43,16 +52,67 @@ class Categories(QtCore.QAbstractListModel):
                 elem = elem[1:]
             return elem
 
+    def _on_library_changed(self, changes: list[events.Event]) -> None:
+        """Follow category changes made by other models or merged from another session"""
+        for change in changes:
+            if change.source is self:
+                continue
+            if change.kind in (events.RELOADED, events.CATEGORIES_CHANGED):
+                categories = list(self.db.load()["categories"])
+                if categories != self._categories:
+                    self.beginResetModel()
+                    self._categories = categories
+                    self.endResetModel()
+            elif change.kind == events.CATEGORY_ADDED and change.key not in self._categories:
+                row = len(self._categories)
+                self.beginInsertRows(QtCore.QModelIndex(), row, row)
+                self._categories.append(change.key)
+                self.endInsertRows()
+            elif change.kind == events.CATEGORY_REMOVED and change.key in self._categories:
+                row = self._categories.index(change.key)
+                self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+                del self._categories[row]
+                self.endRemoveRows()
+            elif change.kind == events.CATEGORY_RENAMED:
+                for row, current in enumerate(self._categories):
+                    if current == change.old:
+                        self._categories[row] = change.key
+                        self.dataChanged.emit(self.index(row), self.index(row))
+
+    def bind(self, connection: database.DatabaseConnector) -> None:
+        """Show the library of the given connection - kept when the preferences change"""
+        self._bound = True
+        self._set_connection(connection)
+        self.switch_model_data()
+
+    def _set_connection(self, connection: database.DatabaseConnector) -> None:
+        if connection is self.db:
+            return
+        self.db.unsubscribe(self._on_library_changed)
+        self.db = connection
+        self.db.subscribe(self._on_library_changed)
+
     def switch_model_data(self):
         self.preferences.load()
-        db = database.DatabaseConnector()
-        data = db.reload_with_path(self.preferences.dir)
-        self._categories = data["categories"]
+        if not self._bound:
+            self._set_connection(database.connect(self.preferences.dir))
+        self.db.configure(self.preferences)
+        data = self.db.reload(self)
+        if data is self._data:
+            return
+        self._data = data
+        self.beginResetModel()
+        self._categories = list(data["categories"])
+        self.endResetModel()
+
+    def asset_ids(self, cat: str) -> list[str]:
+        """Return the ids of all assets in the given category"""
+        return [str(asset["id"]) for asset in self.db.query(category=cat)]
 
     def remove_category(self, cat: str) -> None:
         """Removes the given category from the library (and also in all assets)"""
         self._categories.remove(cat)
-        self.save()
+        self.db.remove_category(cat, source=self)
 
     def rename_category(self, old: str, new: str) -> None:
         """Renames the given category in the library (and also in all assets)"""
@@ -60,23 +120,24 @@ class Categories(QtCore.QAbstractListModel):
         for count, current in enumerate(self._categories):
             if current == old:
                 self._categories[count] = new
-        self.save()
+        self.db.rename_category(old, new, source=self)
 
     def check_add_category(self, cat: str) -> None:
         """Checks if this category exists and adds it if needed"""
         if "Multiple Values..." in cat:
             return
+        added = []
         for c in cat.split(","):
             c = c.replace(" ", "")
             if c != "" and c not in self._categories:
                 self._categories.append(c)
+                added.append(c)
 
-        self.save()
+        self.db.add_categories(added, source=self)
 
     def save(self) -> None:
         """Save data to disk as json"""
-        db = database.DatabaseConnector()
         data = {}
-        data["categories"] = self._categories
-        db.set(data)
-        db.save()
+        data["categories"] = list(self._categories)
+        self.db.set(data, source=self)
+        self.db.save()
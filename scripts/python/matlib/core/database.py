@@ -1,53 +1,1330 @@
 """
-Database Handler for Matlib - Saves Data as json to disk and ensures only one active connection
+Database Handler for Matlib - Saves Data as json to disk
+Keeps one connection per library path so several libraries can be open at the same time
 """
 
-import json
-from typing import Self
+from __future__ import annotations
+
+import atexit
+import contextlib
+import lzma
+import os
+import threading
+from typing import TYPE_CHECKING
+
+from PySide6 import QtCore
+
+from matlib.core import (
+    binary_snapshot,
+    events,
+    fileio,
+    http_store,
+    journal,
+    migrations,
+    shard_store,
+    sqlite_store,
+    storage,
+    trash,
+    undo,
+    writer,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable, Iterator
+    from matlib.prefs import prefs
+
+LOCK_FILE = "library.lock"
+LIBRARY_FILE = "library.json"
+
+# Number of libraries kept in memory - switching back to one of them skips parsing
+MAX_CONNECTIONS = 4
+# Events of edits of single assets - their keys are the assets the next write compares
+_ASSET_EVENTS = (events.ASSET_ADDED, events.ASSET_CHANGED, events.ASSET_REMOVED)
+
+# Open connections keyed by library path, the most recently used one last
+_connections: dict[str, DatabaseConnector] = {}
+
+
+def find_library_file(directory: str) -> str | None:
+    """Return the library file in directory in whatever format it is stored - None if there is none"""
+    return fileio.find_format_file(directory + LIBRARY_FILE)
+
+
+def detect_backend(directory: str) -> str:
+    """
+    Return the backend the library in directory is stored with - "json", "sqlite" or "sharded"
+    Used until a connection is configured, e.g. by the headless tools and the library server.
+    A library switched between backends keeps the files of the old one, the newest files win
+    """
+    directory = os.path.join(directory, "")
+    candidates = {
+        "json": (find_library_file(directory),),
+        "sqlite": (
+            directory + sqlite_store.SQLITE_FILE,
+            directory + sqlite_store.SQLITE_FILE + "-wal",
+        ),
+        "sharded": (directory + shard_store.INDEX_FILE,),
+    }
+    found = "json"
+    newest = None
+    for backend, paths in candidates.items():
+        for path in paths:
+            signature = fileio.stat_signature(path) if path else None
+            if signature and (newest is None or signature[0] > newest):
+                found = backend
+                newest = signature[0]
+    return found
+
+
+def _connection_key(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+def read_library(directory: str, asset_dir: str = "mat/", backups: int = 0) -> dict:
+    """
+    Read the records of the library in directory without a connection, e.g. for a dry run
+    Nothing is written - no lock file, no snapshot, no migration written back and no torn
+    journal record cut off. Data of an older schema is only migrated in memory
+
+    :param directory: Library directory
+    :type directory: str
+    :param asset_dir: Directory of the sidecars of the sharded backend
+    :type asset_dir: str
+    :param backups: Number of backup generations of library.json to fall back to
+    :type backups: int
+    :return: Library data
+    :rtype: dict
+    """
+    directory = os.path.join(directory, "")
+    backend = detect_backend(directory)
+    if backend == "sqlite":
+        store = sqlite_store.SQLiteStore.read_only(directory + sqlite_store.SQLITE_FILE)
+        try:
+            data = store.read_all()
+        finally:
+            store.close()
+    elif backend == "sharded":
+        data = shard_store.ShardStore(directory, asset_dir, directory + LOCK_FILE).read_all()
+    else:
+        library_file = find_library_file(directory) or directory + LIBRARY_FILE
+        data = fileio.load_json(library_file, backups)[0]
+        journal.Journal(directory).replay(data, repair=False)
+    migrations.migrate(data)
+    return data
+
+
+def connect(path: str) -> DatabaseConnector:
+    """
+    Return the connection to the library at path - created on first use
+    Connections of libraries not used for a while are closed, unless a model is still bound to them
+
+    :param path: Library directory - with or without a trailing separator
+    :type path: str
+    :return: The connection for this library
+    :rtype: DatabaseConnector
+    """
+    # The connection joins file names onto its path
+    path = os.path.join(path, "")
+    key = _connection_key(path)
+    connection = _connections.pop(key, None)
+    if connection is None:
+        connection = DatabaseConnector(path)
+    _connections[key] = connection
+
+    idle = [k for k, c in _connections.items() if k != key and not c.in_use]
+    while len(_connections) > MAX_CONNECTIONS and idle:
+        _connections.pop(idle.pop(0)).close()
+    return connection
+
+
+def connections() -> list[DatabaseConnector]:
+    """Return all open connections, the most recently used one last"""
+    return list(_connections.values())
+
+
+def flush_all() -> None:
+    """Write pending changes of all open libraries to disk"""
+    for connection in connections():
+        connection.flush()
+
+
+def _record_keys(records: list[dict]) -> Iterator[str]:
+    """Return the ids of the assets journal records change"""
+    for record in records:
+        if record["op"] == "asset":
+            yield journal.asset_key(record["value"])
+        elif record["op"] == "remove":
+            yield str(record["id"])
+
+
+class _WriterRelay(QtCore.QObject):
+    """Delivers notifications of the writer thread on the UI thread"""
+
+    failed = QtCore.Signal()
+
+    def __init__(self, callback: Callable[[], None]) -> None:
+        super().__init__()
+        self._callback = callback
+        self.failed.connect(self._on_failed)
+
+    @QtCore.Slot()
+    def _on_failed(self) -> None:
+        self._callback()
 
 
 class DatabaseConnector:
     """
-    Database Handler for Matlib - Saves Data as json to disk and ensures only one active connection
+    Database Handler for Matlib - Saves Data as json to disk
+    One connection per library - use connect() to share it between the models
     """
 
-    _instance = None
-    _data = {}
-    _path = ""
+    def __init__(self, path: str) -> None:
+        self._path = os.path.join(path, "")
+        self._data = {}
+        self._journaled = False
+        self._journal = None
+        self._persisted = {}
+        # Encoded json of the persisted assets - a save only encodes the assets that changed
+        self._fragments = fileio.FragmentCache()
+        # Ids of the assets edited since the last write or hand-over to the writer thread,
+        # in edit order - None if unknown, e.g. after set(), then all assets are compared
+        self._changed = {}
+        # Copies handed to the writer thread by id - reused while an asset is unchanged
+        self._copies = {}
+        # The binary snapshot is behind appended changes until the next flush()
+        self._compile_pending = False
+        # The store found on disk until the preferences say otherwise
+        self._backend = detect_backend(path)
+        self._store = None
+        self._backups = 3
+        self._recovered = None
+        self._save_delay = 1000
+        self._timer = None
+        self._dirty = False
+        self._writes_requested = 0
+        self._writes_performed = 0
+        self._revision = 0
+        self._signature = None
+        self._conflicts = []
+        self._storage = None
+        self._trash = None
+        self._bus = events.ChangeBus()
+        # Assets by id for the edit methods - rebuilt when the asset list is replaced
+        self._asset_index = {}
+        self._indexed = None
+        self._undo_steps = 50
+        self._undo = None
+        # Undo records collected while a transaction is open
+        self._step = None
+        # Format of library.json - an unconfigured connection keeps the one found on disk
+        self._format = None
+        self._library_file = ""
+        self._asset_dir = "mat/"
+        self._loading = False
+        self._loaded_schema = migrations.SCHEMA_VERSION
+        self._transaction_depth = 0
+        self._background = True
+        self._writer = None
+        self._relay = None
+        # Guards the persisted state (_persisted, _fragments, _revision, _signature, the journal)
+        # shared with the writer thread
+        self._state_lock = threading.RLock()
+        self._compiled = False
 
-    def __new__(cls) -> Self:
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        else:
-            pass
-        return cls._instance
+    @property
+    def path(self) -> str:
+        """Directory of the library this connection belongs to"""
+        return self._path
+
+    @property
+    def loading(self) -> bool:
+        """True while load_chunks() is streaming the library"""
+        return self._loading
+
+    @property
+    def loaded(self) -> bool:
+        """True if the library data is in memory"""
+        return bool(self._data) and not self._loading
 
-    def load(self, path: str) -> dict:
+    @property
+    def loaded_schema(self) -> int:
+        """Schema version the library had on disk before it was migrated on the last load"""
+        return self._loaded_schema
+
+    @property
+    def trash(self) -> trash.Trash | None:
+        """Files of removed assets undo can still bring back - None until configured"""
+        return self._trash
+
+    @property
+    def in_use(self) -> bool:
+        """True while a model is subscribed to this connection"""
+        return self._bus.has_subscribers
+
+    def configure(self, preferences: prefs.Prefs) -> None:
+        """Apply the storage related preferences"""
+        self._journaled = preferences.journal
+        self._backups = preferences.backups
+        self._save_delay = preferences.save_delay
+        self._background = preferences.background_save
+        self._compiled = preferences.binary_snapshot
+        # Bound to this library - the preferences may point at another one
+        self._storage = storage.for_prefs(preferences, self._path)
+        self._trash = trash.for_prefs(preferences, self._path)
+        if preferences.undo_steps != self._undo_steps:
+            self._undo_steps = preferences.undo_steps
+            self._undo = None
+        self._asset_dir = preferences.asset_dir
+        if preferences.library_format != self._format:
+            self._format = preferences.library_format
+            if self._data and not self._store:
+                # Convert the library right away instead of on the next edit
+                self.checkpoint()
+        if preferences.backend != self._backend:
+            self.flush()
+            self._backend = preferences.backend
+            self._data = None
+
+    def load(self) -> dict:
         """
         Loads the Database from disk as json
+        Replays the journal on top if there is one
         """
-        self._path = path
         if not self._data:
-            with open(self._path + ("library.json"), encoding="utf_8") as lib_json:
-                self._data = json.load(lib_json)
+            self._recovered = None
+            if self._backend == "sqlite":
+                self._data = self._load_sqlite()
+                self._signature = self._disk_signature()
+            elif self._backend == "sharded":
+                self._data = self._load_shards()
+                self._signature = self._disk_signature()
+            elif self._backend == "http":
+                self._data = self._load_http()
+                self._signature = self._disk_signature()
+            else:
+                self._close_store()
+                with fileio.FileLock(self._path + LOCK_FILE):
+                    self._data = self._load_json()
+                    self._signature = self._disk_signature()
+            with self._state_lock:
+                self._revision = self._data.get("revision", 0)
+                self._reset_persisted(self._data)
+            self._changed = {}
+            self._copies = {}
+            self._migrate()
+            if self._compiled and not os.path.exists(self._path + binary_snapshot.SNAPSHOT_FILE):
+                # Library written before snapshots were enabled
+                with fileio.FileLock(self._path + LOCK_FILE):
+                    self._compile(self._data)
         return self._data
 
-    def set(self, assets: dict) -> None:
-        """Set Data without saving"""
+    def _migrate(self) -> None:
+        """Upgrade freshly loaded data to the current schema and write it back"""
+        self._loaded_schema = migrations.version(self._data)
+        if migrations.migrate(self._data):
+            print(
+                f"MatLib: Migrated {self._path} from schema {self._loaded_schema} to {migrations.SCHEMA_VERSION}"
+            )
+            self.checkpoint()
+
+    def load_chunks(self, chunk_size: int = 500) -> Iterator[list[dict]]:
+        """
+        Load the library and yield its assets in chunks while library.json is still being parsed
+        The data returned by load() is filled up while iterating, Categories and Tags are there from the start
+        Closing the iterator early cancels the load
+
+        :param chunk_size: Number of assets per chunk
+        :type chunk_size: int
+        :return: Iterator over the asset chunks
+        :rtype: Iterator[list[dict]]
+        """
+        if self._data or self._backend != "json":
+            assets = self.load()["assets"]
+            for start in range(0, len(assets), chunk_size):
+                yield assets[start : start + chunk_size]
+            return
+
+        self._close_store()
+        self._recovered = None
+        with fileio.FileLock(self._path + LOCK_FILE):
+            self._library_file = self._find_library_file()
+            signature = self._disk_signature()
+            try:
+                with open(self._cached(self._library_file), "rb") as library_file:
+                    raw = library_file.read()
+            except OSError:
+                raw = None
+
+        data = {}
+        complete = False
+        self._loading = True
+        try:
+            if raw is not None:
+                for chunk in fileio.iter_json_chunks(raw, "assets", chunk_size, data):
+                    if not migrations.is_current(data):
+                        # The version is stored in front of the assets - migrate on a whole load
+                        break
+                    self._data = data
+                    yield chunk
+                else:
+                    complete = True
+        except (ValueError, EOFError, lzma.LZMAError) as error:
+            print(f"MatLib: Streaming {self._library_file} failed ({error}) - loading it as a whole")
+        finally:
+            self._loading = False
+            if not complete:
+                self._data = {}
+
+        with fileio.FileLock(self._path + LOCK_FILE):
+            current = complete and self._disk_signature() == signature
+            if current:
+                self._journal = journal.Journal(self._path)
+                if self._journal.replay(data):
+                    print(
+                        f"MatLib: Replayed {self._journal.records} journal records on top of library.json"
+                    )
+                self._signature = self._disk_signature()
+        if current:
+            self._data = data
+            with self._state_lock:
+                self._revision = data.get("revision", 0)
+                self._reset_persisted(data)
+            self._changed = {}
+            self._copies = {}
+            self._migrate()
+        else:
+            # Changed on disk in the meantime or unreadable - load with backup recovery instead
+            # into a fresh dict, data may already be self._data and is handed out to the caller
+            self._data = {}
+            full = self.load()
+            data.clear()
+            data.update(full)
+            self._data = data
+        if self._dirty:
+            # Edited while loading - there is no snapshot of the pristine data to diff against
+            self.checkpoint()
+
+    def subscribe(self, callback: Callable[[list[events.Event]], None]) -> None:
+        """
+        Register a callback for changes of the library
+        made by any model or merged from another session
+        Only a weak reference is kept - bound methods of deleted models are dropped
+        """
+        self._bus.subscribe(callback)
+
+    def unsubscribe(self, callback: Callable[[list[events.Event]], None]) -> None:
+        """Remove a callback registered with subscribe()"""
+        self._bus.unsubscribe(callback)
+
+    def _notify(self, source: object = None) -> None:
+        """Tell the subscribed models that the data has been replaced as a whole"""
+        changes = [events.Event(events.RELOADED, source=source)]
+        if self._conflicts:
+            changes.append(events.Event(events.MERGE_CONFLICTS, value=self._conflicts))
+            self._conflicts = []
+        self._bus.publish(changes)
+
+    def signature(self) -> tuple:
+        """Return the version of the library on disk - changes with every write of any session"""
+        self.load()
+        return self._disk_signature()
+
+    def _disk_signature(self) -> tuple:
+        if self._store:
+            return self._store.signature()
+        return (
+            fileio.stat_signature(self._library_file),
+            fileio.stat_signature(self._path + journal.JOURNAL_FILE),
+        )
+
+    def _find_library_file(self) -> str:
+        """Return the library file to load - takes the format from it if none is configured"""
+        found = find_library_file(self._path)
+        if found and self._format is None:
+            self._format = fileio.file_format(found)
+        return found or fileio.format_path(self._path + LIBRARY_FILE, self._format or "json")
+
+    def _load_json(self) -> dict:
+        """Load library.json and replay the journal - the caller holds the lock"""
+        self._library_file = self._find_library_file()
+        data = None
+        cached = self._cached(self._library_file)
+        if cached != self._library_file:
+            try:
+                data, self._recovered = fileio.load_json(cached)
+            except (OSError, ValueError, EOFError, lzma.LZMAError):
+                data = None
+        if data is None:
+            data, self._recovered = fileio.load_json(self._library_file, self._backups)
+        if self._recovered:
+            print(
+                f"MatLib: library.json could not be read - recovered the library from {self._recovered}"
+            )
+        self._journal = journal.Journal(self._path)
+        if self._journal.replay(data):
+            print(
+                f"MatLib: Replayed {self._journal.records} journal records on top of library.json"
+            )
+        return data
+
+    def _cached(self, path: str) -> str:
+        """Return a local copy of a file on the share if the read cache is switched on"""
+        if not self._storage or not path.startswith(self._path):
+            return path
+        return self._storage.fetch(path[len(self._path) :])
+
+    def _close_store(self) -> None:
+        if self._store:
+            self._store.close()
+            self._store = None
+
+    def _load_sqlite(self) -> dict:
+        self._close_store()
+        sqlite_path = self._path + sqlite_store.SQLITE_FILE
+        if not os.path.exists(sqlite_path):
+            # First start with the SQLite backend - take over the current json data
+            self._store = sqlite_store.import_json(
+                find_library_file(self._path) or self._path + LIBRARY_FILE,
+                sqlite_path,
+            )
+        else:
+            self._store = sqlite_store.SQLiteStore(sqlite_path)
+        return self._store.read_all()
+
+    def _load_shards(self) -> dict:
+        index_path = self._path + shard_store.INDEX_FILE
+        if isinstance(self._store, shard_store.ShardStore) and self._store.path == index_path:
+            # Same library - only the sidecars changed since the last read are parsed
+            return self._store.read_all()
+        self._close_store()
+        lock_path = self._path + LOCK_FILE
+        if not os.path.exists(index_path):
+            # First start with the sharded backend - split up the current json data
+            self._store = shard_store.import_json(
+                find_library_file(self._path) or self._path + LIBRARY_FILE,
+                self._path,
+                self._asset_dir,
+                lock_path,
+            )
+        else:
+            self._store = shard_store.ShardStore(self._path, self._asset_dir, lock_path)
+        return self._store.read_all()
+
+    def _load_http(self) -> dict:
+        client = self._storage
+        if not isinstance(client, storage.HttpStorage):
+            raise ValueError("MatLib: The http backend needs a server_url in the preferences")
+        if isinstance(self._store, http_store.HttpStore) and self._store.path == client.url:
+            # Same server - the library is only transferred if it changed
+            return self._store.read_all()
+        self._close_store()
+        os.makedirs(self._path, exist_ok=True)
+        self._store = http_store.HttpStore(client)
+        if self._store.is_empty():
+            # First start with the server - upload the library of the local directory
+            library_file = find_library_file(self._path)
+            if library_file:
+                self._store.write_all(fileio.load_json(library_file, self._backups)[0])
+        return self._store.read_all()
+
+    def query(
+        self,
+        category: str | None = None,
+        tag: str | None = None,
+        renderer: str | None = None,
+        favorite: bool | None = None,
+        name: str | None = None,
+    ) -> list[dict]:
+        """
+        Return the assets matching all given filters
+        Uses the indexes of the SQLite backend if active, otherwise scans the loaded data
+        """
+        if isinstance(self._store, sqlite_store.SQLiteStore):
+            return self._store.query(category, tag, renderer, favorite, name)
+        if not self._data:
+            return []
+
+        found = []
+        for asset in self._data["assets"]:
+            if category is not None and category.lower() not in (
+                c.lower() for c in asset["categories"]
+            ):
+                continue
+            if tag is not None and tag.lower() not in (
+                t.lower() for t in asset["tags"]
+            ):
+                continue
+            if renderer is not None and renderer.lower() not in asset["renderer"].lower():
+                continue
+            if favorite is not None and bool(asset["favorite"]) != favorite:
+                continue
+            if name is not None and name.lower() not in asset["name"].lower():
+                continue
+            found.append(asset)
+        return found
+
+    def set(self, assets: dict, source: object = None) -> None:
+        """Set Data without saving
+        Prefer the edit methods below - the other models have to compare all assets after set()"""
+        # Anything may have changed - the next write compares all assets
+        self._changed = None
         if "categories" in assets.keys():
             self._data["categories"] = assets["categories"]
         if "tags" in assets.keys():
             self._data["tags"] = assets["tags"]
         if "assets" in assets.keys():
-            self._data["assets"] = assets["assets"]
+            if self._loading:
+                # Edited mid-load - load_chunks() keeps appending to this list
+                self._data["assets"][:] = assets["assets"]
+            else:
+                self._data["assets"] = assets["assets"]
+        self._notify(source)
+
+    def _asset(self, mat_id: str) -> dict | None:
+        assets = self._data["assets"]
+        if self._indexed is not assets or len(self._asset_index) != len(assets):
+            self._asset_index = {journal.asset_key(a): a for a in assets}
+            self._indexed = assets
+        return self._asset_index.get(str(mat_id))
+
+    def _mark(self, keys: Iterable[str]) -> None:
+        """Remember the assets an edit has changed - only those are compared on the next write"""
+        if self._changed is not None:
+            for key in keys:
+                self._changed[key] = None
+
+    def _publish(self, changes: list[events.Event]) -> None:
+        """Deliver events for edits of the loaded data and request a save"""
+        if changes:
+            self._mark(c.key for c in changes if c.kind in _ASSET_EVENTS)
+            self._bus.publish(changes)
+            self._request_save()
+
+    def _undo_journal(self) -> undo.UndoJournal | None:
+        if self._undo_steps <= 0:
+            return None
+        if self._undo is None:
+            self._undo = undo.UndoJournal(undo.undo_path(self._path), self._undo_steps)
+        return self._undo
+
+    def _record(self, label: str, undo_records: list[dict], redo_records: list[dict]) -> None:
+        """Keep the records undoing an edit - a transaction becomes a single step"""
+        if self._step is not None:
+            self._step["labels"].append(label)
+            self._step["undo"][:0] = undo_records
+            self._step["redo"].extend(redo_records)
+            return
+        undo_journal = self._undo_journal()
+        if undo_journal:
+            undo_journal.push(label, undo_records, redo_records)
+        self._expire_trash()
+
+    def _expire_trash(self) -> None:
+        """Delete the files of removed assets no undo or redo step can bring back anymore"""
+        if self._trash is None or not self._trash.ids:
+            return
+        undo_journal = self._undo_journal()
+        self._trash.purge(undo_journal.asset_ids() if undo_journal else set())
+
+    @property
+    def undo_label(self) -> str | None:
+        """Description of the edit undo() would revert - None if there is nothing to undo"""
+        undo_journal = self._undo_journal()
+        return undo_journal.undo_label if undo_journal else None
+
+    @property
+    def redo_label(self) -> str | None:
+        """Description of the edit redo() would apply again - None if there is nothing to redo"""
+        undo_journal = self._undo_journal()
+        return undo_journal.redo_label if undo_journal else None
+
+    def undo(self) -> str | None:
+        """
+        Revert the last edit of this user
+        Only the records of the edit are applied, the models update the affected rows
+
+        :return: Description of the reverted edit - None if there was nothing to undo
+        :rtype: str | None
+        """
+        undo_journal = self._undo_journal()
+        step = undo_journal.undo() if undo_journal else None
+        if step is None:
+            return None
+        self._apply_records(step["undo"])
+        return step["label"]
+
+    def redo(self) -> str | None:
+        """
+        Apply the last reverted edit again
+
+        :return: Description of the edit - None if there was nothing to redo
+        :rtype: str | None
+        """
+        undo_journal = self._undo_journal()
+        step = undo_journal.redo() if undo_journal else None
+        if step is None:
+            return None
+        self._apply_records(step["redo"])
+        return step["label"]
+
+    def _apply_records(self, records: list[dict]) -> None:
+        """
+        Apply the records of an undo step to the loaded data and publish the matching events
+        Field and list records only revert what the step changed - edits merged from other
+        sessions in the meantime stay. The files of removed and restored assets follow
+        """
+        data = self.load()
+        # Asset as the records so far have left it - None once removed
+        current = {}
+        lists = {}
+        resolved = []
+        for record in records:
+            op = record["op"]
+            if op in ("categories", "tags"):
+                value = list(record["value"])
+                theirs = lists.get(op, data[op])
+                if "base" in record and theirs != record["base"]:
+                    # Changed by another session since - only revert the entries of the step
+                    value = journal.merge_list(record["base"], value, theirs)
+                lists[op] = value
+                resolved.append({"op": op, "value": value})
+            elif op == "fields":
+                key = str(record["id"])
+                asset = current[key] if key in current else self._asset(key)
+                if asset is None:
+                    # Removed by another session in the meantime
+                    continue
+                current[key] = journal.apply_fields(asset, record)
+                resolved.append({"op": "asset", "value": current[key]})
+            elif op == "asset":
+                # Copies - the steps on the undo stacks must not change with later edits of the data
+                value = journal.copy_asset(record["value"])
+                current[journal.asset_key(value)] = value
+                resolved.append({"op": "asset", "value": value})
+            elif op == "remove":
+                current[str(record["id"])] = None
+                resolved.append(record)
+        existed = {key: self._asset(key) is not None for key in current}
+        journal.apply(data, resolved)
+        # Records replace whole asset dicts
+        self._indexed = None
+
+        changes = []
+        for op, value in lists.items():
+            kind = events.CATEGORIES_CHANGED if op == "categories" else events.TAGS_CHANGED
+            changes.append(events.Event(kind, value=value))
+        for key, before in existed.items():
+            asset = self._asset(key)
+            if asset is None:
+                if before:
+                    changes.append(events.Event(events.ASSET_REMOVED, key))
+                    if self._trash:
+                        self._trash.move_asset(key)
+            elif before:
+                changes.append(events.Event(events.ASSET_CHANGED, key, asset))
+            else:
+                if self._trash:
+                    self._trash.restore_asset(key)
+                changes.append(events.Event(events.ASSET_ADDED, key, asset))
+        self._publish(changes)
+
+    @staticmethod
+    def _list_records(op: str, before: list, after: list) -> tuple[list[dict], list[dict]]:
+        """Return the records undoing and redoing a change of the Categories or Tags"""
+        return (
+            [{"op": op, "value": list(before), "base": list(after)}],
+            [{"op": op, "value": list(after), "base": list(before)}],
+        )
+
+    def add_asset(self, asset: dict, source: object = None) -> None:
+        """Add an asset and notify the other models"""
+        asset = journal.copy_asset(asset)
+        self.load()["assets"].append(asset)
+        key = journal.asset_key(asset)
+        self._record(
+            f"Add {asset.get('name', key)}",
+            [{"op": "remove", "id": key}],
+            [{"op": "asset", "value": journal.copy_asset(asset)}],
+        )
+        self._publish([events.Event(events.ASSET_ADDED, key, asset, source=source)])
+
+    def update_asset(self, asset: dict, source: object = None) -> None:
+        """Replace the stored record of an asset and notify the other models"""
+        self.load()
+        current = self._asset(asset["id"])
+        if current is None:
+            self.add_asset(asset, source)
+            return
+        if current == asset:
+            return
+        undo_record, redo_record = journal.field_records(current, asset)
+        self._record(f"Change {asset.get('name', asset['id'])}", [undo_record], [redo_record])
+        # In place - keeps the position in the asset list
+        current.clear()
+        current.update(journal.copy_asset(asset))
+        self._publish(
+            [events.Event(events.ASSET_CHANGED, journal.asset_key(current), current, source=source)]
+        )
+
+    def remove_asset(self, mat_id: str, source: object = None) -> None:
+        """Remove an asset from the library and notify the other models"""
+        key = str(mat_id)
+        assets = self.load()["assets"]
+        current = self._asset(key)
+        if current is None:
+            return
+        self._record(
+            f"Remove {current.get('name', key)}",
+            [{"op": "asset", "value": journal.copy_asset(current)}],
+            [{"op": "remove", "id": key}],
+        )
+        assets[:] = [a for a in assets if journal.asset_key(a) != key]
+        self._publish([events.Event(events.ASSET_REMOVED, key, source=source)])
+
+    def add_categories(self, names: list[str], source: object = None) -> None:
+        """Add the categories not in the library yet and notify the other models"""
+        categories = self.load().setdefault("categories", [])
+        before = list(categories)
+        added = []
+        for name in names:
+            if name and name not in categories:
+                categories.append(name)
+                added.append(events.Event(events.CATEGORY_ADDED, name, source=source))
+        if added:
+            undo_records, redo_records = self._list_records("categories", before, categories)
+            self._record(f"Add category {added[0].key}", undo_records, redo_records)
+        self._publish(added)
+
+    def remove_category(self, name: str, source: object = None) -> None:
+        """Remove a category from the library and all its assets and notify the other models"""
+        data = self.load()
+        if name not in data["categories"]:
+            return
+        before = list(data["categories"])
+        data["categories"][:] = [c for c in data["categories"] if c != name]
+        undo_records, redo_records = self._list_records("categories", before, data["categories"])
+        for asset in data["assets"]:
+            if name in asset["categories"]:
+                old = journal.copy_asset(asset)
+                asset["categories"] = [c for c in asset["categories"] if c != name]
+                undo_record, redo_record = journal.field_records(old, asset)
+                undo_records.append(undo_record)
+                redo_records.append(redo_record)
+        self._mark(r["id"] for r in redo_records if r["op"] == "fields")
+        self._record(f"Remove category {name}", undo_records, redo_records)
+        self._publish([events.Event(events.CATEGORY_REMOVED, name, source=source)])
+
+    def rename_category(self, old: str, new: str, source: object = None) -> None:
+        """Rename a category in the library and all its assets and notify the other models"""
+        data = self.load()
+        if old not in data["categories"]:
+            return
+        before = list(data["categories"])
+        data["categories"][:] = [new if c == old else c for c in data["categories"]]
+        undo_records, redo_records = self._list_records("categories", before, data["categories"])
+        for asset in data["assets"]:
+            if old in asset["categories"]:
+                previous = journal.copy_asset(asset)
+                asset["categories"] = [new if c == old else c for c in asset["categories"]]
+                undo_record, redo_record = journal.field_records(previous, asset)
+                undo_records.append(undo_record)
+                redo_records.append(redo_record)
+        self._mark(r["id"] for r in redo_records if r["op"] == "fields")
+        self._record(f"Rename category {old}", undo_records, redo_records)
+        self._publish([events.Event(events.CATEGORY_RENAMED, new, old=old, source=source)])
+
+    def add_tags(self, names: list[str], source: object = None) -> None:
+        """Add the tags not in the library yet and notify the other models"""
+        tags = self.load().setdefault("tags", [])
+        before = list(tags)
+        added = []
+        for name in names:
+            if name and name not in tags:
+                tags.append(name)
+                added.append(events.Event(events.TAG_ADDED, name, source=source))
+        if added:
+            self._record(f"Add tag {added[0].key}", *self._list_records("tags", before, tags))
+        self._publish(added)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Group changes into one write - saves inside the block are deferred until the outermost block ends
+        An exception rolls the data back to the state at the start and notifies the subscribed models
+        """
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        backup = self._copy_data()
+        dirty = self._dirty
+        self._transaction_depth = 1
+        # The models get all events of the transaction in one list, undo reverts it in one step
+        self._bus.hold()
+        self._step = {"labels": [], "undo": [], "redo": []}
+        try:
+            yield
+        except BaseException:
+            self._transaction_depth = 0
+            self._step = None
+            # Update in place - the models hold a reference to this dict
+            self._data.clear()
+            self._data.update(backup)
+            self._changed = None
+            self._dirty = dirty
+            self._bus.release(discard=True)
+            self._notify()
+            raise
+        self._transaction_depth = 0
+        step, self._step = self._step, None
+        if step["labels"]:
+            label = step["labels"][0]
+            if len(step["labels"]) > 1:
+                label += f" and {len(step['labels']) - 1} more edits"
+            self._record(label, step["undo"], step["redo"])
+        self._bus.release()
+        if self._dirty:
+            self._request_save()
+
+    @property
+    def in_transaction(self) -> bool:
+        """True inside a transaction() block"""
+        return self._transaction_depth > 0
 
     def save(self) -> None:
-        """Save Data to Disk"""
+        """Request a save to disk
+        Requests are coalesced and written once the library has been quiet for save_delay ms
+        The data may have been edited in place - the write compares all assets"""
+        if self._data:
+            self._changed = None
+        self._request_save()
+
+    def _request_save(self) -> None:
+        """save() for the edit methods - they have marked the assets they changed"""
+        if not self._data:
+            return
+        if self._transaction_depth:
+            self._dirty = True
+            return
+        self._writes_requested += 1
+        self._dirty = True
+        if self._save_delay <= 0 or QtCore.QCoreApplication.instance() is None:
+            self._submit()
+            self._wait_writer()
+            return
+        if self._timer is None:
+            self._timer = QtCore.QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._submit)
+            atexit.register(self._flush_on_exit)
+        self._timer.start(self._save_delay)
+
+    def flush(self) -> None:
+        """Write pending changes to disk now and wait for the writer thread
+        Call before closing the panel, switching the library or reading the files directly
+        Also brings the binary snapshot up to date"""
+        self._submit()
+        self._wait_writer()
+        if self._compile_pending and self._data:
+            self._compile_current()
+
+    def _compile_current(self) -> None:
+        """Compile the binary snapshot of the written data - skipped if another session wrote"""
+        lock = contextlib.nullcontext() if self._store else fileio.FileLock(self._path + LOCK_FILE)
+        with self._state_lock, lock:
+            if self._disk_signature() == self._signature:
+                self._compile(self._data)
+
+    def _submit(self) -> None:
+        """Hand the pending changes to the writer thread - or write them right away without one"""
+        if self._timer is not None:
+            self._timer.stop()
+        if not self._dirty or not self._data or self._loading or self._transaction_depth:
+            return
+        if self._store or not self._background or QtCore.QCoreApplication.instance() is None:
+            # SQLite connections are bound to their thread, headless sessions have no event loop
+            self._write_now()
+            return
+        if self._writer is None:
+            self._relay = _WriterRelay(self._on_write_failed)
+            self._writer = writer.BackgroundWriter(
+                self._write_snapshot, failed=self._relay.failed.emit
+            )
+        self._dirty = False
+        self._writer.submit(*self._snapshot_data())
+
+    def _snapshot_data(self) -> tuple[dict, dict[str, dict | None] | None]:
+        """
+        Copy the data for the writer thread - only the assets edited since the last snapshot
+        are copied again, the others are the copies of the previous snapshot
+
+        :return: The copy and the copies of the edited assets by id (None if removed),
+            None if all assets have to be compared
+        :rtype: tuple[dict, dict[str, dict | None] | None]
+        """
+        changed, self._changed = self._changed, {}
+        previous = {} if changed is None else self._copies
+        copies = {}
+        assets = []
+        for asset in self._data.get("assets", []):
+            key = journal.asset_key(asset)
+            copy = None if changed and key in changed else previous.get(key)
+            if copy is None:
+                copy = journal.copy_asset(asset)
+            copies[key] = copy
+            assets.append(copy)
+        self._copies = copies
+        snapshot = {
+            key: assets
+            if key == "assets"
+            else list(value) if isinstance(value, list) else value
+            for key, value in self._data.items()
+        }
+        if changed is None:
+            return snapshot, None
+        return snapshot, {key: copies.get(key) for key in changed}
+
+    def _take_changes(self) -> dict[str, dict | None] | None:
+        """Return the assets edited since the last write by id (None if removed) and start over"""
+        changed, self._changed = self._changed, {}
+        # The copies of the writer thread do not know about this write
+        self._copies = {}
+        if changed is None:
+            return None
+        return {key: self._asset(key) for key in changed}
+
+    def _copy_data(self) -> dict:
+        """Copy the data deep enough to be encoded while the models keep editing"""
+        return {
+            key: [journal.copy_asset(a) for a in value]
+            if key == "assets"
+            else list(value) if isinstance(value, list) else value
+            for key, value in self._data.items()
+        }
+
+    def _wait_writer(self) -> None:
+        """Wait until the writer thread is idle - required before touching the persisted state"""
+        if self._writer is None:
+            return
+        try:
+            self._writer.wait()
+        except writer.Aborted:
+            # Another session has written - the handed back changes are merged with theirs
+            self._dirty = True
+            self._changed = None
+            self._write_now()
+        except BaseException:
+            # Not written - the next save or flush() writes everything again
+            self._dirty = True
+            self._changed = None
+            raise
+
+    def _write_now(self) -> None:
+        if not self._dirty or not self._data:
+            return
+        self._dirty = False
+        self._writes_performed += 1
+        try:
+            with self._state_lock:
+                self._write()
+        except BaseException:
+            self._dirty = True
+            self._changed = None
+            raise
+
+    def _write_snapshot(self, snapshot: dict, changed: dict[str, dict | None] | None) -> None:
+        """
+        Write a snapshot on the writer thread
+        If another session has written in the meantime the write is handed back to the UI thread,
+        which merges the changes into the data the models hold
+        """
+        with self._state_lock, fileio.FileLock(self._path + LOCK_FILE):
+            if self._disk_signature() != self._signature:
+                raise writer.Aborted()
+            rewritten = self._write_records(snapshot, changed)
+            self._signature = self._disk_signature()
+            if rewritten:
+                self._compile(snapshot)
+            self._writes_performed += 1
+
+    def _on_write_failed(self) -> None:
+        """A write on the writer thread failed or was handed back - picks up its error"""
+        try:
+            self._wait_writer()
+        except Exception:
+            # Reported by the writer thread - the data is written again with the next save
+            pass
+
+    def _flush_on_exit(self) -> None:
+        # Qt might already be torn down at this point
+        self._timer = None
+        self.flush()
+
+    def _write(self) -> None:
+        """Write Data to Disk
+        In journaled mode only the changes are appended to the journal"""
+        edited = self._take_changes()
+        if self._store:
+            changed = self._disk_signature() != self._signature
+            records = journal.diff(self._persisted, self._data, edited)
+            if records:
+                self._store.apply(records)
+                self._update_persisted(records)
+                # Compiled on flush() - the stores only write the changed assets
+                self._compile_pending = True
+            if changed:
+                # Another session has written in the meantime - our records are in, pick up theirs
+                self._data.clear()
+                self._data.update(self._store.read_all())
+                self._reset_persisted(self._data)
+                self._compile_pending = True
+            self._signature = self._disk_signature()
+            if changed:
+                self._notify()
+            return
+
+        with fileio.FileLock(self._path + LOCK_FILE):
+            merged = self._merge_from_disk()
+            # After a merge the persisted state is the one on disk - compare everything
+            rewritten = self._write_records(self._data, None if merged else edited)
+            self._signature = self._disk_signature()
+            if rewritten:
+                self._compile(self._data)
+
+        if merged:
+            self._notify()
+
+    def _write_records(self, data: dict, changed: dict[str, dict | None] | None = None) -> bool:
+        """
+        Write the changes in data since the last write - the caller holds the lock
+
+        :param data: Data to write
+        :type data: dict
+        :param changed: The assets edited since the last write, see journal.diff()
+        :type changed: dict[str, dict | None] | None
+        :return: True if library.json has been rewritten as a whole
+        :rtype: bool
+        """
+        records = journal.diff(self._persisted, data, changed)
+        if not records:
+            return False
+        self._revision += 1
+        data["revision"] = self._revision
+        if self._journaled:
+            self._journal.append(records + [{"op": "revision", "value": self._revision}])
+            self._update_persisted(records)
+            if self._journal.needs_checkpoint():
+                self._checkpoint(data, [])
+                return True
+            # Compiled on flush() or the next checkpoint - appending stays independent of the size
+            self._compile_pending = True
+            return False
+        self._checkpoint(data, records)
+        return True
+
+    def _merge_from_disk(self) -> bool:
+        """
+        Three-way merge of changes another session has written since our last load or write
+        against the state we loaded. Only fields both sessions changed conflict - our value wins
+        and the subscribers get a MERGE_CONFLICTS event
+        The caller holds the lock
+
+        :return: True if data from disk has been merged in
+        :rtype: bool
+        """
+        if self._disk_signature() == self._signature:
+            return False
+        theirs = self._load_json()
+        if theirs.get("revision", 0) == self._revision:
+            return False
+
+        print(
+            f"MatLib: Library revision {theirs.get('revision', 0)} on disk is newer than {self._revision} - merging changes"
+        )
+        base = journal.snapshot(theirs)
+        conflicts = []
+        merged = journal.merge(self._persisted, self._data, theirs, conflicts)
+        for conflict in conflicts:
+            if conflict["field"] is None:
+                print(
+                    f"MatLib: Conflict - {conflict['name']} ({conflict['id']}) has been removed "
+                    "in one session and changed in the other"
+                )
+            else:
+                print(
+                    f"MatLib: Conflict - {conflict['field']} of {conflict['name']} "
+                    f"({conflict['id']}) changed in both sessions, "
+                    f"keeping {conflict['ours']!r} over {conflict['theirs']!r}"
+                )
+        self._conflicts.extend(conflicts)
+        # Update in place - the models hold a reference to this dict
+        self._data.clear()
+        self._data.update(merged)
+        self._persisted = base
+        self._fragments.clear()
+        self._revision = merged.get("revision", 0)
+        return True
+
+    def checkpoint(self) -> None:
+        """Write the full library.json and fold the journal into it"""
         if not self._data:
             return
-        with open(self._path + ("library.json"), "w", encoding="utf-8") as lib_json:
-            json.dump(self._data, lib_json, indent=4)
+        self._wait_writer()
+        self._dirty = False
+        # Everything is written - edits are tracked from here on
+        self._changed = {}
+        self._copies = {}
+        if self._store:
+            with self._state_lock:
+                self._store.write_all(self._data)
+                self._reset_persisted(self._data)
+                self._signature = self._disk_signature()
+                self._compile(self._data)
+            return
+        with self._state_lock, fileio.FileLock(self._path + LOCK_FILE):
+            merged = self._merge_from_disk()
+            self._revision += 1
+            self._data["revision"] = self._revision
+            self._checkpoint()
+            self._signature = self._disk_signature()
+            self._compile(self._data)
+        if merged:
+            self._notify()
 
-    def reload_with_path(self, path: str) -> str:
+    def _checkpoint(self, data: dict | None = None, records: list[dict] | None = None) -> None:
+        """
+        Write the full library.json - the caller holds the lock
+        Only assets changed since the last write are encoded, see fileio.FragmentCache
+
+        :param data: Data to write - the loaded data if None
+        :type data: dict | None
+        :param records: Changes in data since the last write if already known
+        :type records: list[dict] | None
+        """
+        if data is None:
+            data = self._data
+        if not self._persisted:
+            self._fragments.clear()
+        else:
+            if records is None:
+                records = journal.diff(self._persisted, data)
+            # The persisted state only follows once the file is written - a failed write
+            # leaves the records to the next one
+            self._fragments.invalidate(_record_keys(records))
+        file_format = self._format or "json"
+        target = fileio.format_path(self._path + LIBRARY_FILE, file_format)
+        previous = self._library_file
+        if previous and previous != target and os.path.exists(previous):
+            # Switching the format - the file in the old format becomes the newest backup,
+            # backups are decoded by their content
+            fileio.rotate_backups(target, self._backups, previous)
+        fileio.atomic_write(target, self._fragments.encode(data, file_format), self._backups)
+        # Switching the format must not leave an older file behind to be picked up
+        fileio.remove_other_formats(self._path + LIBRARY_FILE, target)
+        self._library_file = target
+        if self._persisted:
+            journal.update_snapshot(self._persisted, records)
+        else:
+            self._persisted = journal.snapshot(data)
+        if self._journal:
+            self._journal.clear()
+
+    def _reset_persisted(self, data: dict) -> None:
+        """Take data as the state on disk - the encoded assets are dropped"""
+        with self._state_lock:
+            self._persisted = journal.snapshot(data)
+            self._fragments.clear()
+
+    def _update_persisted(self, records: list[dict]) -> None:
+        """Apply records written to disk to the persisted state"""
+        journal.update_snapshot(self._persisted, records)
+        self._fragments.invalidate(_record_keys(records))
+
+    def _compile(self, data: dict) -> None:
+        """Regenerate the binary snapshot for farm and batch sessions - the caller holds the lock"""
+        self._compile_pending = False
+        if not self._compiled or isinstance(self._store, http_store.HttpStore):
+            # The local directory of the http backend is only a working copy
+            return
+        if isinstance(self._store, sqlite_store.SQLiteStore):
+            sources = [sqlite_store.SQLITE_FILE, sqlite_store.SQLITE_FILE + "-wal"]
+        elif self._store:
+            sources = [shard_store.INDEX_FILE, self._asset_dir]
+        else:
+            sources = [os.path.basename(self._library_file), journal.JOURNAL_FILE]
+        try:
+            binary_snapshot.write(self._path, data, sources)
+        except OSError as error:
+            # The library itself is written - farm sessions fall back to parsing it
+            print(f"MatLib: Writing {binary_snapshot.SNAPSHOT_FILE} failed - {error}")
+
+    @property
+    def recovered(self) -> str | None:
+        """Path of the backup generation the library was recovered from on the last load"""
+        return self._recovered
+
+    @property
+    def dirty(self) -> bool:
+        """True if there are changes that have not been written yet"""
+        return self._dirty
+
+    @property
+    def writes_requested(self) -> int:
+        """Number of saves requested by the models"""
+        return self._writes_requested
+
+    @property
+    def writes_performed(self) -> int:
+        """Number of saves that actually went to disk"""
+        return self._writes_performed
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of snapshots waiting for or being written by the writer thread"""
+        return self._writer.queue_depth if self._writer else 0
+
+    @property
+    def writes_superseded(self) -> int:
+        """Number of snapshots replaced by a newer one before the writer thread got to them"""
+        return self._writer.superseded if self._writer else 0
+
+    @property
+    def write_latency(self) -> float:
+        """Seconds the last write on the writer thread took"""
+        return self._writer.last_latency if self._writer else 0.0
+
+    @property
+    def max_write_latency(self) -> float:
+        """Seconds the slowest write on the writer thread took"""
+        return self._writer.max_latency if self._writer else 0.0
+
+    def reload(self, source: object = None) -> dict:
+        """
+        Reload the library and tell the subscribed models
+        Skipped if nothing has changed on disk since the last load or write
+
+        :param source: The caller - it does not receive the event and updates itself
+        :type source: object
+        :return: The library data
+        :rtype: dict
+        """
+        self.flush()
+        if self._loading or (self._data and self._disk_signature() == self._signature):
+            return self._data
         self._data = None
-        return self.load(path)
+        data = self.load()
+        self._notify(source)
+        return data
+
+    def close(self) -> None:
+        """Write pending changes and release the loaded data"""
+        self.flush()
+        if self._timer is not None:
+            atexit.unregister(self._flush_on_exit)
+            self._timer = None
+        self._close_store()
+        self._data = {}
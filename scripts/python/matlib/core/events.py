@@ -0,0 +1,121 @@
+"""
+Change Notifications for the MatLib Database
+The DatabaseConnector publishes a typed event for every change of the library data,
+all models showing that library update only what the event touches
+"""
+
+from __future__ import annotations
+
+import weakref
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+ASSET_ADDED = "asset_added"
+ASSET_REMOVED = "asset_removed"
+ASSET_CHANGED = "asset_changed"
+CATEGORY_ADDED = "category_added"
+CATEGORY_REMOVED = "category_removed"
+CATEGORY_RENAMED = "category_renamed"
+TAG_ADDED = "tag_added"
+# The list of categories or tags has been replaced, e.g. by undo - value is the new list
+CATEGORIES_CHANGED = "categories_changed"
+TAGS_CHANGED = "tags_changed"
+# The data has been replaced as a whole - merged from another session, rolled back or set()
+RELOADED = "reloaded"
+# Both sessions changed the same fields - value is the list of conflicts, see journal.merge()
+MERGE_CONFLICTS = "merge_conflicts"
+
+
+class Event:
+    """
+    A single change of the library data
+    key is the asset id for asset events and the name for category and tag events
+    """
+
+    __slots__ = ("kind", "key", "value", "old", "source")
+
+    def __init__(
+        self,
+        kind: str,
+        key: str = "",
+        value: Any = None,
+        old: str | None = None,
+        source: object = None,
+    ) -> None:
+        self.kind = kind
+        self.key = key
+        # Asset dict for added and changed assets
+        self.value = value
+        # Previous name of a renamed category
+        self.old = old
+        # The model that made the change - it has applied the change itself already
+        self.source = source
+
+    def __repr__(self) -> str:
+        return f"Event({self.kind!r}, {self.key!r})"
+
+
+class ChangeBus:
+    """
+    Delivers events of one library to all subscribed models
+    Events published while the bus is held are delivered together once it is released
+    """
+
+    def __init__(self) -> None:
+        self._subscribers = []
+        self._held = 0
+        self._queue = []
+
+    def subscribe(self, callback: Callable[[list[Event]], None]) -> None:
+        """
+        Register a callback receiving a list of events
+        Only a weak reference is kept - bound methods of deleted models are dropped
+        """
+        self._subscribers.append(weakref.WeakMethod(callback))
+
+    def unsubscribe(self, callback: Callable[[list[Event]], None]) -> None:
+        """Remove a callback registered with subscribe()"""
+        self._subscribers[:] = [
+            ref for ref in self._subscribers if ref() is not None and ref() != callback
+        ]
+
+    @property
+    def has_subscribers(self) -> bool:
+        """True while a subscribed model is alive"""
+        return any(ref() is not None for ref in self._subscribers)
+
+    def publish(self, changes: list[Event]) -> None:
+        """Deliver the events now - or queue them while the bus is held"""
+        if not changes:
+            return
+        if self._held:
+            self._queue.extend(changes)
+            return
+        alive = []
+        for ref in list(self._subscribers):
+            callback = ref()
+            if callback is not None:
+                alive.append(ref)
+                callback(changes)
+        self._subscribers[:] = alive
+
+    def hold(self) -> None:
+        """Queue events until release() - e.g. for the duration of a transaction"""
+        self._held += 1
+
+    def release(self, discard: bool = False) -> None:
+        """
+        End a hold() and deliver the queued events in one list once the outermost hold ends
+
+        :param discard: Drop the queued events instead, e.g. after a rollback
+        :type discard: bool
+        """
+        self._held -= 1
+        if discard:
+            self._queue = []
+        if self._held:
+            return
+        queued, self._queue = self._queue, []
+        self.publish(queued)
@@ -0,0 +1,481 @@
+"""
+Crash-safe File Helpers for the MatLib Database
+Files are written to a temp file, synced and swapped into place with rotating backups
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Iterable, Iterator
+from typing import TYPE_CHECKING
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+
+# On-disk formats for json data: file suffix and whether whitespace is stripped
+FORMATS = {
+    "json": "",
+    "compact": "",
+    "gzip": ".gz",
+    "xz": ".xz",
+}
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+
+def format_path(path: str, file_format: str) -> str:
+    """Return the file name for path in the given format, e.g. library.json.gz"""
+    return path + FORMATS[file_format]
+
+
+def file_format(path: str) -> str:
+    """Return the format of a file from its suffix - "json" for plain files"""
+    for name, suffix in FORMATS.items():
+        if suffix and path.endswith(suffix):
+            return name
+    return "json"
+
+
+def encode_json(data: dict, file_format: str = "json") -> bytes:
+    """
+    Encode data for the given on-disk format
+
+    :param data: Data to encode
+    :type data: dict
+    :param file_format: One of FORMATS - "json" is indented for readability, all others are compact
+    :type file_format: str
+    :return: Encoded and compressed data
+    :rtype: bytes
+    """
+    if file_format == "json":
+        return json.dumps(data, indent=4).encode("utf-8")
+    return _compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), file_format)
+
+
+def _compress(raw: bytes, file_format: str) -> bytes:
+    if file_format == "gzip":
+        return gzip.compress(raw, compresslevel=6, mtime=0)
+    if file_format == "xz":
+        return lzma.compress(raw, preset=1)
+    return raw
+
+
+class FragmentCache:
+    """
+    Encoded json of every asset of a library keyed by asset id
+    encode() splices the cached fragments and only encodes the assets invalidated since the
+    last call - the output is byte for byte the same as encode_json()
+    """
+
+    def __init__(self) -> None:
+        self._format = None
+        self._fragments = {}
+        self.encoded = 0
+
+    def __len__(self) -> int:
+        return len(self._fragments)
+
+    def clear(self) -> None:
+        self._fragments = {}
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        """Drop the fragments of assets that have changed or been removed"""
+        for key in keys:
+            self._fragments.pop(key, None)
+
+    def _encode_asset(self, asset: dict) -> bytes:
+        if self._format == "json":
+            # The indentation of an asset inside the "assets" list of library.json
+            return ("        " + json.dumps(asset, indent=4).replace("\n", "\n        ")).encode(
+                "utf-8"
+            )
+        return json.dumps(asset, separators=(",", ":")).encode("utf-8")
+
+    def encode(self, data: dict, file_format: str = "json") -> bytes:
+        """
+        Encode data for the given on-disk format like encode_json()
+
+        :param data: Library data - the assets must be keyed by a unique "id"
+        :type data: dict
+        :param file_format: One of FORMATS
+        :type file_format: str
+        :return: Encoded and compressed data
+        :rtype: bytes
+        """
+        if file_format != self._format:
+            self._format = file_format
+            self._fragments = {}
+        fragments = self._fragments
+        encoded = []
+        seen = set()
+        for asset in data.get("assets", []):
+            key = str(asset["id"])
+            fragment = fragments.get(key)
+            if fragment is None or key in seen:
+                fragment = self._encode_asset(asset)
+                self.encoded += 1
+                if key not in seen:
+                    fragments[key] = fragment
+            seen.add(key)
+            encoded.append(fragment)
+        if len(fragments) > len(seen):
+            self._fragments = {k: v for k, v in fragments.items() if k in seen}
+
+        indent = file_format == "json"
+        items = []
+        for key, value in data.items():
+            if key == "assets":
+                if not encoded:
+                    text = b"[]"
+                elif indent:
+                    text = b"[\n" + b",\n".join(encoded) + b"\n    ]"
+                else:
+                    text = b"[" + b",".join(encoded) + b"]"
+            elif indent:
+                text = json.dumps(value, indent=4).replace("\n", "\n    ").encode("utf-8")
+            else:
+                text = json.dumps(value, separators=(",", ":")).encode("utf-8")
+            name = json.dumps(key).encode("utf-8")
+            items.append(b"    " + name + b": " + text if indent else name + b":" + text)
+        if not items:
+            return _compress(b"{}", file_format)
+        if indent:
+            return b"{\n" + b",\n".join(items) + b"\n}"
+        return _compress(b"{" + b",".join(items) + b"}", file_format)
+
+
+def decode_json(raw: bytes) -> dict:
+    """Decode json data - the compression is detected from the content"""
+    if raw.startswith(GZIP_MAGIC):
+        raw = gzip.decompress(raw)
+    elif raw.startswith(XZ_MAGIC):
+        raw = lzma.decompress(raw)
+    return json.loads(raw)
+
+
+def decode_raw(raw: bytes) -> str:
+    """Decompress raw file content if needed and return the json text"""
+    if raw.startswith(GZIP_MAGIC):
+        raw = gzip.decompress(raw)
+    elif raw.startswith(XZ_MAGIC):
+        raw = lzma.decompress(raw)
+    return raw.decode("utf-8")
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos] in " \t\n\r":
+        pos += 1
+    return pos
+
+
+def _expect(text: str, pos: int, char: str) -> int:
+    pos = _skip_ws(text, pos)
+    if pos >= len(text) or text[pos] != char:
+        raise ValueError(f"Expected '{char}' at position {pos}")
+    return pos + 1
+
+
+def iter_json_chunks(
+    raw: bytes, key: str, chunk_size: int, data: dict
+) -> Iterator[list]:
+    """
+    Parse a json object and yield the elements of the array at key in chunks
+    Elements are parsed one by one, so the first chunk is available long before the whole file is parsed
+
+    :param raw: File content - compressed files are supported
+    :type raw: bytes
+    :param key: Top level key of the array to stream, e.g. "assets"
+    :type key: str
+    :param chunk_size: Number of elements per chunk
+    :type chunk_size: int
+    :param data: Filled in place with all top level members, the array grows with every chunk
+    :type data: dict
+    :return: Iterator over the chunks
+    :rtype: Iterator[list]
+    """
+    text = decode_raw(raw)
+    decoder = json.JSONDecoder()
+    pos = _skip_ws(text, _expect(text, 0, "{"))
+    if text.startswith("}", pos):
+        return
+    while True:
+        member, pos = decoder.raw_decode(text, _skip_ws(text, pos))
+        pos = _expect(text, pos, ":")
+        pos = _skip_ws(text, pos)
+        if member != key or not text.startswith("[", pos):
+            data[member], pos = decoder.raw_decode(text, pos)
+        else:
+            elements = data[member] = []
+            pos = _skip_ws(text, pos + 1)
+            chunk = []
+            if text.startswith("]", pos):
+                pos += 1
+            else:
+                while True:
+                    element, pos = decoder.raw_decode(text, _skip_ws(text, pos))
+                    chunk.append(element)
+                    if len(chunk) >= chunk_size:
+                        elements.extend(chunk)
+                        yield chunk
+                        chunk = []
+                    pos = _skip_ws(text, pos)
+                    if text.startswith("]", pos):
+                        pos += 1
+                        break
+                    pos = _expect(text, pos, ",")
+            if chunk:
+                elements.extend(chunk)
+                yield chunk
+        pos = _skip_ws(text, pos)
+        if text.startswith("}", pos):
+            return
+        pos = _expect(text, pos, ",")
+
+
+def find_format_file(path: str) -> str | None:
+    """
+    Return the newest existing file for path in any of the FORMATS
+
+    :param path: Uncompressed file name, e.g. /lib/library.json
+    :type path: str
+    :return: Existing file or None
+    :rtype: str | None
+    """
+    found = None
+    newest = None
+    for suffix in set(FORMATS.values()):
+        signature = stat_signature(path + suffix)
+        if signature and (newest is None or signature[0] > newest):
+            found = path + suffix
+            newest = signature[0]
+    return found
+
+
+def remove_other_formats(path: str, keep: str) -> None:
+    """Remove files of path in all formats but keep"""
+    for suffix in set(FORMATS.values()):
+        if path + suffix != keep and os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def backup_path(path: str, generation: int) -> str:
+    """Return the path of the given backup generation - 1 is the newest"""
+    return f"{path}.{generation}"
+
+
+def _fsync_dir(directory: str) -> None:
+    """Persist a rename on disk - not supported on Windows"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def rotate_backups(path: str, backups: int, source: str | None = None) -> None:
+    """
+    Shift the existing backups by one generation and keep the current file as the newest one
+    The current file stays in place until it is replaced
+
+    :param path: File to back up
+    :type path: str
+    :param backups: Number of generations to keep
+    :type backups: int
+    :param source: File to keep as the newest generation instead of path,
+        e.g. the same data in a format that is being replaced
+    :type source: str | None
+    """
+    source = source or path
+    if backups < 1 or not os.path.exists(source):
+        return
+    for generation in range(backups - 1, 0, -1):
+        older = backup_path(path, generation)
+        if os.path.exists(older):
+            os.replace(older, backup_path(path, generation + 1))
+
+    newest = backup_path(path, 1)
+    try:
+        # A hardlink keeps the current file in place without copying any data
+        tmp_link = newest + ".tmp"
+        if os.path.exists(tmp_link):
+            os.remove(tmp_link)
+        os.link(source, tmp_link)
+        os.replace(tmp_link, newest)
+    except OSError:
+        shutil.copy2(source, newest)
+
+
+def atomic_write(path: str, data: bytes, backups: int = 0) -> None:
+    """
+    Write data to path without ever leaving a truncated file behind
+
+    :param path: Target file
+    :type path: str
+    :param data: Content to write
+    :type data: bytes
+    :param backups: Number of previous generations to keep as path.1, path.2...
+    :type backups: int
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix="." + os.path.basename(path) + ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        rotate_backups(path, backups)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+def load_json(path: str, backups: int = 0) -> tuple[dict, str | None]:
+    """
+    Load json from path - falls back to the newest parseable backup generation
+    Compressed files are detected from their content
+
+    :param path: File to load
+    :type path: str
+    :param backups: Number of backup generations to consider
+    :type backups: int
+    :return: The loaded data and the path it was recovered from (None if path was fine)
+    :rtype: tuple[dict, str | None]
+    """
+    candidates = [path] + [backup_path(path, g) for g in range(1, backups + 1)]
+    first_error = None
+    for candidate in candidates:
+        try:
+            with open(candidate, "rb") as json_file:
+                data = decode_json(json_file.read())
+        except (OSError, ValueError, EOFError, lzma.LZMAError) as error:
+            if first_error is None:
+                first_error = error
+            continue
+        return data, None if candidate == path else candidate
+    raise first_error
+
+
+class LibraryLayout:
+    """
+    Where the files of one library live - its directory and the names of the asset files
+    Shared by everything that works on the files of a library directly
+    """
+
+    ROLES = ("mat", "interface", "image")
+
+    def __init__(
+        self,
+        directory: str,
+        asset_dir: str = "mat/",
+        img_dir: str = "img/",
+        ext: str = ".mat",
+        img_ext: str = ".png",
+    ) -> None:
+        self.path = os.path.join(directory, "")
+        self.asset_dir = asset_dir
+        self.img_dir = img_dir
+        self.ext = ext
+        self.img_ext = img_ext
+
+    @classmethod
+    def from_prefs(cls, preferences: prefs.Prefs, directory: str | None = None) -> LibraryLayout:
+        """Return the layout of the preferences - for the library in directory if given"""
+        return cls(
+            directory or preferences.dir,
+            preferences.asset_dir,
+            preferences.img_dir,
+            preferences.ext,
+            preferences.img_ext,
+        )
+
+    @property
+    def directories(self) -> tuple[str, ...]:
+        """The directories holding asset files, relative to the library"""
+        return tuple(dict.fromkeys((self.asset_dir, self.img_dir)))
+
+    def asset_names(self, mat_id: str) -> dict[str, str]:
+        """Return the files of an asset relative to the library keyed by their role"""
+        mat_id = str(mat_id)
+        return {
+            "mat": self.asset_dir + mat_id + self.ext,
+            "interface": self.asset_dir + mat_id + ".interface",
+            "image": self.img_dir + mat_id + self.img_ext,
+        }
+
+    def asset_files(self, mat_id: str) -> dict[str, str]:
+        """Return the files of an asset keyed by their role"""
+        return {role: self.path + name for role, name in self.asset_names(mat_id).items()}
+
+
+def stat_signature(path: str) -> tuple[int, int] | None:
+    """Return (mtime, size) of path to detect changes cheaply - None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileLock:
+    """
+    Advisory Lock on a lock file shared by all sessions working on the same library
+    Use as a context manager - blocks until the lock is acquired or the timeout is reached
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self._path = path
+        self._timeout = timeout
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self._file = open(self._path, "a+b")
+        deadline = time.monotonic() + self._timeout
+        while True:
+            try:
+                self._lock()
+                return self
+            except OSError:
+                if time.monotonic() > deadline:
+                    self._file.close()
+                    raise TimeoutError(f"MatLib: Could not acquire lock {self._path}")
+                time.sleep(0.05)
+
+    def __exit__(self, *args) -> None:
+        try:
+            self._unlock()
+        finally:
+            self._file.close()
+
+    def _lock(self) -> None:
+        if os.name == "nt":
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(self) -> None:
+        if os.name == "nt":
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,242 @@
+"""
+Version History for the MatLib Asset Files
+Earlier revisions of an asset are kept as compressed deltas against the next newer revision,
+every asset has its own history directory so saving never touches the rest of the library
+"""
+
+from __future__ import annotations
+
+import difflib
+import json
+import os
+import shutil
+import struct
+import time
+import zlib
+from typing import TYPE_CHECKING
+
+from matlib.core import fileio
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+HISTORY_DIR = "history/"
+INDEX_FILE = "index.json"
+DELTA_EXT = ".delta"
+
+# Delta operations: copy lines of the current file, insert new bytes
+_COPY = b"C"
+_INSERT = b"I"
+_RANGE = struct.Struct("<II")
+_LENGTH = struct.Struct("<I")
+# Files with a NUL byte in their first bytes are stored whole, lines mean nothing in them
+_SNIFF_SIZE = 8000
+
+
+def encode_delta(old: bytes, current: bytes) -> bytes:
+    """
+    Encode old as a compressed delta against current
+    Works on lines - unchanged lines are stored as a reference into current
+
+    :param old: Content of the earlier revision
+    :type old: bytes
+    :param current: Content the delta is applied to
+    :type current: bytes
+    :return: Compressed delta
+    :rtype: bytes
+    """
+    if not current:
+        # Nothing to refer to - the whole file in one insert
+        return zlib.compress(_INSERT + _LENGTH.pack(len(old)) + old, 9)
+    old_lines = old.splitlines(keepends=True)
+    current_lines = current.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, current_lines, old_lines, autojunk=False)
+    parts = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            parts.append(_COPY + _RANGE.pack(i1, i2 - i1))
+        elif j2 > j1:
+            data = b"".join(old_lines[j1:j2])
+            parts.append(_INSERT + _LENGTH.pack(len(data)) + data)
+    return zlib.compress(b"".join(parts), 9)
+
+
+def is_binary(data: bytes) -> bool:
+    """Return True for files like PNG or JPEG images - their deltas store the whole file"""
+    return b"\0" in data[:_SNIFF_SIZE]
+
+
+def apply_delta(delta: bytes, current: bytes) -> bytes:
+    """Rebuild the earlier revision from a delta created by encode_delta()"""
+    raw = zlib.decompress(delta)
+    current_lines = current.splitlines(keepends=True)
+    parts = []
+    pos = 0
+    while pos < len(raw):
+        op = raw[pos : pos + 1]
+        pos += 1
+        if op == _COPY:
+            start, count = _RANGE.unpack_from(raw, pos)
+            pos += _RANGE.size
+            parts.extend(current_lines[start : start + count])
+        elif op == _INSERT:
+            (length,) = _LENGTH.unpack_from(raw, pos)
+            pos += _LENGTH.size
+            parts.append(raw[pos : pos + length])
+            pos += length
+        else:
+            raise ValueError("MatLib: Invalid delta")
+    return b"".join(parts)
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> AssetHistory | None:
+    """
+    Return the asset history of the library in the preferences - None if it is switched off
+    Pass directory for a library other than the one in the preferences
+    """
+    if preferences.history_revisions <= 0:
+        return None
+    return AssetHistory(
+        fileio.LibraryLayout.from_prefs(preferences, directory), preferences.history_revisions
+    )
+
+
+class AssetHistory:
+    """
+    Keeps up to max_revisions earlier revisions of the .mat, .interface and image file of an asset
+    The newest files stay where they are. Every revision is a delta against the next newer one,
+    the newest revision against the current files - adding a revision leaves the others untouched
+    """
+
+    def __init__(self, layout: fileio.LibraryLayout, max_revisions: int = 10) -> None:
+        self._layout = layout
+        self._path = layout.path
+        self._max_revisions = max_revisions
+
+    def asset_files(self, mat_id: str) -> dict[str, str]:
+        """Return the versioned files of an asset keyed by their role"""
+        return self._layout.asset_files(mat_id)
+
+    def _directory(self, mat_id: str) -> str:
+        return self._path + HISTORY_DIR + str(mat_id) + "/"
+
+    def _delta_path(self, mat_id: str, revision: int, role: str) -> str:
+        return self._directory(mat_id) + f"{revision}.{role}{DELTA_EXT}"
+
+    def read_files(self, mat_id: str) -> dict[str, bytes]:
+        """
+        Read the current files of an asset
+        Hand them to add_revision() once the files have been overwritten
+        """
+        files = {}
+        for role, path in self.asset_files(mat_id).items():
+            try:
+                with open(path, "rb") as asset_file:
+                    files[role] = asset_file.read()
+            except OSError:
+                pass
+        return files
+
+    def revisions(self, mat_id: str) -> list[dict]:
+        """
+        Return the stored revisions of an asset, the newest first
+        Only the small index of the asset is read
+
+        :param mat_id: Id of the asset
+        :type mat_id: str
+        :return: Dicts with "revision", "date" and "sizes" of the files per role
+        :rtype: list[dict]
+        """
+        return self._read_index(mat_id)["revisions"]
+
+    def _read_index(self, mat_id: str) -> dict:
+        try:
+            with open(self._directory(mat_id) + INDEX_FILE, encoding="utf-8") as index_file:
+                return json.load(index_file)
+        except (OSError, ValueError):
+            return {"next": 1, "revisions": []}
+
+    def _write_index(self, mat_id: str, index: dict) -> None:
+        fileio.atomic_write(
+            self._directory(mat_id) + INDEX_FILE, json.dumps(index, indent=4).encode("utf-8")
+        )
+
+    def _rebuild(self, mat_id: str, revision: int, current: dict[str, bytes]) -> dict[str, bytes]:
+        """Rebuild the files of a stored revision - the deltas are applied from the newest down"""
+        files = current
+        for entry in self.revisions(mat_id):
+            newer = files
+            files = {}
+            for role in entry["sizes"]:
+                with open(self._delta_path(mat_id, entry["revision"], role), "rb") as delta_file:
+                    files[role] = apply_delta(delta_file.read(), newer.get(role, b""))
+            if entry["revision"] == revision:
+                return files
+        raise KeyError(f"MatLib: Asset {mat_id} has no revision {revision}")
+
+    def add_revision(self, mat_id: str, previous: dict[str, bytes]) -> int:
+        """
+        Keep the files an asset had before they have been overwritten
+        The older revisions are deltas against these files already and stay as they are,
+        the oldest revision is dropped once the cap is reached - no other revision depends on it
+
+        :param mat_id: Id of the asset
+        :type mat_id: str
+        :param previous: Files as returned by read_files() before they were overwritten
+        :type previous: dict[str, bytes]
+        :return: Number of the new revision - 0 if nothing has changed
+        :rtype: int
+        """
+        current = self.read_files(mat_id)
+        if not previous or previous == current:
+            return 0
+        index = self._read_index(mat_id)
+        kept = index["revisions"][: max(self._max_revisions - 1, 0)]
+        dropped = index["revisions"][len(kept) :]
+
+        revision = index["next"]
+        entry = {
+            "revision": revision,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "sizes": {role: len(data) for role, data in previous.items()},
+        }
+        os.makedirs(self._directory(mat_id), exist_ok=True)
+        for role, data in previous.items():
+            base = current.get(role, b"")
+            fileio.atomic_write(
+                self._delta_path(mat_id, revision, role),
+                encode_delta(data, b"" if is_binary(data) or is_binary(base) else base),
+            )
+        index["next"] = revision + 1
+        index["revisions"] = [entry] + kept
+        self._write_index(mat_id, index)
+
+        for old_entry in dropped:
+            for role in old_entry["sizes"]:
+                try:
+                    os.remove(self._delta_path(mat_id, old_entry["revision"], role))
+                except OSError:
+                    pass
+        return revision
+
+    def restore(self, mat_id: str, revision: int) -> None:
+        """
+        Put the files of a stored revision back in place
+        The files replaced by the restore become a revision themselves, so a restore can be undone
+
+        :param mat_id: Id of the asset
+        :type mat_id: str
+        :param revision: Number of the revision as listed by revisions()
+        :type revision: int
+        """
+        previous = self.read_files(mat_id)
+        files = self._rebuild(mat_id, revision, previous)
+        paths = self.asset_files(mat_id)
+        for role, data in files.items():
+            # Replaces the file instead of writing into it - it may be linked into the blob store
+            fileio.atomic_write(paths[role], data)
+        self.add_revision(mat_id, previous)
+
+    def remove_asset(self, mat_id: str) -> None:
+        """Remove the whole history of an asset"""
+        shutil.rmtree(self._directory(mat_id), ignore_errors=True)
@@ -0,0 +1,97 @@
+"""
+Library Server Storage for the MatLib Database
+Reads and writes the same dicts as library.json through a MatLib library server -
+unchanged data is revalidated with a conditional GET, edits are sent as journal records
+"""
+
+from __future__ import annotations
+
+from matlib.core import fileio, storage
+
+
+class HttpStore:
+    """
+    Library Server Storage for the MatLib Database
+    The server merges Categories and Tags against the lists this session last read,
+    like the sharded backend does against its index
+    """
+
+    def __init__(self, client: storage.HttpStorage) -> None:
+        self._client = client
+        self._etag = None
+        self._raw = None
+        # Lists as last read or written by this session - base for merging them on the server
+        self._index = {"categories": [], "tags": []}
+        self._count = 0
+
+    @property
+    def path(self) -> str:
+        return self._client.url
+
+    def close(self) -> None:
+        self._etag = None
+        self._raw = None
+
+    def _status(self) -> dict:
+        return self._client.request_json("GET", "signature")
+
+    def is_empty(self) -> bool:
+        """Return True if the server has no library yet"""
+        return self._status()["empty"]
+
+    def count(self) -> int:
+        """Return the number of assets"""
+        return self._count
+
+    def signature(self) -> tuple:
+        """Cheap change detection for edits of other sessions - one small request"""
+        return ("http", self._status()["signature"])
+
+    def _remember(self, data: dict) -> None:
+        self._index = {
+            "categories": list(data.get("categories", [])),
+            "tags": list(data.get("tags", [])),
+        }
+        self._count = len(data.get("assets", []))
+
+    def read_all(self) -> dict:
+        """Return the library - the body is only transferred if it changed since the last read"""
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        status, response_headers, raw = self._client.request("GET", "library", headers=headers)
+        if status == 304:
+            raw = self._raw
+        elif status == 200:
+            self._etag = response_headers.get("ETag")
+            self._raw = raw
+        else:
+            raise self._error(status, raw)
+        data = fileio.decode_json(raw)
+        self._remember(data)
+        return data
+
+    def write_all(self, data: dict) -> None:
+        """Replace everything on the server with the given library data"""
+        status, _, answer = self._client.request(
+            "PUT",
+            "library",
+            fileio.encode_json(data, "compact"),
+            {"Content-Type": "application/json"},
+        )
+        if status != 200:
+            raise self._error(status, answer)
+        self._remember(data)
+
+    def apply(self, records: list[dict]) -> None:
+        """
+        Send journal records (see core/journal.py) in one request
+
+        :param records: Journal records
+        :type records: list[dict]
+        """
+        answer = self._client.request_json(
+            "POST", "records", {"records": records, "base": self._index}
+        )
+        self._index = {"categories": answer["categories"], "tags": answer["tags"]}
+
+    def _error(self, status: int, answer: bytes) -> storage.HttpError:
+        return storage.HttpError(status, answer.decode("utf-8", "replace"))
@@ -0,0 +1,250 @@
+"""
+Integrity Verification for the MatLib Asset Files
+Hashes the .mat, .interface and image files in parallel and checks their structure,
+the hashes are cached with size and mtime so a later run only reads files that changed
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from matlib.core import blob_store, database, fileio, journal, shard_store
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+CHECKSUM_FILE = "library.checksums"
+REPORT_FILE = "integrity_report.json"
+FORMAT_VERSION = 1
+WORKERS = 8
+READ_CHUNK = 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_CHUNK = struct.Struct(">I4s")
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> IntegrityChecker:
+    """Return the checker for the library in the preferences - or in directory if given"""
+    return IntegrityChecker(fileio.LibraryLayout.from_prefs(preferences, directory))
+
+
+def check_png(data: bytes) -> str | None:
+    """Return the problem of a PNG file - None if all chunks are complete and their CRCs match"""
+    if not data.startswith(PNG_SIGNATURE):
+        return "no PNG signature"
+    pos = len(PNG_SIGNATURE)
+    while pos + _PNG_CHUNK.size <= len(data):
+        length, kind = _PNG_CHUNK.unpack_from(data, pos)
+        end = pos + _PNG_CHUNK.size + length + 4
+        if end > len(data):
+            return f"truncated in {kind.decode('latin-1')} chunk"
+        body = data[pos + 4 : end - 4]
+        if zlib.crc32(body) != struct.unpack_from(">I", data, end - 4)[0]:
+            return f"CRC mismatch in {kind.decode('latin-1')} chunk"
+        if kind == b"IEND":
+            return None
+        pos = end
+    return "truncated - no IEND chunk"
+
+
+def check_jpeg(data: bytes) -> str | None:
+    """Return the problem of a JPEG file - None if start and end markers are present"""
+    if not data.startswith(b"\xff\xd8"):
+        return "no JPEG start marker"
+    if not data.rstrip(b"\x00").endswith(b"\xff\xd9"):
+        return "truncated - no JPEG end marker"
+    return None
+
+
+def check_asset_file(data: bytes) -> str | None:
+    """Return the problem of a .mat or .interface file - writes cut off by the network leave NULs"""
+    if not data:
+        return "empty file"
+    if data.endswith(b"\x00" * 16):
+        return "ends in zero bytes - incomplete write"
+    return None
+
+
+def _check(path: str) -> tuple[str, str | None]:
+    """Hash a file and check its structure in one read - returns hash and problem"""
+    digest = hashlib.sha256()
+    parts = []
+    with open(path, "rb") as source:
+        while chunk := source.read(READ_CHUNK):
+            digest.update(chunk)
+            parts.append(chunk)
+    data = b"".join(parts)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".png":
+        problem = check_png(data)
+    elif extension in (".jpg", ".jpeg"):
+        problem = check_jpeg(data)
+    elif data or extension in (".mat", ".interface"):
+        problem = check_asset_file(data)
+    else:
+        problem = None
+    return digest.hexdigest(), problem
+
+
+class IntegrityChecker:
+    """
+    Verifies the files of the assets of one library
+    The checksum sidecar maps every file to [size, mtime_ns, sha256, problem]
+    """
+
+    def __init__(self, layout: fileio.LibraryLayout) -> None:
+        self._layout = layout
+        self._path = layout.path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _read_checksums(self) -> dict[str, list]:
+        try:
+            with open(self._path + CHECKSUM_FILE, encoding="utf-8") as checksum_file:
+                data = json.load(checksum_file)
+        except (OSError, ValueError):
+            return {}
+        return data.get("files", {}) if data.get("format") == FORMAT_VERSION else {}
+
+    def _write_checksums(self, files: dict[str, list]) -> None:
+        data = {"format": FORMAT_VERSION, "files": files}
+        fileio.atomic_write(
+            self._path + CHECKSUM_FILE, json.dumps(data, separators=(",", ":")).encode("utf-8")
+        )
+
+    def _expected(self, assets: list[dict], sharded: bool) -> dict[str, tuple[str, str]]:
+        """Return the files the assets should have - relative path -> (id, role)"""
+        expected = {}
+        for asset in assets:
+            key = journal.asset_key(asset)
+            for role, name in self._layout.asset_names(key).items():
+                expected[name] = (key, role)
+            if sharded:
+                # The sharded backend keeps the record of every asset next to its files
+                expected[self._layout.asset_dir + key + shard_store.SIDECAR_EXT] = (key, "record")
+        return expected
+
+    def verify(self, full: bool = False, workers: int = WORKERS, data: dict | None = None) -> dict:
+        """
+        Check all files of the library
+        Only files whose size or mtime changed since the last run are read again
+
+        :param full: Read every file and compare it with its cached hash - finds silent corruption
+        :type full: bool
+        :param workers: Number of files read in parallel
+        :type workers: int
+        :param data: Library data - loaded from the library if None
+        :type data: dict | None
+        :return: Report with "corrupt" and "missing" as lists of {"id", "role", "path"}
+            (corrupt ones with a "problem"), "orphan" as a list of paths and counts of the files
+        :rtype: dict
+        """
+        start = time.perf_counter()
+        if data is None:
+            data = database.connect(self._path).load()
+        sharded = database.detect_backend(self._path) == "sharded"
+        expected = self._expected(data.get("assets", []), sharded)
+        cached = self._read_checksums()
+
+        present = {}
+        for directory in self._layout.directories:
+            try:
+                with os.scandir(self._path + directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            present[directory + entry.name] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+
+        checked = {}
+        to_read = []
+        for rel_path, signature in present.items():
+            if rel_path not in expected:
+                continue
+            entry = cached.get(rel_path)
+            if entry and tuple(entry[:2]) == signature and not full:
+                checked[rel_path] = entry
+            else:
+                to_read.append(rel_path)
+
+        def read(rel_path: str) -> tuple[str, str | None] | OSError:
+            try:
+                return _check(self._path + rel_path)
+            except OSError as error:
+                return error
+
+        corrupt = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for rel_path, result in zip(to_read, pool.map(read, to_read)):
+                if isinstance(result, OSError):
+                    digest, problem = None, f"unreadable - {result}"
+                else:
+                    digest, problem = result
+                    previous = cached.get(rel_path)
+                    if (
+                        problem is None
+                        and previous
+                        and tuple(previous[:2]) == present[rel_path]
+                        and previous[2] != digest
+                    ):
+                        problem = "content changed without a new size or mtime"
+                checked[rel_path] = [*present[rel_path], digest, problem]
+
+        # The blob store knows the hash every stored file must have
+        store = None
+        if os.path.isdir(self._path + blob_store.MANIFEST_DIR):
+            store = blob_store.BlobStore(self._layout)
+        roles = {}
+        for rel_path in to_read if store else []:
+            key, role = expected[rel_path]
+            entry = checked[rel_path]
+            if entry[3]:
+                continue
+            if key not in roles:
+                roles[key] = store.manifest(key) or {}
+            stored = roles[key].get(role)
+            if stored and stored["hash"] != entry[2]:
+                entry[3] = "does not match the blob store"
+
+        missing = []
+        for rel_path, (key, role) in expected.items():
+            entry = checked.get(rel_path)
+            if entry is None:
+                missing.append({"id": key, "role": role, "path": self._path + rel_path})
+            elif entry[3]:
+                corrupt.append(
+                    {"id": key, "role": role, "path": self._path + rel_path, "problem": entry[3]}
+                )
+        orphan = sorted(
+            self._path + rel_path
+            for rel_path in present
+            if rel_path not in expected and not rel_path.endswith(".tmp")
+        )
+        self._write_checksums(checked)
+
+        return {
+            "library": self._path,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "files": len(checked),
+            "read": len(to_read),
+            "seconds": round(time.perf_counter() - start, 3),
+            "corrupt": corrupt,
+            "missing": missing,
+            "orphan": orphan,
+        }
+
+    def write_report(self, report: dict, path: str | None = None) -> str:
+        """Write a report as json - next to library.json if no path is given"""
+        path = path or self._path + REPORT_FILE
+        fileio.atomic_write(path, json.dumps(report, indent=4).encode("utf-8"))
+        return path
@@ -0,0 +1,378 @@
+"""
+Append-only Journal for the MatLib Database
+Stores small json-lines records next to library.json instead of rewriting the whole file
+"""
+
+import json
+import os
+
+JOURNAL_FILE = "library.journal"
+
+# Fold the journal back into library.json once one of these is reached
+MAX_RECORDS = 1000
+MAX_BYTES = 4 * 1024 * 1024
+
+# Field of an asset that does not exist on one side of a merge
+_MISSING = object()
+
+
+def asset_key(asset: dict) -> str:
+    """Return the key an asset is tracked by in the journal"""
+    return str(asset["id"])
+
+
+def copy_asset(asset: dict) -> dict:
+    """Copy an asset dict deep enough to be safe against in-place list edits"""
+    return {k: list(v) if isinstance(v, list) else v for k, v in asset.items()}
+
+
+def snapshot(data: dict) -> dict:
+    """
+    Create a snapshot of the given library data to diff against later
+
+    :param data: Library data as loaded from disk
+    :type data: dict
+    :return: Categories, Tags and Assets keyed by id
+    :rtype: dict
+    """
+    return {
+        "categories": list(data.get("categories", [])),
+        "tags": list(data.get("tags", [])),
+        "assets": {asset_key(a): copy_asset(a) for a in data.get("assets", [])},
+    }
+
+
+def diff(base: dict, data: dict, changed: dict[str, dict | None] | None = None) -> list[dict]:
+    """
+    Return the records needed to turn the snapshot base into data
+
+    :param base: Snapshot as created by snapshot()
+    :type base: dict
+    :param data: Current library data
+    :type data: dict
+    :param changed: The only assets that may differ from base keyed by id - None for removed ones.
+        All assets are compared if None
+    :type changed: dict[str, dict | None] | None
+    :return: List of journal records
+    :rtype: list[dict]
+    """
+    records = []
+    for section in ("categories", "tags"):
+        if section in data and data[section] != base[section]:
+            records.append({"op": section, "value": list(data[section])})
+
+    if "assets" not in data:
+        return records
+
+    if changed is not None:
+        for key, asset in changed.items():
+            if asset is None:
+                if key in base["assets"]:
+                    records.append({"op": "remove", "id": key})
+            elif base["assets"].get(key) != asset:
+                records.append({"op": "asset", "value": copy_asset(asset)})
+        return records
+
+    current = set()
+    for asset in data["assets"]:
+        key = asset_key(asset)
+        current.add(key)
+        if base["assets"].get(key) != asset:
+            records.append({"op": "asset", "value": copy_asset(asset)})
+    for key in base["assets"]:
+        if key not in current:
+            records.append({"op": "remove", "id": key})
+    return records
+
+
+def apply(data: dict, records: list[dict]) -> None:
+    """
+    Apply journal records in place to the given library data
+
+    :param data: Library data as loaded from disk
+    :type data: dict
+    :param records: Journal records
+    :type records: list[dict]
+    """
+    assets = data.setdefault("assets", [])
+    positions = {asset_key(a): pos for pos, a in enumerate(assets)}
+    removed = False
+
+    for record in records:
+        op = record["op"]
+        if op in ("categories", "tags", "revision"):
+            data[op] = record["value"]
+        elif op == "asset":
+            key = asset_key(record["value"])
+            if key in positions:
+                assets[positions[key]] = record["value"]
+            else:
+                positions[key] = len(assets)
+                assets.append(record["value"])
+        elif op == "remove":
+            pos = positions.pop(str(record["id"]), None)
+            if pos is not None:
+                assets[pos] = None
+                removed = True
+
+    if removed:
+        assets[:] = [a for a in assets if a is not None]
+
+
+def field_records(before: dict, after: dict) -> tuple[dict, dict]:
+    """
+    Return the records undoing and redoing the change of an asset from before to after
+    Only the changed fields are stored, so reverting it leaves other edits of the asset alone.
+    A field missing from "old" or "new" does not exist on that side
+
+    :return: Undo and redo record
+    :rtype: tuple[dict, dict]
+    """
+    fields = [
+        f
+        for f in dict.fromkeys([*before, *after])
+        if before.get(f, _MISSING) != after.get(f, _MISSING)
+    ]
+    old = copy_asset({f: before[f] for f in fields if f in before})
+    new = copy_asset({f: after[f] for f in fields if f in after})
+    key = asset_key(after)
+    return (
+        {"op": "fields", "id": key, "old": new, "new": copy_asset(old)},
+        {"op": "fields", "id": key, "old": copy_asset(old), "new": copy_asset(new)},
+    )
+
+
+def apply_fields(asset: dict, record: dict) -> dict:
+    """
+    Return a copy of asset with a "fields" record applied
+    A field changed by someone else since the record was made keeps its value,
+    Categories and Tags are merged entry by entry
+
+    :param asset: Current asset
+    :type asset: dict
+    :param record: Record created by field_records()
+    :type record: dict
+    :return: The changed asset
+    :rtype: dict
+    """
+    changed = copy_asset(asset)
+    for field in dict.fromkeys([*record["old"], *record["new"]]):
+        old = record["old"].get(field, _MISSING)
+        new = record["new"].get(field, _MISSING)
+        current = asset.get(field, _MISSING)
+        if current != old:
+            if not all(isinstance(v, list) for v in (old, new, current)):
+                continue
+            new = merge_list(old, new, current)
+        if new is _MISSING:
+            changed.pop(field, None)
+        else:
+            changed[field] = list(new) if isinstance(new, list) else new
+    return changed
+
+
+def merge_list(base: list, ours: list, theirs: list) -> list:
+    """
+    Merge a list of names (categories, tags) edited on two sides
+    Entries added or removed on our side since base are added or removed on theirs
+    """
+    added = [v for v in ours if v not in base]
+    removed = {v for v in base if v not in ours}
+    merged = [v for v in theirs if v not in removed]
+    merged += [v for v in added if v not in merged]
+    return merged
+
+
+def _conflict(asset: dict, field: str | None, base, ours, theirs) -> dict:
+    return {
+        "id": asset_key(asset),
+        "name": asset.get("name", ""),
+        "field": field,
+        "base": None if base is _MISSING else base,
+        "ours": None if ours is _MISSING else ours,
+        "theirs": None if theirs is _MISSING else theirs,
+    }
+
+
+def merge_asset(base: dict | None, ours: dict, theirs: dict) -> tuple[dict, list[dict]]:
+    """
+    Field-level three-way merge of an asset changed on both sides
+    Fields changed on one side only are taken from that side, Categories and Tags are merged
+    entry by entry. A field both sides set to different values keeps our value and is reported
+
+    :param base: The asset both sides started from - None if both have added it
+    :type base: dict | None
+    :param ours: Our version of the asset
+    :type ours: dict
+    :param theirs: Their version of the asset
+    :type theirs: dict
+    :return: The merged asset and the conflicts as dicts with "id", "name", "field",
+        "base", "ours" and "theirs"
+    :rtype: tuple[dict, list[dict]]
+    """
+    base = base or {}
+    merged = copy_asset(theirs)
+    conflicts = []
+    for field in dict.fromkeys([*ours, *base]):
+        mine = ours.get(field, _MISSING)
+        old = base.get(field, _MISSING)
+        if mine == old:
+            continue
+        other = theirs.get(field, _MISSING)
+        if other != old and other != mine:
+            if all(isinstance(v, list) for v in (mine, other)):
+                mine = merge_list([] if old is _MISSING else old, mine, other)
+            else:
+                conflicts.append(_conflict(ours, field, old, mine, other))
+        if mine is _MISSING:
+            merged.pop(field, None)
+        else:
+            merged[field] = list(mine) if isinstance(mine, list) else mine
+    return merged, conflicts
+
+
+def merge(base: dict, ours: dict, theirs: dict, conflicts: list | None = None) -> dict:
+    """
+    Three-way merge of our changes since base into theirs
+    Assets changed on both sides are merged field by field (see merge_asset()),
+    assets only they have changed stay as they are
+
+    :param base: Snapshot of the state both sides started from
+    :type base: dict
+    :param ours: Our current library data
+    :type ours: dict
+    :param theirs: Library data currently on disk - modified in place
+    :type theirs: dict
+    :param conflicts: Receives the fields both sides have changed - our value has been kept.
+        An asset removed on one side and changed on the other is reported with field None
+    :type conflicts: list | None
+    :return: The merged data
+    :rtype: dict
+    """
+    if conflicts is None:
+        conflicts = []
+    records = diff(base, ours)
+    current = {asset_key(a): a for a in theirs.get("assets", [])}
+    for record in records:
+        op = record["op"]
+        if op in ("categories", "tags"):
+            record["value"] = merge_list(base[op], record["value"], theirs.get(op, []))
+        elif op == "asset":
+            key = asset_key(record["value"])
+            old = base["assets"].get(key)
+            other = current.get(key)
+            if other is None:
+                if old is not None:
+                    # Removed by them - our changes bring it back
+                    conflicts.append(_conflict(record["value"], None, old, record["value"], None))
+            elif other != old:
+                record["value"], fields = merge_asset(old, record["value"], other)
+                conflicts.extend(fields)
+        elif op == "remove":
+            key = str(record["id"])
+            old = base["assets"].get(key)
+            other = current.get(key)
+            if other is not None and other != old:
+                # Changed by them - our removal wins
+                conflicts.append(_conflict(other, None, old, None, other))
+    apply(theirs, records)
+    return theirs
+
+
+def update_snapshot(base: dict, records: list[dict]) -> None:
+    """Apply journal records in place to a snapshot created by snapshot()"""
+    for record in records:
+        op = record["op"]
+        if op in ("categories", "tags"):
+            base[op] = list(record["value"])
+        elif op == "asset":
+            base["assets"][asset_key(record["value"])] = copy_asset(record["value"])
+        elif op == "remove":
+            base["assets"].pop(str(record["id"]), None)
+
+
+class Journal:
+    """
+    Append-only Journal for the MatLib Database
+    Each line in the file is a single json record
+    """
+
+    def __init__(self, directory: str) -> None:
+        self._path = os.path.join(directory, JOURNAL_FILE)
+        self._records = 0
+        self._size = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def records(self) -> int:
+        return self._records
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def replay(self, data: dict, repair: bool = True) -> int:
+        """
+        Apply all records on disk to the given data
+        A torn record at the end of the file (crash during append) is cut off
+
+        :param data: Library data as loaded from library.json
+        :type data: dict
+        :param repair: Cut a torn record off the file - it is only skipped if False
+        :type repair: bool
+        :return: Number of replayed records
+        :rtype: int
+        """
+        self._records = 0
+        self._size = 0
+        if not os.path.exists(self._path):
+            return 0
+
+        records = []
+        good = 0
+        with open(self._path, "rb") as journal_file:
+            for line in journal_file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                good += len(line)
+
+        if repair and good != os.path.getsize(self._path):
+            print(f"MatLib: Discarding torn record at the end of {self._path}")
+            with open(self._path, "r+b") as journal_file:
+                journal_file.truncate(good)
+
+        apply(data, records)
+        self._records = len(records)
+        self._size = good
+        return self._records
+
+    def append(self, records: list[dict]) -> None:
+        """Append records to disk"""
+        if not records:
+            return
+        lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        encoded = lines.encode("utf-8")
+        with open(self._path, "ab") as journal_file:
+            journal_file.write(encoded)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self._records += len(records)
+        self._size += len(encoded)
+
+    def needs_checkpoint(self) -> bool:
+        """Return True if the journal should be folded back into library.json"""
+        return self._records >= MAX_RECORDS or self._size >= MAX_BYTES
+
+    def clear(self) -> None:
+        """Remove the journal from disk - call after library.json has been written"""
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        self._records = 0
+        self._size = 0
@@ -3,13 +3,15 @@ This Module holds the Model for the MaterialView/Thumbview for the MatlibPanel
 """
 
 import os
+import contextlib
 import importlib
+from collections.abc import Iterator
 from typing import Any
 from PySide6 import QtCore, QtGui
 
 import hou
 
-from matlib.core import material, database
+from matlib.core import material, database, events, journal, blob_store, history, storage
 from matlib.prefs import prefs
 from matlib.render import thumbs, nodes
 
@@ -21,6 +23,19 @@ importlib.reload(thumbs)
 favicon = hou.getenv("EGMATLIB") + "/scripts/python/matlib/res/def/Favorite.png"
 missing = hou.getenv("EGMATLIB") + "/scripts/python/matlib/res/img/missing.jpg"
 BASE_SIZE = 512
+# Assets inserted per step when the library is streamed into the model
+LOAD_CHUNK_SIZE = 500
+
+
+def _row_ranges(rows: list[int]) -> list[tuple[int, int]]:
+    """Group sorted rows into (first, last) ranges of consecutive rows"""
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    return ranges
 
 
 class ThumbnailWorker(QtCore.QThread):
@@ -28,18 +43,35 @@ class ThumbnailWorker(QtCore.QThread):
     Processes Thumbnails in a threaded Manner
     """
 
-    thumbnail_ready = QtCore.Signal(int, QtGui.QImage)
+    thumbnail_ready = QtCore.Signal(int, str, QtGui.QImage)
 
-    def __init__(self, items, size: int, parent: QtCore.QObject | None = None) -> None:
+    def __init__(
+        self,
+        items,
+        size: int,
+        parent: QtCore.QObject | None = None,
+        library: storage.FileStorage | storage.HttpStorage | None = None,
+    ) -> None:
         super().__init__()
         self._items = items
         self._size = size
+        self._library = library
+
+    def _name(self, path: str) -> str | None:
+        """Return the name of a file inside the library - None for files elsewhere"""
+        if self._library and path.startswith(self._library.path):
+            return path[len(self._library.path) :]
+        return None
 
     def run(self) -> None:
         """Creates Thumbnails for previously passed items and emits signals when each image is created"""
-        for data in self._items:
-
-            img = QtGui.QImage(data[0]).scaled(QtCore.QSize(BASE_SIZE, BASE_SIZE))
+        names = [self._name(d[0]) for d in self._items]
+        if self._library:
+            # One batched request validates all images
+            self._library.prefetch([n for n in names if n is not None])
+        for data, name in zip(self._items, names):
+            path = self._library.fetch(name) if name is not None else data[0]
+            img = QtGui.QImage(path).scaled(QtCore.QSize(BASE_SIZE, BASE_SIZE))
             if img.isNull():
                 continue
             if data[1]:
@@ -53,9 +85,9 @@ class ThumbnailWorker(QtCore.QThread):
                 painter.drawImage(0, 0, img)
                 painter.drawImage(0, 0, fav_img)
                 painter.end()
-                self.thumbnail_ready.emit(data[2], composite)
+                self.thumbnail_ready.emit(data[2], data[3], composite)
             else:
-                self.thumbnail_ready.emit(data[2], img)
+                self.thumbnail_ready.emit(data[2], data[3], img)
 
 
 class MaterialLibrary(QtCore.QAbstractListModel):
@@ -63,18 +95,50 @@ class MaterialLibrary(QtCore.QAbstractListModel):
     Subclasses QtCore.QAbstractListModel
     """
 
-    def __init__(self, parent: QtCore.QObject | None = None) -> None:
+    loading_finished = QtCore.Signal()
+    # Conflicts of a merge with another session, see journal.merge()
+    merge_conflicts = QtCore.Signal(list)
+
+    def __init__(
+        self,
+        parent: QtCore.QObject | None = None,
+        connection: database.DatabaseConnector | None = None,
+        stream: bool = False,
+    ) -> None:
         super().__init__()
 
         self.preferences = prefs.Prefs()
         self.preferences.load()
         self._thumbsize = self.preferences.thumbsize
 
-        db = database.DatabaseConnector()
-        self._data = db.load(self.preferences.dir)
-
-        self._assets = [material.Material.from_dict(d) for d in self._data["assets"]]
-        self._tags = self._data["tags"]
+        # Models bound to a connection stay on that library, others follow the preferences
+        self._bound = connection is not None
+        self.db = connection or database.connect(self.preferences.dir)
+        self.db.configure(self.preferences)
+        self.db.subscribe(self._on_library_changed)
+
+        # Streamed models fill up chunk by chunk while the library is parsed
+        self._stream = stream
+        self._loader = None
+        self._pending_thumbs = []
+        self._load_timer = QtCore.QTimer(self)
+        self._load_timer.timeout.connect(self._load_next_chunk)
+
+        # Row of each asset by id for finished thumbnails - dropped whenever rows move
+        self._rows = None
+        self.rowsInserted.connect(self._on_rows_inserted)
+        self.rowsRemoved.connect(self._forget_rows)
+        self.modelReset.connect(self._forget_rows)
+        self.layoutChanged.connect(self._forget_rows)
+
+        if stream and not self.db.loaded:
+            self._data = {}
+            self._assets = material.MaterialRows()
+            self._tags = []
+        else:
+            self._data = self.db.load()
+            self._assets = material.MaterialRows(self._data["assets"])
+            self._tags = self._data["tags"]
 
         self._force_render = False  # Helper Var for Thumb Rendering
 
@@ -89,34 +153,279 @@ class MaterialLibrary(QtCore.QAbstractListModel):
             QtCore.QSize(BASE_SIZE, BASE_SIZE)
         )
 
+        # Deferred work while a transaction() is open
+        self._transaction_depth = 0
+        self._save_requested = False
+        self._deferred_tags = {}
+        self._deferred_thumbs = []
+
+        self._workers = []
         self.rebuild_thumbs()
+        if stream and not self._data:
+            self._start_loading()
 
         self._outofdate_thumb_list = []
 
+    def _thumb_item(self, row: int) -> tuple[str, bool, int, str]:
+        """Return the item for the ThumbnailWorker for the given row"""
+        mat_id = self._assets.mat_id(row)
+        path = self.db.path + self.preferences.img_dir + mat_id + self.preferences.img_ext
+        return (path, self._assets.favorite(row), row, mat_id)
+
     def _get__mat_paths(self):
-        self._mat_paths = []
-        for elem in range(self.rowCount()):
-            mat_id = self._assets[elem].mat_id
-            is_fav = self._assets[elem].fav
-            path = (
-                self.preferences.dir
-                + self.preferences.img_dir
-                + mat_id
-                + self.preferences.img_ext
-            )
-            self._mat_paths.append((path, is_fav, elem))
+        self._mat_paths = [self._thumb_item(elem) for elem in range(self.rowCount())]
 
     def switch_model_data(self):
-
+        """Reload the library from disk
+        Unchanged libraries cost nothing, changed ones only update the affected rows"""
+        previous = self.db
         self.preferences.load()
-        db = database.DatabaseConnector()
-        self._data = db.reload_with_path(self.preferences.dir)
+        if not self._bound:
+            self._set_connection(database.connect(self.preferences.dir))
+        self.db.configure(self.preferences)
         self._thumbsize = self.preferences.thumbsize
+        if self._loader is not None:
+            if previous is self.db:
+                return
+            # Switched library mid-load
+            self.cancel_loading()
+        if self._stream and previous is not self.db and not self.db.loaded:
+            self.beginResetModel()
+            self._data = {}
+            self._assets = material.MaterialRows()
+            self._thumbs = []
+            self.endResetModel()
+            self._start_loading()
+            return
 
-        self._assets = [material.Material.from_dict(d) for d in self._data["assets"]]
+        data = self.db.reload(self)
+        if data is self._data:
+            return
+
+        self._data = data
         self._tags = self._data["tags"]
+        if previous is self.db:
+            self._update_assets(self._data["assets"])
+            return
+        self._reset_assets()
+
+    def bind(self, connection: database.DatabaseConnector) -> None:
+        """Show the library of the given connection - kept when the preferences change"""
+        self._bound = True
+        if connection is self.db:
+            return
+        self.cancel_loading()
+        self._set_connection(connection)
+        self.db.configure(self.preferences)
+        self._data = self.db.load()
+        self._tags = self._data["tags"]
+        self._reset_assets()
+
+    def _start_loading(self) -> None:
+        """Fill the model chunk by chunk while the library is parsed"""
+        self.cancel_loading()
+        self._loader = self.db.load_chunks(LOAD_CHUNK_SIZE)
+        self._pending_thumbs = []
+        # The first chunk is inserted right away so the first screenful shows up immediately
+        if self._load_next_chunk():
+            self._load_timer.start(0)
+
+    def _load_next_chunk(self) -> bool:
+        """Insert the next chunk of assets - returns False once the library is complete"""
+        try:
+            chunk = next(self._loader)
+        except StopIteration:
+            self._loader = None
+            self._load_timer.stop()
+            self._data = self.db.load()
+            self._tags = self._data["tags"]
+            # Picks up journal records replayed at the end of the load
+            self._update_assets(self._data["assets"])
+            if self._pending_thumbs:
+                self._start_worker(self._pending_thumbs)
+                self._pending_thumbs = []
+            self.loading_finished.emit()
+            return False
+
+        self._data = self.db.load()
+        self._tags = self._data.get("tags", self._tags)
+        first = self.rowCount()
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(chunk) - 1)
+        self._assets.extend(chunk)
+        self._thumbs.extend([0] * len(chunk))
+        self.endInsertRows()
+
+        self._pending_thumbs.extend(
+            self._thumb_item(row) for row in range(first, self.rowCount())
+        )
+        # Only one thumbnail worker at a time while loading
+        if not any(w.isRunning() for w in self._workers):
+            self._start_worker(self._pending_thumbs)
+            self._pending_thumbs = []
+        return True
+
+    def cancel_loading(self) -> None:
+        """Stop a running load - e.g. when the library is switched mid-load"""
+        self._load_timer.stop()
+        if self._loader is not None:
+            self._loader.close()
+            self._loader = None
+
+    def finish_loading(self) -> None:
+        """Load the rest of the library right away"""
+        self._load_timer.stop()
+        while self._loader is not None and self._load_next_chunk():
+            pass
+
+    @property
+    def loading(self) -> bool:
+        """True while the library is being streamed into the model"""
+        return self._loader is not None
+
+    def _reset_assets(self) -> None:
+        self.beginResetModel()
+        self._assets = material.MaterialRows(self._data["assets"])
+        self.endResetModel()
         self.rebuild_thumbs()
 
+    def _set_connection(self, connection: database.DatabaseConnector) -> None:
+        if connection is self.db:
+            return
+        self.db.unsubscribe(self._on_library_changed)
+        self.db = connection
+        self.db.subscribe(self._on_library_changed)
+
+    def _on_library_changed(self, changes: list[events.Event]) -> None:
+        """
+        Update the model after another model or session has changed the library
+        Changes made by this model have been applied already and are skipped
+
+        :param changes: Events published by the database
+        :type changes: list[events.Event]
+        """
+        for change in changes:
+            if change.kind == events.MERGE_CONFLICTS:
+                self.merge_conflicts.emit(change.value)
+        if self._transaction_depth or self._loader is not None:
+            # A rolled back transaction restores the model itself,
+            # a running load picks the changes up when it is done
+            return
+        changes = [c for c in changes if c.source is not self]
+        if not changes:
+            return
+        if any(c.kind == events.RELOADED for c in changes):
+            self._data = self.db.load()
+            self._tags = self._data["tags"]
+            self._update_assets(self._data["assets"])
+            return
+
+        removed = set()
+        changed = {}
+        added = {}
+        categories_changed = False
+        for change in changes:
+            if change.kind == events.ASSET_ADDED:
+                added[change.key] = change.value
+            elif change.kind == events.ASSET_CHANGED:
+                if change.key in added:
+                    added[change.key] = change.value
+                else:
+                    changed[change.key] = change.value
+            elif change.kind == events.ASSET_REMOVED:
+                added.pop(change.key, None)
+                changed.pop(change.key, None)
+                removed.add(change.key)
+            elif change.kind == events.CATEGORY_REMOVED:
+                self.remove_category(change.key)
+                categories_changed = True
+            elif change.kind == events.CATEGORY_RENAMED:
+                self.rename_category(change.old, change.key)
+                categories_changed = True
+            elif change.kind == events.TAG_ADDED and change.key not in self._tags:
+                self._tags.append(change.key)
+            elif change.kind == events.TAGS_CHANGED:
+                self._tags = change.value
+        if categories_changed and self._assets:
+            self.dataChanged.emit(
+                self.index(0), self.index(self.rowCount() - 1), [self.CategoryRole]
+            )
+        self._apply_asset_changes(removed, changed, added)
+
+    def _apply_asset_changes(self, removed: set, changed: dict, added: dict) -> None:
+        """Remove, update and append the given rows - only those get new thumbnails"""
+        rows = [row for row, mat_id in enumerate(self._assets.ids()) if mat_id in removed]
+        for first, last in reversed(_row_ranges(rows)):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            del self._assets[first : last + 1]
+            del self._thumbs[first : last + 1]
+            self.endRemoveRows()
+
+        rows = []
+        for row, mat_id in enumerate(self._assets.ids()):
+            new = changed.get(mat_id)
+            if new is not None:
+                self._assets[row] = journal.copy_asset(new)
+                rows.append(row)
+            elif mat_id in added:
+                # Already shown - e.g. added by this model before
+                self._assets[row] = journal.copy_asset(added.pop(mat_id))
+                rows.append(row)
+        for first, last in _row_ranges(rows):
+            self.dataChanged.emit(self.index(first), self.index(last))
+
+        if added:
+            first = self.rowCount()
+            self.beginInsertRows(QtCore.QModelIndex(), first, first + len(added) - 1)
+            self._assets.extend(journal.copy_asset(d) for d in added.values())
+            self._thumbs[first:] = [0] * len(added)
+            self.endInsertRows()
+            rows.extend(range(first, self.rowCount()))
+
+        if rows:
+            self._start_worker([self._thumb_item(row) for row in rows])
+
+    def _update_assets(self, new_assets: list[dict]) -> None:
+        """
+        Bring the model in line with the given asset dicts
+        Only removed, changed and added rows are signaled and get new thumbnails
+
+        :param new_assets: Assets as stored in the database
+        :type new_assets: list[dict]
+        """
+        new_by_id = {str(d["id"]): d for d in new_assets}
+
+        # Remove from the back so the remaining rows stay valid
+        removed = [
+            row for row, mat_id in enumerate(self._assets.ids()) if mat_id not in new_by_id
+        ]
+        for first, last in reversed(_row_ranges(removed)):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            del self._assets[first : last + 1]
+            del self._thumbs[first : last + 1]
+            self.endRemoveRows()
+
+        changed = []
+        for row, mat_id in enumerate(self._assets.ids()):
+            new = new_by_id[mat_id]
+            if new != self._assets.record(row):
+                self._assets[row] = new
+                changed.append(row)
+        for first, last in _row_ranges(changed):
+            self.dataChanged.emit(self.index(first), self.index(last))
+
+        known = set(self._assets.ids())
+        added = [d for d in new_assets if str(d["id"]) not in known]
+        if added:
+            first = self.rowCount()
+            self.beginInsertRows(QtCore.QModelIndex(), first, first + len(added) - 1)
+            self._assets.extend(added)
+            self._thumbs[first:] = [0] * len(added)
+            self.endInsertRows()
+            changed.extend(range(first, self.rowCount()))
+
+        if changed:
+            self._start_worker([self._thumb_item(row) for row in changed])
+
     def flags(
         self, index: QtCore.QModelIndex | QtCore.QPersistentModelIndex
     ) -> QtCore.Qt.ItemFlag:
@@ -132,37 +441,37 @@ class MaterialLibrary(QtCore.QAbstractListModel):
     def update_outofdate_thumb_list(self):
         paths = []
         for curr_index in self._outofdate_thumb_list:
-            mat_id = self._assets[curr_index.row()].mat_id
+            mat_id = self._assets.mat_id(curr_index.row())
             for elem in range(self.rowCount()):
-                if mat_id == self._assets[elem].mat_id:
-                    is_fav = self._assets[elem].fav
+                if mat_id == self._assets.mat_id(elem):
+                    is_fav = self._assets.favorite(elem)
                     path = (
-                        self.preferences.dir
+                        self.db.path
                         + self.preferences.img_dir
                         + mat_id
                         + self.preferences.img_ext
                     )
 
-                    paths.append((path, is_fav, curr_index.row()))
+                    paths.append((path, is_fav, curr_index.row(), mat_id))
 
         self._start_worker(paths)
         self._outofdate_thumb_list.clear()
 
     def _add_thumb_paths(self, index: QtCore.QModelIndex):
-        mat_id = self._assets[index.row()].mat_id
+        mat_id = self._assets.mat_id(index.row())
 
         paths = []
         for elem in range(self.rowCount()):
-            if mat_id == self._assets[elem].mat_id:
-                is_fav = self._assets[elem].fav
+            if mat_id == self._assets.mat_id(elem):
+                is_fav = self._assets.favorite(elem)
                 path = (
-                    self.preferences.dir
+                    self.db.path
                     + self.preferences.img_dir
                     + mat_id
                     + self.preferences.img_ext
                 )
 
-                paths.append((path, is_fav, index.row()))
+                paths.append((path, is_fav, index.row(), mat_id))
         # Extend Thumbslist by 1 and fill later
         self._thumbs.append(0)
         if self.preferences.render_on_import or self._force_render:
@@ -175,16 +484,49 @@ class MaterialLibrary(QtCore.QAbstractListModel):
         if not paths:
             paths = self._mat_paths
         items = paths
+        if self._transaction_depth:
+            self._deferred_thumbs.extend(items)
+            return
 
-        self.worker = ThumbnailWorker(items, self._thumbsize)
+        # Keep running workers alive until they are done
+        self._workers = [w for w in self._workers if w.isRunning()]
+        self.worker = ThumbnailWorker(
+            items, self._thumbsize, library=storage.for_prefs(self.preferences, self.db.path)
+        )
         self.worker.thumbnail_ready.connect(self._on_thumb_ready)
         self.worker.start()
+        self._workers.append(self.worker)
 
-    @QtCore.Slot(int, QtGui.QImage)
-    def _on_thumb_ready(self, elem, image):
+    def _row(self, mat_id: str) -> int | None:
+        """Return the row of an asset - None if the model does not show it"""
+        if self._rows is None:
+            self._rows = {mat_id: row for row, mat_id in enumerate(self._assets.ids())}
+        return self._rows.get(mat_id)
+
+    def _forget_rows(self, *args) -> None:
+        """Rows have been removed or reordered - the index is rebuilt on the next lookup"""
+        self._rows = None
+
+    def _on_rows_inserted(self, parent: QtCore.QModelIndex, first: int, last: int) -> None:
+        if self._rows is None:
+            return
+        if last + 1 < len(self._assets):
+            # Inserted in front of other rows
+            self._rows = None
+            return
+        for row in range(first, last + 1):
+            self._rows[self._assets.mat_id(row)] = row
+
+    @QtCore.Slot(int, str, QtGui.QImage)
+    def _on_thumb_ready(self, elem, mat_id, image):
+        if elem >= len(self._assets) or self._assets.mat_id(elem) != mat_id:
+            # Rows have moved since the worker was started
+            elem = self._row(mat_id)
+            if elem is None:
+                return
         self._thumbs[elem] = image
         self.dataChanged.emit(
-            self.index(elem), self.index(elem), QtCore.Qt.ItemDataRole.DecorationRole
+            self.index(elem), self.index(elem), [QtCore.Qt.ItemDataRole.DecorationRole]
         )
 
     def set_custom_iconsize(self, size: QtCore.QSize) -> None:
@@ -227,14 +569,92 @@ class MaterialLibrary(QtCore.QAbstractListModel):
         if role == self.IdRole:
             return str(self._assets[index.row()].mat_id)
 
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Batch many edits, e.g. from pipeline scripts adding thousands of assets
+        Saving, tag bookkeeping and thumbnail workers are deferred until the block ends,
+        views get a single layoutChanged. An exception restores the state from before the block
+        (files already written or removed on disk are not restored)
+        """
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield
+            finally:
+                self._transaction_depth -= 1
+            return
+
+        assets = [journal.copy_asset(self._assets.record(row)) for row in range(len(self._assets))]
+        thumbs = list(self._thumbs)
+        self._transaction_depth = 1
+        self._save_requested = False
+        self._deferred_tags = {}
+        self._deferred_thumbs = []
+        self.layoutAboutToBeChanged.emit()
+        try:
+            with self.db.transaction():
+                yield
+                self._transaction_depth = 0
+                self._commit_transaction()
+        except BaseException:
+            self._transaction_depth = 0
+            self._assets = material.MaterialRows(assets)
+            self._thumbs = thumbs
+            self._tags = self._data["tags"]
+            self._deferred_thumbs = []
+            raise
+        finally:
+            self.layoutChanged.emit()
+
+    def _commit_transaction(self) -> None:
+        """Apply the work deferred by transaction() once"""
+        known = set(self._tags)
+        added = [t for t in self._deferred_tags if t not in known]
+        self._deferred_tags = {}
+        self._add_tags(added)
+        if self._save_requested:
+            self._save_requested = False
+            self.save()
+        if self._deferred_thumbs:
+            items, self._deferred_thumbs = self._deferred_thumbs, []
+            self._start_worker(items)
+
     def save(self) -> None:
         """Save data to disk as json"""
-        db = database.DatabaseConnector()
+        if self._transaction_depth:
+            self._save_requested = True
+            return
         data = {}
         data["tags"] = self._tags
-        data["assets"] = [asset.get_as_dict() for asset in self._assets]
-        db.set(data)
-        db.save()
+        data["assets"] = [self._assets.record(row) for row in range(len(self._assets))]
+        self.db.set(data, source=self)
+        self.db.save()
+
+    def find_assets(
+        self,
+        category: str | None = None,
+        tag: str | None = None,
+        renderer: str | None = None,
+        favorite: bool | None = None,
+        name: str | None = None,
+    ) -> list[material.Material]:
+        """
+        Return Materials matching all given filters
+        Only the matches are turned into Materials - with the SQLite backend this is an index lookup
+
+        :param category: Category to match exactly
+        :param tag: Tag to match exactly
+        :param renderer: Substring of the renderer
+        :param favorite: Favorite state
+        :param name: Substring of the name
+        :return: Matching Materials
+        :rtype: list[material.Material]
+        """
+        return [
+            material.Material.from_dict(d)
+            for d in self.db.query(category, tag, renderer, favorite, name)
+        ]
 
     @property
     def assets(self) -> list:
@@ -300,7 +720,7 @@ class MaterialLibrary(QtCore.QAbstractListModel):
 
         asset.set_data(name, cats, tags, fav, None)
         self._outofdate_thumb_list.append(index)
-        self.save()
+        self._publish_asset(asset)
 
     def remove_asset(self, index: QtCore.QModelIndex) -> None:
         """Removes a material from this Library and Disk
@@ -310,43 +730,42 @@ class MaterialLibrary(QtCore.QAbstractListModel):
             return
         asset = self._assets[index.row()]
 
-        # Remove Files from Disk
-
-        asset_file_path = os.path.join(
-            self.preferences.dir,
-            self.preferences.asset_dir,
-            asset.mat_id + self.preferences.ext,
-        )
-        img_file_path = os.path.join(
-            self.preferences.dir,
-            self.preferences.img_dir,
-            asset.mat_id + self.preferences.img_ext,
-        )
-        interface_file_path = os.path.join(
-            self.preferences.dir,
-            self.preferences.asset_dir,
-            asset.mat_id + ".interface",
-        )
-
-        if os.path.exists(asset_file_path):
-            os.remove(asset_file_path)
-        if os.path.exists(img_file_path):
-            os.remove(img_file_path)
-        if os.path.exists(interface_file_path):
-            os.remove(interface_file_path)
+        # Move the Files to the trash - undo brings them back, they are deleted with the
+        # history of the asset once the undo step has expired
+        self.db.trash.move_asset(asset.mat_id)
 
         self._assets.remove(asset)
         self._remove_thumb(index.row())
+        self._forget_rows()
 
-        self.save()
+        self.db.remove_asset(asset.mat_id, source=self)
 
     def check_add_tags(self, tag: str) -> None:
         """Checks if this tag exists and adds it if needed"""
+        if self._transaction_depth:
+            for t in tag.split(","):
+                t = t.replace(" ", "")
+                if t != "":
+                    self._deferred_tags[t] = None
+            return
+        added = []
         for t in tag.split(","):
             t = t.replace(" ", "")
-            if t != "" and t not in self.tags:
-                self.tags.append(t)
-        self.save()
+            if t != "" and t not in self.tags and t not in added:
+                added.append(t)
+        self._add_tags(added)
+
+    def _add_tags(self, added: list[str]) -> None:
+        """Add new tags to the model and the database"""
+        # The list is usually shared with the database, which then finds the tags present
+        self.db.add_tags(added, source=self)
+        for t in added:
+            if t not in self._tags:
+                self._tags.append(t)
+
+    def _publish_asset(self, asset: material.Material) -> None:
+        """Store the edited asset in the database - the other models only update its row"""
+        self.db.update_asset(asset.get_as_dict(), source=self)
 
     def get_current_network_node(self) -> None | hou.Node:
         """Return thre current Node in the Network Editor"""
@@ -369,7 +788,7 @@ class MaterialLibrary(QtCore.QAbstractListModel):
 
     def add_asset(self, node: hou.Node, cats: str, tags: str, fav: bool) -> None:
         """Add a Material to this Library"""
-        handler = nodes.NodeHandler(self.preferences)
+        handler = nodes.NodeHandler(self.preferences, self.db.path)
         renderer = handler.get_renderer_from_node(node)
         new_mat = material.Material()
         tags = self.sanitize_tags(tags)
@@ -377,8 +796,9 @@ class MaterialLibrary(QtCore.QAbstractListModel):
 
         if handler.save_node(node, new_mat.mat_id, False):
             self._assets.append(new_mat)
+            self._forget_rows()
             self._add_thumb_paths(self.index(self.rowCount() - 1, 0))
-            self.save()
+            self.db.add_asset(new_mat.get_as_dict(), source=self)
 
     def add_asset_from_strings(
         self, name: str, cats: str, tags: str, fav: bool, renderer: str
@@ -394,6 +814,7 @@ class MaterialLibrary(QtCore.QAbstractListModel):
             renderer,
         )
         self._assets.append(new_asset)
+        self._forget_rows()
         # self._add_thumb_paths(self.index(self.rowCount() - 1, 0))
         # self.save()
         return self._assets[self.rowCount() - 1]
@@ -405,17 +826,17 @@ class MaterialLibrary(QtCore.QAbstractListModel):
 
         for row, asset in enumerate(self._assets):
             interface_path = os.path.join(
-                self.preferences.dir,
+                self.db.path,
                 self.preferences.asset_dir,
                 str(asset.mat_id) + ".interface",
             )
             mat_path = os.path.join(
-                self.preferences.dir,
+                self.db.path,
                 self.preferences.asset_dir,
                 str(asset.mat_id) + ".mat",
             )
             img_path = os.path.join(
-                self.preferences.dir,
+                self.db.path,
                 self.preferences.img_dir,
                 str(asset.mat_id) + self.preferences.img_ext,
             )
@@ -430,7 +851,7 @@ class MaterialLibrary(QtCore.QAbstractListModel):
                     f"Image for Asset { asset.mat_id} missing on disk -> Needs Rendering!"
                 )
 
-        mats_path = os.path.join(self.preferences.dir, self.preferences.asset_dir)
+        mats_path = os.path.join(self.db.path, self.preferences.asset_dir)
         mark_lone = 0
         for f in os.listdir(mats_path):
             if f.endswith(".mat") or f.endswith(".interface"):
@@ -446,7 +867,7 @@ class MaterialLibrary(QtCore.QAbstractListModel):
                     except OSError:
                         pass
 
-        mats_path = os.path.join(self.preferences.dir, self.preferences.img_dir)
+        mats_path = os.path.join(self.db.path, self.preferences.img_dir)
         for f in os.listdir(mats_path):
             if f.endswith(".png"):
                 split = f.split(".")[0]
@@ -461,6 +882,12 @@ class MaterialLibrary(QtCore.QAbstractListModel):
                     except OSError:
                         pass
 
+        store = blob_store.for_prefs(self.preferences, self.db.path)
+        if store:
+            removed, freed = store.collect_garbage()
+            if removed:
+                print(f"MatLib: Removed {removed} unused blobs ({freed // 1024} KB)")
+
         if mark_rmv:
             hou.ui.displayMessage(
                 "Assets have been cleaned up. See python shell for details"  # type: ignore
@@ -481,7 +908,7 @@ class MaterialLibrary(QtCore.QAbstractListModel):
         :type index: QtCore.QModelIndex
         """
         self._assets[index.row()].fav = False if self._assets[index.row()].fav else True
-        self.save()
+        self._publish_asset(self._assets[index.row()])
         self._outofdate_thumb_list.append(index)
         self.update_outofdate_thumb_list()
 
@@ -494,11 +921,68 @@ class MaterialLibrary(QtCore.QAbstractListModel):
         :type index: QtCore.QModelIndex
         """
         self._force_render = True
-        renderer = thumbs.ThumbNailRenderer(self.preferences, self._assets[index.row()])
+        mat_id = self._assets[index.row()].mat_id
+        store = blob_store.for_prefs(self.preferences, self.db.path)
+        if store:
+            store.detach_asset(mat_id)
+        renderer = thumbs.ThumbNailRenderer(
+            self.preferences, self._assets[index.row()], self.db.path
+        )
         renderer.create_thumbnail()
+        if store:
+            store.add_asset(mat_id)
         self._add_thumb_paths(index)
         self._force_render = False
 
+    def asset_revisions(self, index: QtCore.QModelIndex) -> list[dict]:
+        """
+        Return the earlier revisions of the asset at the given QModelIndex, the newest first
+
+        :param index: Row of the asset
+        :type index: QtCore.QModelIndex
+        :return: Dicts with "revision", "date" and "sizes"
+        :rtype: list[dict]
+        """
+        versions = history.for_prefs(self.preferences, self.db.path)
+        if not versions:
+            return []
+        return versions.revisions(self._assets[index.row()].mat_id)
+
+    def restore_asset_revision(self, index: QtCore.QModelIndex, revision: int) -> None:
+        """
+        Put an earlier revision of the asset at the given QModelIndex back in place
+        The replaced files are kept as a new revision
+
+        :param index: Row of the asset
+        :type index: QtCore.QModelIndex
+        :param revision: Number of the revision as listed by asset_revisions()
+        :type revision: int
+        """
+        versions = history.for_prefs(self.preferences, self.db.path)
+        if not versions:
+            return
+        mat_id = self._assets[index.row()].mat_id
+        store = blob_store.for_prefs(self.preferences, self.db.path)
+        versions.restore(mat_id, revision)
+        if store:
+            store.add_asset(mat_id)
+        self._outofdate_thumb_list.append(index)
+        self.update_outofdate_thumb_list()
+
+    def undo(self) -> str | None:
+        """
+        Revert the last edit of the library made by this user - all models follow the change
+        Returns the label of the reverted edit, None if there was nothing to undo
+        """
+        return self.db.undo()
+
+    def redo(self) -> str | None:
+        """
+        Apply the last undone edit of the library again
+        Returns the label of the edit, None if there was nothing to redo
+        """
+        return self.db.redo()
+
     def import_asset_to_scene(self, index: QtCore.QModelIndex) -> None:
         """
         Import the given QModelIndex to the current Houdini Scene/Network Editor
@@ -507,5 +991,5 @@ class MaterialLibrary(QtCore.QAbstractListModel):
         :param index: Description
         :type index: QtCore.QModelIndex
         """
-        importer = nodes.NodeHandler(self.preferences)
+        importer = nodes.NodeHandler(self.preferences, self.db.path)
         importer.import_asset_to_scene(self._assets[index.row()])
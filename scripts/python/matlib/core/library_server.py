@@ -0,0 +1,275 @@
+"""
+Small HTTP Server for a MatLib Library
+Serves library.json and the asset files of one library directory to sessions using the http backend.
+Bind it to localhost or a trusted network only - there is no authentication
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from matlib.core import database, fileio, journal, migrations, shard_store, sqlite_store
+
+DEFAULT_PORT = 8765
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """Return the ETag of a file - changes whenever a write changes its size or mtime"""
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+class LibraryServer(ThreadingHTTPServer):
+    """
+    Serves one library directory
+    Requests are handled on threads, edits of the library records are serialized by a lock
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        directory: str,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        verbose: bool = False,
+    ) -> None:
+        self.root = os.path.join(os.path.abspath(directory), "")
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.connection = database.connect(self.root)
+        # Encoded library for the current signature - most GETs of a changed library come in bursts
+        self._body = (None, b"")
+        self._thread = None
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> None:
+        """Serve on a background thread, e.g. from a running session or a test"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        self.connection.flush()
+
+    def signature(self) -> str:
+        """Return the version of the library records on disk - the caller holds the lock"""
+        raw = repr(self.connection.signature() if self.has_library() else None)
+        return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16] + '"'
+
+    def has_library(self) -> bool:
+        """Return True if the directory holds a library of any backend"""
+        return bool(
+            database.find_library_file(self.root)
+            or os.path.exists(self.root + sqlite_store.SQLITE_FILE)
+            or os.path.exists(self.root + shard_store.INDEX_FILE)
+        )
+
+    def _ensure_library(self) -> None:
+        """Start an empty library in a new directory - the caller holds the lock"""
+        if self.has_library():
+            return
+        os.makedirs(self.root, exist_ok=True)
+        fileio.atomic_write(
+            self.root + database.LIBRARY_FILE,
+            fileio.encode_json(
+                {
+                    "schema_version": migrations.SCHEMA_VERSION,
+                    "categories": [],
+                    "tags": [],
+                    "assets": [],
+                }
+            ),
+        )
+
+    def library(self) -> tuple[str, bytes]:
+        """Return signature and encoded library - the caller holds the lock"""
+        self._ensure_library()
+        self.connection.reload()
+        signature = self.signature()
+        if self._body[0] != signature:
+            self._body = (signature, fileio.encode_json(self.connection.load(), "compact"))
+        return self._body
+
+    def apply(self, records: list[dict], base: dict) -> dict:
+        """
+        Apply journal records of a client on top of the current library
+        Categories and Tags are merged against the lists the client last read
+
+        :return: The Categories and Tags after the merge
+        :rtype: dict
+        """
+        with self.lock:
+            self._ensure_library()
+            data = self.connection.reload()
+            updated = {
+                "categories": list(data.get("categories", [])),
+                "tags": list(data.get("tags", [])),
+                "assets": list(data.get("assets", [])),
+            }
+            merged = []
+            for record in records:
+                op = record["op"]
+                if op in ("categories", "tags"):
+                    record = {
+                        "op": op,
+                        "value": journal.merge_list(base.get(op, []), record["value"], updated[op]),
+                    }
+                merged.append(record)
+            journal.apply(updated, merged)
+            self.connection.set(updated)
+            self.connection.save()
+            self.connection.flush()
+            return {"categories": updated["categories"], "tags": updated["tags"]}
+
+    def replace(self, data: dict) -> None:
+        """Replace the library with the data of a client"""
+        with self.lock:
+            self._ensure_library()
+            self.connection.reload()
+            self.connection.set(data)
+            self.connection.save()
+            self.connection.flush()
+
+    def file_path(self, name: str) -> str | None:
+        """
+        Return the file for a name of the files endpoint - None if it is not allowed
+        Only files in subdirectories are served, the records go through /library
+        """
+        name = os.path.normpath(name)
+        parts = name.split(os.sep)
+        if os.path.isabs(name) or len(parts) < 2 or ".." in parts:
+            return None
+        return self.root + name
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Endpoints of the library server - keeps connections alive for the pooled clients"""
+
+    protocol_version = "HTTP/1.1"
+    server: LibraryServer
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, data: dict, status: int = 200) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"), {"Content-Type": "application/json"})
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _route(self) -> tuple[str, str]:
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip("/")
+        if path.startswith("files/"):
+            return "files", path[len("files/") :]
+        return path, ""
+
+    def do_GET(self) -> None:
+        route, name = self._route()
+        if route == "signature":
+            with self.server.lock:
+                empty = not self.server.has_library()
+                signature = self.server.signature()
+            self._send_json({"signature": signature, "empty": empty})
+        elif route == "library":
+            with self.server.lock:
+                signature, body = self.server.library()
+            if self.headers.get("If-None-Match") == signature:
+                self._send(304, headers={"ETag": signature})
+            else:
+                self._send(200, body, {"ETag": signature, "Content-Type": "application/json"})
+        elif route == "files":
+            self._get_file(name)
+        else:
+            self._send(404)
+
+    def _get_file(self, name: str) -> None:
+        path = self.server.file_path(name)
+        if path is None:
+            self._send(403)
+            return
+        try:
+            with open(path, "rb") as source:
+                stat = os.fstat(source.fileno())
+                etag = file_etag(stat)
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, headers={"ETag": etag})
+                    return
+                body = source.read()
+        except FileNotFoundError:
+            self._send(404)
+            return
+        self._send(200, body, {"ETag": etag, "Content-Type": "application/octet-stream"})
+
+    def do_PUT(self) -> None:
+        route, name = self._route()
+        body = self._body()
+        if route == "library":
+            self.server.replace(json.loads(body))
+            self._send_json({})
+        elif route == "files":
+            path = self.server.file_path(name)
+            if path is None:
+                self._send(403)
+                return
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Replaces instead of writing into path - it may be linked into the blob store
+            fileio.atomic_write(path, body)
+            self._send(200, headers={"ETag": file_etag(os.stat(path))})
+        else:
+            self._send(404)
+
+    def do_DELETE(self) -> None:
+        route, name = self._route()
+        path = self.server.file_path(name) if route == "files" else None
+        if path is None:
+            self._send(403 if route == "files" else 404)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            self._send(404)
+            return
+        self._send(200)
+
+    def do_POST(self) -> None:
+        route, _ = self._route()
+        payload = json.loads(self._body() or b"{}")
+        if route == "records":
+            self._send_json(self.server.apply(payload["records"], payload.get("base", {})))
+        elif route == "stat":
+            files = {}
+            for name in payload.get("names", []):
+                path = self.server.file_path(name)
+                try:
+                    stat = os.stat(path) if path else None
+                except OSError:
+                    stat = None
+                files[name] = (
+                    {"mtime": stat.st_mtime_ns, "size": stat.st_size, "etag": file_etag(stat)}
+                    if stat
+                    else None
+                )
+            self._send_json({"files": files})
+        else:
+            self._send(404)
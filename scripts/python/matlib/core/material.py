@@ -313,3 +313,42 @@ class Material:
         if name:
             self.name = name
         self.set_current_date()
+
+
+class MaterialRows(list):
+    """
+    The Materials of a model, built from their asset dicts on first access
+    Opening a large library only builds the Materials of the rows that are displayed or edited
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = super().__getitem__(index)
+        if isinstance(item, dict):
+            item = Material.from_dict(item)
+            super().__setitem__(index, item)
+        return item
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def mat_id(self, row: int) -> str:
+        """Return the id of a row without building its Material"""
+        item = super().__getitem__(row)
+        return str(item["id"]) if isinstance(item, dict) else item.mat_id
+
+    def ids(self) -> list[str]:
+        """Return the ids of all rows without building their Materials"""
+        return [self.mat_id(row) for row in range(len(self))]
+
+    def favorite(self, row: int) -> bool:
+        """Return the favorite state of a row without building its Material"""
+        item = super().__getitem__(row)
+        return bool(item["favorite"]) if isinstance(item, dict) else item.fav
+
+    def record(self, row: int) -> dict:
+        """Return a row as stored in the database"""
+        item = super().__getitem__(row)
+        return item if isinstance(item, dict) else item.get_as_dict()
@@ -0,0 +1,91 @@
+"""
+Schema Migrations for the MatLib Database
+Pure data steps applied in memory on load - every step upgrades the library data by one schema version
+"""
+
+from collections.abc import Callable
+
+SCHEMA_VERSION = 2
+
+# Libraries written before library.json carried a schema_version
+UNVERSIONED = 1
+
+# Migration steps keyed by the version they upgrade from
+_migrations: dict[int, Callable[[dict], None]] = {}
+
+
+def migration(from_version: int) -> Callable:
+    """Register a function as the step upgrading library data from from_version to the next version"""
+
+    def register(step: Callable[[dict], None]) -> Callable[[dict], None]:
+        _migrations[from_version] = step
+        return step
+
+    return register
+
+
+def version(data: dict) -> int:
+    """Return the schema version of the given library data"""
+    return data.get("schema_version", UNVERSIONED)
+
+
+def is_current(data: dict) -> bool:
+    """Return True if the library data needs no migration"""
+    return data.get("schema_version", UNVERSIONED) == SCHEMA_VERSION
+
+
+def migrate(data: dict) -> bool:
+    """
+    Bring library data up to SCHEMA_VERSION in place
+    Data written by a newer MatLib is left untouched
+
+    :param data: Library data as loaded from disk
+    :type data: dict
+    :return: True if the data has been migrated and should be written back
+    :rtype: bool
+    """
+    current = version(data)
+    if current == SCHEMA_VERSION:
+        return False
+    if current > SCHEMA_VERSION:
+        print(
+            f"MatLib: Library schema {current} is newer than {SCHEMA_VERSION} - please update MatLib"
+        )
+        return False
+
+    while current < SCHEMA_VERSION:
+        _migrations[current](data)
+        current += 1
+
+    # The version goes first so a streamed load knows it before the assets
+    members = [(k, v) for k, v in data.items() if k != "schema_version"]
+    data.clear()
+    data["schema_version"] = current
+    data.update(members)
+    return True
+
+
+ASSET_DEFAULTS = {
+    "name": "",
+    "categories": [],
+    "tags": [],
+    "favorite": False,
+    "date": "",
+    "renderer": "",
+    "usd": 1,
+    "builder": 0,
+}
+
+
+@migration(1)
+def _complete_assets(data: dict) -> None:
+    """Give every asset all keys with string ids and the current renderer names"""
+    data.setdefault("categories", ["_All"])
+    data.setdefault("tags", [])
+    for asset in data.setdefault("assets", []):
+        asset["id"] = str(asset["id"])
+        for key, default in ASSET_DEFAULTS.items():
+            if key not in asset:
+                asset[key] = list(default) if isinstance(default, list) else default
+        if "matx" in str(asset["renderer"]).lower():
+            asset["renderer"] = "MaterialX"
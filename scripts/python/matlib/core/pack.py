@@ -0,0 +1,384 @@
+"""
+Pack Archives for moving MatLib Libraries between Sites
+A .matlibpack streams the library records and the .mat, .interface and image file of every asset
+into one file, the table of contents at the end allows extracting single assets without reading
+the whole pack
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import posixpath
+import struct
+import zlib
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, BinaryIO
+
+from matlib.core import blob_store, database, fileio, journal
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+PACK_EXT = ".matlibpack"
+MAGIC = b"MATLIBPK"
+TOC_MAGIC = b"MATLIBTC"
+FORMAT_VERSION = 1
+RECORDS_ENTRY = "library.json"
+CHUNK = 1024 * 1024
+
+_HEADER = struct.Struct("<8sI")
+# offset and length of the table of contents, magic
+_TRAILER = struct.Struct("<QQ8s")
+
+STORED = 0
+DEFLATED = 1
+# Images are compressed already
+_DEFLATE_ROLES = ("mat", "interface", None)
+
+
+def check_id(mat_id) -> str:
+    """
+    Return an asset id of a pack as a string - raises ValueError if it could leave the library
+    Ids become file names, a pack from another site must not be able to point outside the target
+    """
+    mat_id = str(mat_id)
+    if not mat_id or mat_id in (".", "..") or any(c in mat_id for c in "/\\:\0"):
+        raise ValueError(f"MatLib: {mat_id!r} is not a valid asset id")
+    return mat_id
+
+
+def check_name(name: str) -> str:
+    """Return a file name of a pack - raises ValueError for absolute names and ".." parts"""
+    parts = name.replace("\\", "/").split("/")
+    if not name or posixpath.isabs(name) or ":" in parts[0] or ".." in parts:
+        raise ValueError(f"MatLib: {name!r} is not a valid file name in a pack")
+    return name
+
+
+def select_assets(
+    data: dict,
+    categories: Iterable[str] = (),
+    tags: Iterable[str] = (),
+    ids: Iterable[str] = (),
+) -> list[dict]:
+    """
+    Return the assets matching any of the given Categories, Tags or ids - all if none is given
+
+    :param data: Library data
+    :type data: dict
+    :return: The selected assets in library order
+    :rtype: list[dict]
+    """
+    categories, tags, ids = set(categories), set(tags), {str(i) for i in ids}
+    assets = data.get("assets", [])
+    if not (categories or tags or ids):
+        return list(assets)
+    return [
+        a
+        for a in assets
+        if journal.asset_key(a) in ids
+        or categories.intersection(a.get("categories", []))
+        or tags.intersection(a.get("tags", []))
+    ]
+
+
+class PackWriter:
+    """
+    Writes a pack front to back - works on pipes and sockets as nothing is seeked
+    Use as a context manager or call close() to write the table of contents
+    """
+
+    def __init__(self, target: str | BinaryIO) -> None:
+        if isinstance(target, str):
+            self._tmp_path = target + ".tmp"
+            self._path = target
+            self._file = open(self._tmp_path, "wb")
+        else:
+            self._tmp_path = None
+            self._path = None
+            self._file = target
+        self._offset = 0
+        self._entries = []
+        self._write(_HEADER.pack(MAGIC, FORMAT_VERSION))
+
+    def __enter__(self) -> PackWriter:
+        return self
+
+    def __exit__(self, exc_type, *args) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self._offset += len(data)
+
+    def add(
+        self,
+        name: str,
+        source: bytes | str,
+        mat_id: str | None = None,
+        role: str | None = None,
+    ) -> None:
+        """
+        Append a file to the pack
+
+        :param name: Path of the file inside the library, e.g. "mat/123.mat"
+        :type name: str
+        :param source: Content or the path of the file to read it from in chunks
+        :type source: bytes | str
+        :param mat_id: Id of the asset the file belongs to
+        :type mat_id: str | None
+        :param role: Role of the file in the asset - "mat", "interface" or "image"
+        :type role: str | None
+        """
+        method = DEFLATED if role in _DEFLATE_ROLES else STORED
+        compressor = zlib.compressobj(6) if method == DEFLATED else None
+        offset = self._offset
+        size = 0
+        crc = 0
+
+        def chunks():
+            if isinstance(source, bytes):
+                yield source
+                return
+            with open(source, "rb") as source_file:
+                while chunk := source_file.read(CHUNK):
+                    yield chunk
+
+        for chunk in chunks():
+            size += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            self._write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            self._write(compressor.flush())
+        self._entries.append(
+            {
+                "name": name,
+                "id": mat_id,
+                "role": role,
+                "offset": offset,
+                "stored": self._offset - offset,
+                "size": size,
+                "method": method,
+                "crc": crc,
+            }
+        )
+
+    def close(self) -> None:
+        """Write the table of contents and finish the pack"""
+        toc = zlib.compress(json.dumps({"entries": self._entries}).encode("utf-8"))
+        offset = self._offset
+        self._write(toc)
+        self._write(_TRAILER.pack(offset, len(toc), TOC_MAGIC))
+        if self._tmp_path:
+            self._file.close()
+            os.replace(self._tmp_path, self._path)
+
+    def abort(self) -> None:
+        """Drop a pack that has not been finished"""
+        if self._tmp_path:
+            self._file.close()
+            os.remove(self._tmp_path)
+
+
+class PackReader:
+    """
+    Random access to the files of a pack
+    Only the table of contents is read on open, every file is read from its own offset
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._file = open(path, "rb")
+        try:
+            magic, version = _HEADER.unpack(self._file.read(_HEADER.size))
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"MatLib: {path} is not a pack of version {FORMAT_VERSION}")
+            self._file.seek(-_TRAILER.size, os.SEEK_END)
+            offset, length, toc_magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+            if toc_magic != TOC_MAGIC:
+                raise ValueError(f"MatLib: {path} is incomplete - it has no table of contents")
+            self._file.seek(offset)
+            toc = json.loads(zlib.decompress(self._file.read(length)))
+        except (OSError, struct.error, zlib.error, ValueError):
+            self._file.close()
+            raise
+        self._entries = {e["name"]: e for e in toc["entries"]}
+        self._assets = {}
+        for entry in toc["entries"]:
+            if entry["id"] is not None:
+                self._assets.setdefault(entry["id"], {})[entry["role"]] = entry
+        self._records = None
+
+    def __enter__(self) -> PackReader:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._file.close()
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._entries)
+
+    def read(self, name: str) -> bytes:
+        """Return the content of a file in the pack"""
+        entry = self._entries[name]
+        self._file.seek(entry["offset"])
+        data = self._file.read(entry["stored"])
+        if entry["method"] == DEFLATED:
+            data = zlib.decompress(data)
+        if zlib.crc32(data) != entry["crc"] or len(data) != entry["size"]:
+            raise ValueError(f"MatLib: {name} in {self._path} is corrupt")
+        return data
+
+    def records(self) -> dict:
+        """Return the Categories, Tags and asset records of the pack"""
+        if self._records is None:
+            self._records = json.loads(self.read(RECORDS_ENTRY))
+        return self._records
+
+    def asset_files(self, mat_id: str) -> dict[str, str]:
+        """
+        Return the names of the files of an asset in the pack keyed by their role
+        Raises ValueError for an invalid id and for files that do not belong to the asset
+        """
+        mat_id = check_id(mat_id)
+        files = {}
+        for role, entry in self._assets.get(mat_id, {}).items():
+            name = check_name(entry["name"])
+            # Asset directory and extensions may differ between sites, the id may not
+            if role not in fileio.LibraryLayout.ROLES or not posixpath.basename(
+                name.replace("\\", "/")
+            ).startswith(mat_id + "."):
+                raise ValueError(f"MatLib: {name} in {self._path} does not belong to {mat_id}")
+            files[role] = name
+        return files
+
+    def extract_asset(
+        self, mat_id: str, directory: str, layout: fileio.LibraryLayout | None = None
+    ) -> list[str]:
+        """
+        Write the files of a single asset into directory with the library layout
+        The target files are named by the layout, never by the names stored in the pack
+
+        :param mat_id: Id of the asset
+        :type mat_id: str
+        :param directory: Target directory
+        :type directory: str
+        :param layout: Layout of the target - the default layout of directory if None
+        :type layout: fileio.LibraryLayout | None
+        :return: The written files
+        :rtype: list[str]
+        """
+        layout = layout or fileio.LibraryLayout(directory)
+        targets = layout.asset_files(mat_id)
+        written = []
+        for role, name in self.asset_files(mat_id).items():
+            path = targets[role]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fileio.atomic_write(path, self.read(name))
+            written.append(path)
+        return written
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> LibraryPacker:
+    """Return the packer for the library in the preferences - or in directory if given"""
+    return LibraryPacker(fileio.LibraryLayout.from_prefs(preferences, directory))
+
+
+class LibraryPacker:
+    """Exports assets of one library into packs and imports packs into it"""
+
+    def __init__(self, layout: fileio.LibraryLayout) -> None:
+        self._layout = layout
+        self._path = layout.path
+
+    def export(self, target: str | BinaryIO, assets: list[dict] | None = None) -> int:
+        """
+        Stream assets and their files into a pack
+
+        :param target: Pack file or a writable binary stream
+        :type target: str | BinaryIO
+        :param assets: Assets to export, e.g. from select_assets() - the whole library if None
+        :type assets: list[dict] | None
+        :return: Number of exported assets
+        :rtype: int
+        """
+        data = database.connect(self._path).load()
+        if assets is None:
+            assets = data.get("assets", [])
+        used_categories = {c for a in assets for c in a.get("categories", [])}
+        used_tags = {t for a in assets for t in a.get("tags", [])}
+        records = {
+            "categories": [c for c in data.get("categories", []) if c in used_categories],
+            "tags": [t for t in data.get("tags", []) if t in used_tags],
+            "assets": [journal.copy_asset(a) for a in assets],
+        }
+        with PackWriter(target) as writer:
+            writer.add(RECORDS_ENTRY, json.dumps(records, indent=4).encode("utf-8"))
+            for asset in assets:
+                key = journal.asset_key(asset)
+                for role, name in self._layout.asset_names(key).items():
+                    if os.path.exists(self._path + name):
+                        writer.add(name, self._path + name, key, role)
+        return len(assets)
+
+    def import_pack(self, path: str, overwrite: bool = False) -> tuple[int, int]:
+        """
+        Merge a pack into the library
+        New assets are added, Categories and Tags of the pack are added to the library
+
+        :param path: Pack file
+        :type path: str
+        :param overwrite: Replace assets the library already has - they are skipped otherwise
+        :type overwrite: bool
+        :return: Number of added and replaced assets
+        :rtype: tuple[int, int]
+        """
+        connection = database.connect(self._path)
+        data = connection.load()
+        existing = {journal.asset_key(a) for a in data.get("assets", [])}
+        store = None
+        if os.path.isdir(self._path + blob_store.MANIFEST_DIR):
+            store = blob_store.BlobStore(self._layout)
+        added = 0
+        replaced = 0
+        with PackReader(path) as reader:
+            records = reader.records()
+            assets = [
+                a for a in records["assets"] if overwrite or journal.asset_key(a) not in existing
+            ]
+            # Validate everything before the first file is written
+            files = {}
+            for asset in assets:
+                key = check_id(journal.asset_key(asset))
+                files[key] = reader.asset_files(key)
+            # Files first - the records never point to missing files
+            for asset in assets:
+                key = journal.asset_key(asset)
+                names = self._layout.asset_names(key)
+                for role, name in files[key].items():
+                    target = self._path + names[role]
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    # Replaces the file - a blob it is linked to stays untouched
+                    fileio.atomic_write(target, reader.read(name))
+                if store:
+                    store.add_asset(key)
+
+        with connection.transaction():
+            connection.add_categories(records["categories"])
+            connection.add_tags(records["tags"])
+            for asset in assets:
+                if journal.asset_key(asset) in existing:
+                    connection.update_asset(asset)
+                    replaced += 1
+                else:
+                    connection.add_asset(asset)
+                    added += 1
+        return added, replaced
@@ -0,0 +1,222 @@
+"""
+Read-through Local Cache for MatLib Libraries on Network Shares
+Files of the library are mirrored into a local cache directory on first read,
+entries are validated against size and mtime on the share and evicted least recently used first.
+Writes always go to the share
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+
+from matlib.core import fileio
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+INDEX_FILE = "index.json"
+# A directory listing is trusted for this many seconds before files are checked again
+LISTING_TTL = 2.0
+
+# One cache per cache directory and library - shared by all models and threads of a session
+_caches = {}
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> ReadCache | None:
+    """
+    Return the cache of the library in the preferences - None if it is switched off
+    Pass directory for a library other than the one in the preferences
+    """
+    if not preferences.read_cache:
+        return None
+    directory = directory or preferences.dir
+    cache_dir = os.path.expanduser(os.path.expandvars(preferences.read_cache))
+    key = (os.path.normcase(os.path.abspath(cache_dir)), os.path.abspath(directory))
+    cache = _caches.get(key)
+    if cache is None:
+        cache = _caches[key] = ReadCache(cache_dir, directory)
+    cache.max_bytes = preferences.read_cache_size * 1024 * 1024
+    return cache
+
+
+class ReadCache:
+    """
+    Local copies of the files of one library
+    The index maps each cached file to the size and mtime its source had when it was copied
+    """
+
+    def __init__(self, cache_dir: str, library_dir: str, max_bytes: int = 2 << 30) -> None:
+        self._library = os.path.join(os.path.abspath(library_dir), "")
+        library_key = hashlib.sha1(self._library.encode("utf-8")).hexdigest()[:16]
+        self._path = os.path.join(cache_dir, library_key, "")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Relative path -> [size, mtime_ns] of the source - ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._size = 0
+        self._changed = False
+        # Relative path -> (size, mtime_ns) of the share from the last listing per directory
+        self._listing = {}
+        self._listed = {}
+        self._load_index()
+        atexit.register(self.save_index)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def size(self) -> int:
+        """Bytes currently held in the cache"""
+        return self._size
+
+    def _load_index(self) -> None:
+        try:
+            with open(self._path + INDEX_FILE, encoding="utf-8") as index_file:
+                entries = json.load(index_file)["entries"]
+        except (OSError, ValueError, KeyError):
+            return
+        for rel_path, signature in entries:
+            # Cached files removed behind our back are dropped
+            if os.path.exists(self._path + rel_path):
+                self._entries[rel_path] = signature
+                self._size += signature[0]
+
+    def save_index(self) -> None:
+        """Write the index with the order of use - done once at exit"""
+        with self._lock:
+            if not self._changed:
+                return
+            entries = [[rel_path, signature] for rel_path, signature in self._entries.items()]
+            self._changed = False
+        os.makedirs(self._path, exist_ok=True)
+        fileio.atomic_write(
+            self._path + INDEX_FILE, json.dumps({"entries": entries}).encode("utf-8")
+        )
+
+    def _relative(self, path: str) -> str | None:
+        path = os.path.abspath(path)
+        if not path.startswith(self._library):
+            return None
+        return path[len(self._library) :].replace(os.sep, "/")
+
+    def refresh(self, directories: list[str]) -> None:
+        """
+        List the given directories of the share once and validate the following reads against it
+        Call before reading many files, e.g. all thumbnails of the library
+
+        :param directories: Directories of the library, e.g. the image directory
+        :type directories: list[str]
+        """
+        now = time.monotonic()
+        for directory in directories:
+            rel_dir = self._relative(directory)
+            if not rel_dir:
+                continue
+            # Keyed like the directory part of the cached paths
+            rel_dir += "/"
+            listing = {}
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue
+                        listing[rel_dir + entry.name] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+            with self._lock:
+                self._listing = {
+                    k: v
+                    for k, v in self._listing.items()
+                    if not (k.startswith(rel_dir) and "/" not in k[len(rel_dir) :])
+                }
+                self._listing.update(listing)
+                self._listed[rel_dir] = now
+
+    def _signature(self, rel_path: str, path: str) -> tuple[int, int] | None:
+        """Size and mtime of the file on the share - from a recent listing if there is one"""
+        rel_dir = rel_path[: rel_path.rfind("/") + 1]
+        with self._lock:
+            listed = self._listed.get(rel_dir)
+            if listed is not None and time.monotonic() - listed < LISTING_TTL:
+                return self._listing.get(rel_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def fetch(self, path: str) -> str:
+        """
+        Return a local copy of a file of the library
+        The file is copied from the share on first access or if it has changed there
+
+        :param path: File on the share
+        :type path: str
+        :return: The cached file - path itself if it is not part of the library or can't be cached
+        :rtype: str
+        """
+        rel_path = self._relative(path)
+        if rel_path is None:
+            return path
+        signature = self._signature(rel_path, path)
+        if signature is None:
+            return path
+        local = self._path + rel_path
+        with self._lock:
+            cached = self._entries.get(rel_path)
+            if cached is not None and tuple(cached) == signature:
+                self._entries.move_to_end(rel_path)
+                self._changed = True
+                return local
+        if signature[0] > self.max_bytes:
+            return path
+
+        try:
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            tmp_path = f"{local}.{threading.get_ident()}.tmp"
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, local)
+        except OSError:
+            return path
+        with self._lock:
+            previous = self._entries.pop(rel_path, None)
+            if previous is not None:
+                self._size -= previous[0]
+            self._entries[rel_path] = list(signature)
+            self._size += signature[0]
+            self._changed = True
+            evicted = self._evict()
+        for rel_evicted in evicted:
+            try:
+                os.remove(self._path + rel_evicted)
+            except OSError:
+                pass
+        return local
+
+    def _evict(self) -> list[str]:
+        """Drop the least recently used entries until the cache fits - the caller holds the lock"""
+        evicted = []
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            rel_path, signature = self._entries.popitem(last=False)
+            self._size -= signature[0]
+            evicted.append(rel_path)
+        return evicted
+
+    def clear(self) -> None:
+        """Remove all cached files of the library"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._changed = False
+        shutil.rmtree(self._path, ignore_errors=True)
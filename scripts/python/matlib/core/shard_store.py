@@ -0,0 +1,215 @@
+"""
+Sharded Storage for the MatLib Database
+Every asset record lives in a small sidecar next to its .mat/.interface files,
+a lightweight index lists the asset ids together with Categories and Tags
+"""
+
+import os
+
+from matlib.core import fileio, journal
+
+INDEX_FILE = "library.index.json"
+SIDECAR_EXT = ".meta.json"
+
+
+class ShardStore:
+    """
+    Sharded Storage for the MatLib Database
+    Reads and writes the same dicts as library.json - an edited asset only rewrites its own sidecar
+    """
+
+    def __init__(self, directory: str, asset_dir: str, lock_path: str) -> None:
+        self._path = directory + INDEX_FILE
+        self._asset_path = directory + asset_dir
+        self._lock_path = lock_path
+        # Index as last read or written by this session - base for merging the lists
+        self._index = {"categories": [], "tags": [], "assets": []}
+        # Sidecars already parsed: id -> (stat signature, asset)
+        self._cache = {}
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def close(self) -> None:
+        self._cache = {}
+
+    def is_empty(self) -> bool:
+        """Return True if nothing has been written to this store yet"""
+        return not os.path.exists(self._path)
+
+    def count(self) -> int:
+        """Return the number of assets"""
+        return len(self._index["assets"])
+
+    def sidecar_path(self, asset_id: str) -> str:
+        """Return the sidecar file of the given asset"""
+        return self._asset_path + str(asset_id) + SIDECAR_EXT
+
+    def signature(self) -> tuple:
+        """
+        Cheap change detection for edits of other sessions
+        Replacing a sidecar changes the mtime of the asset directory
+        """
+        return (
+            fileio.stat_signature(self._path),
+            fileio.stat_signature(self._asset_path),
+        )
+
+    def read_all(self) -> dict:
+        """
+        Read the whole library in the same layout as library.json
+        Only sidecars changed since the last read are parsed again
+
+        :return: Library data
+        :rtype: dict
+        """
+        self._index = self._read_index()
+        assets = []
+        cache = {}
+        for asset_id in self._index["assets"]:
+            path = self.sidecar_path(asset_id)
+            signature = fileio.stat_signature(path)
+            cached = self._cache.get(asset_id)
+            if cached and cached[0] == signature:
+                asset = cached[1]
+            else:
+                try:
+                    asset = fileio.load_json(path)[0]
+                except (OSError, ValueError) as error:
+                    print(f"MatLib: Skipping asset {asset_id} - {error}")
+                    continue
+            cache[asset_id] = (signature, asset)
+            assets.append(journal.copy_asset(asset))
+        self._cache = cache
+        data = {
+            "categories": list(self._index["categories"]),
+            "tags": list(self._index["tags"]),
+            "assets": assets,
+        }
+        for key in ("schema_version", "revision"):
+            if key in self._index:
+                data[key] = self._index[key]
+        return data
+
+    def write_all(self, data: dict) -> None:
+        """Replace everything in the store with the given library data"""
+        ids = []
+        seen = set()
+        for asset in data.get("assets", []):
+            if str(asset["id"]) in seen:
+                continue
+            seen.add(str(asset["id"]))
+            self._write_sidecar(asset)
+            ids.append(str(asset["id"]))
+        index = {
+            "categories": list(data.get("categories", [])),
+            "tags": list(data.get("tags", [])),
+            "assets": ids,
+            "revision": data.get("revision", 0),
+        }
+        if "schema_version" in data:
+            index["schema_version"] = data["schema_version"]
+        with fileio.FileLock(self._lock_path):
+            removed = set(self._read_index()["assets"]) - set(ids)
+            self._write_index(index)
+            for asset_id in removed:
+                self._remove_sidecar(asset_id)
+
+    def apply(self, records: list[dict]) -> None:
+        """
+        Apply journal records (see core/journal.py)
+        Changed assets only touch their sidecar - the index is rewritten under the lock
+        if assets were added or removed or Categories or Tags changed
+
+        :param records: Journal records
+        :type records: list[dict]
+        """
+        known = set(self._index["assets"])
+        index_records = []
+        for record in records:
+            if record["op"] == "asset":
+                self._write_sidecar(record["value"])
+                if journal.asset_key(record["value"]) not in known:
+                    index_records.append(record)
+            else:
+                index_records.append(record)
+        if not index_records:
+            return
+
+        with fileio.FileLock(self._lock_path):
+            theirs = self._read_index()
+            ids = theirs["assets"]
+            present = set(ids)
+            removed = set()
+            for record in index_records:
+                op = record["op"]
+                if op in ("categories", "tags"):
+                    theirs[op] = journal.merge_list(
+                        self._index[op], record["value"], theirs[op]
+                    )
+                elif op == "revision":
+                    theirs["revision"] = record["value"]
+                elif op == "asset":
+                    key = journal.asset_key(record["value"])
+                    if key not in present:
+                        present.add(key)
+                        ids.append(key)
+                elif op == "remove":
+                    removed.add(str(record["id"]))
+            if removed:
+                theirs["assets"] = [i for i in ids if i not in removed]
+            self._write_index(theirs)
+            for asset_id in removed:
+                self._remove_sidecar(asset_id)
+
+    def _read_index(self) -> dict:
+        index = {"categories": [], "tags": [], "assets": []}
+        if os.path.exists(self._path):
+            index.update(fileio.load_json(self._path)[0])
+        return index
+
+    def _write_index(self, index: dict) -> None:
+        fileio.atomic_write(self._path, fileio.encode_json(index, "compact"))
+        self._index = index
+
+    def _write_sidecar(self, asset: dict) -> None:
+        os.makedirs(self._asset_path, exist_ok=True)
+        path = self.sidecar_path(asset["id"])
+        fileio.atomic_write(path, fileio.encode_json(asset))
+        self._cache[str(asset["id"])] = (
+            fileio.stat_signature(path),
+            journal.copy_asset(asset),
+        )
+
+    def _remove_sidecar(self, asset_id: str) -> None:
+        self._cache.pop(asset_id, None)
+        path = self.sidecar_path(asset_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def import_json(
+    json_path: str, directory: str, asset_dir: str, lock_path: str
+) -> ShardStore:
+    """
+    One-Shot Import of an existing library.json into sidecars and an index
+
+    :param json_path: Path to library.json - compressed files are supported
+    :type json_path: str
+    :param directory: Library directory
+    :type directory: str
+    :param asset_dir: Asset directory relative to the library, e.g. mat/
+    :type asset_dir: str
+    :param lock_path: Lock file shared by all sessions working on the library
+    :type lock_path: str
+    :return: The filled Store
+    :rtype: ShardStore
+    """
+    data = fileio.load_json(json_path)[0]
+    store = ShardStore(directory, asset_dir, lock_path)
+    store.write_all(data)
+    print(
+        f"MatLib: Split {len(data.get('assets', []))} assets from {json_path} into {asset_dir}*{SIDECAR_EXT}"
+    )
+    return store
@@ -0,0 +1,343 @@
+"""
+SQLite Storage for the MatLib Database
+Stores Assets, Categories and Tags in indexed tables instead of a single json file
+"""
+
+import json
+import os
+import sqlite3
+import urllib.parse
+
+from matlib.core import fileio
+
+SQLITE_FILE = "library.sqlite"
+
+# Asset keys that have their own column - everything else goes to "extra"
+ASSET_COLUMNS = ("id", "name", "favorite", "date", "renderer", "usd", "builder")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    name TEXT,
+    favorite INTEGER,
+    date TEXT,
+    renderer TEXT,
+    usd INTEGER,
+    builder INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_assets_position ON assets(position);
+CREATE INDEX IF NOT EXISTS idx_assets_name ON assets(name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_assets_renderer ON assets(renderer COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_assets_favorite ON assets(favorite);
+CREATE INDEX IF NOT EXISTS idx_assets_date ON assets(date);
+
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS asset_categories (
+    asset_id TEXT NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_asset_categories_asset ON asset_categories(asset_id);
+CREATE INDEX IF NOT EXISTS idx_asset_categories_category
+    ON asset_categories(category COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS asset_tags (
+    asset_id TEXT NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    position INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_asset_tags_asset ON asset_tags(asset_id);
+CREATE INDEX IF NOT EXISTS idx_asset_tags_tag ON asset_tags(tag COLLATE NOCASE);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteStore:
+    """
+    SQLite Storage for the MatLib Database
+    Reads and writes the same dicts as library.json but allows indexed queries
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+
+    @classmethod
+    def read_only(cls, path: str) -> "SQLiteStore":
+        """
+        Open an existing store for reading only - creates no files and never changes the schema
+        Without a write-ahead log nothing outside the database file has to be read
+        """
+        store = cls.__new__(cls)
+        store._path = path
+        mode = "ro" if os.path.exists(path + "-wal") else "ro&immutable=1"
+        uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=" + mode
+        store._conn = sqlite3.connect(uri, uri=True)
+        return store
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def signature(self) -> tuple:
+        """Cheap change detection for writes of other sessions"""
+        return (
+            fileio.stat_signature(self._path),
+            fileio.stat_signature(self._path + "-wal"),
+        )
+
+    def is_empty(self) -> bool:
+        """Return True if nothing has been written to this store yet"""
+        row = self._conn.execute(
+            "SELECT (SELECT count(*) FROM assets) + (SELECT count(*) FROM categories)"
+        ).fetchone()
+        return row[0] == 0
+
+    def count(self) -> int:
+        """Return the number of assets"""
+        return self._conn.execute("SELECT count(*) FROM assets").fetchone()[0]
+
+    def categories(self) -> list[str]:
+        """Return the library categories in order"""
+        rows = self._conn.execute("SELECT name FROM categories ORDER BY position")
+        return [r[0] for r in rows]
+
+    def tags(self) -> list[str]:
+        """Return the library tags in order"""
+        rows = self._conn.execute("SELECT name FROM tags ORDER BY position")
+        return [r[0] for r in rows]
+
+    def read_all(self) -> dict:
+        """
+        Read the whole library in the same layout as library.json
+
+        :return: Library data
+        :rtype: dict
+        """
+        cats = self._grouped("asset_categories", "category")
+        tags = self._grouped("asset_tags", "tag")
+        rows = self._conn.execute(
+            "SELECT id, name, favorite, date, renderer, usd, builder, extra "
+            "FROM assets ORDER BY position"
+        )
+        assets = [self._row_to_asset(row, cats, tags) for row in rows]
+        data = {"categories": self.categories(), "tags": self.tags(), "assets": assets}
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'schema_version'"
+        ).fetchone()
+        if row:
+            data["schema_version"] = int(row[0])
+        return data
+
+    def query(
+        self,
+        category: str | None = None,
+        tag: str | None = None,
+        renderer: str | None = None,
+        favorite: bool | None = None,
+        name: str | None = None,
+    ) -> list[dict]:
+        """
+        Return all assets matching the given filters
+        Category and Tag have to match exactly (case insensitive), Renderer and Name match substrings
+
+        :return: Matching assets in library order
+        :rtype: list[dict]
+        """
+        clauses = []
+        params = []
+        if category is not None:
+            clauses.append(
+                "id IN (SELECT asset_id FROM asset_categories WHERE category = ? COLLATE NOCASE)"
+            )
+            params.append(category)
+        if tag is not None:
+            clauses.append(
+                "id IN (SELECT asset_id FROM asset_tags WHERE tag = ? COLLATE NOCASE)"
+            )
+            params.append(tag)
+        if renderer is not None:
+            clauses.append("renderer LIKE ?")
+            params.append(f"%{renderer}%")
+        if favorite is not None:
+            clauses.append("favorite = ?")
+            params.append(int(favorite))
+        if name is not None:
+            clauses.append("name LIKE ?")
+            params.append(f"%{name}%")
+
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        rows = self._conn.execute(
+            "SELECT id, name, favorite, date, renderer, usd, builder, extra "
+            f"FROM assets{where} ORDER BY position",
+            params,
+        ).fetchall()
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        cats = self._grouped("asset_categories", "category", ids)
+        tags = self._grouped("asset_tags", "tag", ids)
+        return [self._row_to_asset(row, cats, tags) for row in rows]
+
+    def write_all(self, data: dict) -> None:
+        """Replace everything in the store with the given library data"""
+        with self._conn:
+            self._conn.execute("DELETE FROM asset_categories")
+            self._conn.execute("DELETE FROM asset_tags")
+            self._conn.execute("DELETE FROM assets")
+            self._set_list("categories", data.get("categories", []))
+            self._set_list("tags", data.get("tags", []))
+            if "schema_version" in data:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                    (str(data["schema_version"]),),
+                )
+            seen = set()
+            for position, asset in enumerate(data.get("assets", [])):
+                if str(asset["id"]) in seen:
+                    continue
+                seen.add(str(asset["id"]))
+                self._insert_asset(asset, position)
+
+    def apply(self, records: list[dict]) -> None:
+        """
+        Apply journal records (see core/journal.py) in a single transaction
+
+        :param records: Journal records
+        :type records: list[dict]
+        """
+        with self._conn:
+            for record in records:
+                op = record["op"]
+                if op in ("categories", "tags"):
+                    self._set_list(op, record["value"])
+                elif op == "asset":
+                    self._upsert_asset(record["value"])
+                elif op == "remove":
+                    self._conn.execute(
+                        "DELETE FROM assets WHERE id = ?", (str(record["id"]),)
+                    )
+
+    def _set_list(self, table: str, values: list[str]) -> None:
+        self._conn.execute(f"DELETE FROM {table}")
+        self._conn.executemany(
+            f"INSERT OR IGNORE INTO {table} (name, position) VALUES (?, ?)",
+            [(v, pos) for pos, v in enumerate(values)],
+        )
+
+    def _upsert_asset(self, asset: dict) -> None:
+        asset_id = str(asset["id"])
+        row = self._conn.execute(
+            "SELECT position FROM assets WHERE id = ?", (asset_id,)
+        ).fetchone()
+        if row:
+            position = row[0]
+            self._conn.execute("DELETE FROM assets WHERE id = ?", (asset_id,))
+        else:
+            position = self._conn.execute(
+                "SELECT coalesce(max(position) + 1, 0) FROM assets"
+            ).fetchone()[0]
+        self._insert_asset(asset, position)
+
+    def _insert_asset(self, asset: dict, position: int) -> None:
+        asset_id = str(asset["id"])
+        extra = {k: v for k, v in asset.items() if k not in ASSET_COLUMNS}
+        extra.pop("categories", None)
+        extra.pop("tags", None)
+        self._conn.execute(
+            "INSERT INTO assets (id, position, name, favorite, date, renderer, usd, builder, extra) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                asset_id,
+                position,
+                asset.get("name", ""),
+                int(bool(asset.get("favorite", False))),
+                str(asset.get("date", "")),
+                asset.get("renderer", ""),
+                asset.get("usd", 1),
+                asset.get("builder", 0),
+                json.dumps(extra) if extra else None,
+            ),
+        )
+        self._conn.executemany(
+            "INSERT INTO asset_categories (asset_id, category, position) VALUES (?, ?, ?)",
+            [(asset_id, c, pos) for pos, c in enumerate(asset.get("categories") or [])],
+        )
+        self._conn.executemany(
+            "INSERT INTO asset_tags (asset_id, tag, position) VALUES (?, ?, ?)",
+            [(asset_id, t, pos) for pos, t in enumerate(asset.get("tags") or [])],
+        )
+
+    def _grouped(
+        self, table: str, column: str, ids: list[str] | None = None
+    ) -> dict[str, list[str]]:
+        """Return the join table values grouped by asset id"""
+        sql = f"SELECT asset_id, {column} FROM {table}"
+        params = []
+        # Stay below SQLite's limit of host parameters - grouping everything is cheap enough then
+        if ids is not None and len(ids) <= 900:
+            sql += f" WHERE asset_id IN ({','.join('?' * len(ids))})"
+            params = ids
+        grouped = {}
+        for asset_id, value in self._conn.execute(sql + " ORDER BY position", params):
+            grouped.setdefault(asset_id, []).append(value)
+        return grouped
+
+    def _row_to_asset(
+        self, row: tuple, cats: dict[str, list[str]], tags: dict[str, list[str]]
+    ) -> dict:
+        asset_id, name, favorite, date, renderer, usd, builder, extra = row
+        asset = {
+            "id": asset_id,
+            "name": name,
+            "categories": cats.get(asset_id, []),
+            "tags": tags.get(asset_id, []),
+            "favorite": bool(favorite),
+            "date": date,
+            "renderer": renderer,
+            "usd": usd,
+            "builder": builder,
+        }
+        if extra:
+            asset.update(json.loads(extra))
+        return asset
+
+
+def import_json(json_path: str, sqlite_path: str) -> SQLiteStore:
+    """
+    One-Shot Import of an existing library.json into a SQLite Store
+
+    :param json_path: Path to library.json - compressed files are supported
+    :type json_path: str
+    :param sqlite_path: Path to the SQLite file - created if needed
+    :type sqlite_path: str
+    :return: The filled Store
+    :rtype: SQLiteStore
+    """
+    data = fileio.load_json(json_path)[0]
+    store = SQLiteStore(sqlite_path)
+    store.write_all(data)
+    print(
+        f"MatLib: Imported {len(data.get('assets', []))} assets from {json_path} to {os.path.basename(sqlite_path)}"
+    )
+    return store
@@ -0,0 +1,315 @@
+"""
+Storage Backends for the MatLib Asset Files
+Houdini and Qt read and write the files of a library in a local directory,
+a backend keeps that directory in step with where the library actually lives:
+the file system (a share, optionally through the read cache) or a MatLib library server
+"""
+
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from matlib.core import fileio, read_cache
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+ETAG_FILE = "library.etags.json"
+POOL_SIZE = 8
+TIMEOUT = 30
+# A file validated by a batched stat request is trusted for this many seconds
+VALIDATED_TTL = 2.0
+
+# One client per server and local directory - shares the connection pool of a session
+_clients = {}
+
+
+def for_prefs(
+    preferences: prefs.Prefs, directory: str | None = None
+) -> FileStorage | HttpStorage:
+    """
+    Return the storage of the library in the preferences
+    Pass directory for another library, e.g. the path of a database connection
+    """
+    directory = directory or preferences.dir
+    if preferences.backend == "http":
+        return HttpStorage.connect(preferences.server_url, directory)
+    return FileStorage(directory, read_cache.for_prefs(preferences, directory))
+
+
+class FileStorage:
+    """
+    Library on a file system - the local directory is the library itself
+    Reads go through the read cache if one is configured
+    """
+
+    remote = False
+
+    def __init__(self, directory: str, cache: read_cache.ReadCache | None = None) -> None:
+        self._path = os.path.join(directory, "")
+        self._cache = cache
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def local_path(self, name: str) -> str:
+        """Return the local file Houdini writes to - name is relative to the library"""
+        return self._path + name
+
+    def fetch(self, name: str) -> str:
+        """Return a local file with the current content of name, e.g. to load or decode it"""
+        path = self._path + name
+        return self._cache.fetch(path) if self._cache else path
+
+    def prefetch(self, names: list[str]) -> None:
+        """Validate many files at once before they are fetched one by one"""
+        if self._cache:
+            directories = dict.fromkeys(os.path.dirname(self._path + n) for n in names)
+            self._cache.refresh(list(directories))
+
+    def publish(self, name: str) -> None:
+        """Make a file written to local_path() available to the other sessions"""
+
+    def remove(self, name: str) -> None:
+        """Remove a file of the library"""
+        try:
+            os.remove(self._path + name)
+        except FileNotFoundError:
+            pass
+
+    def stat(self, names: list[str]) -> dict[str, dict | None]:
+        """Return size and mtime per file - None for missing files"""
+        result = {}
+        for name in names:
+            signature = fileio.stat_signature(self._path + name)
+            result[name] = (
+                {"mtime": signature[0], "size": signature[1]} if signature else None
+            )
+        return result
+
+
+class HttpError(OSError):
+    """Unexpected answer of the library server"""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"MatLib: Library server answered {status} - {message}")
+        self.status = status
+
+
+class HttpStorage:
+    """
+    Library served by a MatLib library server (see core/library_server.py)
+    The local directory mirrors the files that have been used. Files are revalidated with
+    conditional GETs or a batched stat request, connections to the server are pooled
+    """
+
+    remote = True
+
+    def __init__(self, url: str, directory: str) -> None:
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme != "http":
+            raise ValueError(f"MatLib: {url} is not an http url")
+        self._url = url
+        self._host = parts.hostname
+        self._port = parts.port or 80
+        self._base = parts.path.rstrip("/")
+        self._path = os.path.join(directory, "")
+        self._pool = queue.LifoQueue(maxsize=POOL_SIZE)
+        self._lock = threading.Lock()
+        self._etags = self._read_etags()
+        # Name -> time of the last batched validation
+        self._validated = {}
+        self.requests = 0
+
+    @classmethod
+    def connect(cls, url: str, directory: str) -> HttpStorage:
+        """Return the client for the server and local directory - created on first use"""
+        key = (url, os.path.abspath(directory))
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = cls(url, directory)
+        return client
+
+    @property
+    def url(self) -> str:
+        return self._url
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _read_etags(self) -> dict[str, str]:
+        try:
+            with open(self._path + ETAG_FILE, encoding="utf-8") as etag_file:
+                return json.load(etag_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_etags(self) -> None:
+        with self._lock:
+            raw = json.dumps(self._etags).encode("utf-8")
+        os.makedirs(self._path, exist_ok=True)
+        fileio.atomic_write(self._path + ETAG_FILE, raw)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes | None = None,
+        headers: dict | None = None,
+    ) -> tuple[int, dict, bytes]:
+        """
+        Send a request over a pooled keep-alive connection
+        A pooled connection the server has closed in the meantime is replaced once
+
+        :return: Status, headers and body of the response
+        :rtype: tuple[int, dict, bytes]
+        """
+        headers = dict(headers or {})
+        url = self._base + "/" + urllib.parse.quote(path)
+        for attempt in range(2):
+            try:
+                connection = self._pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                connection = http.client.HTTPConnection(self._host, self._port, timeout=TIMEOUT)
+                reused = False
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            self.requests += 1
+            if response.will_close:
+                connection.close()
+            else:
+                try:
+                    self._pool.put_nowait(connection)
+                except queue.Full:
+                    connection.close()
+            return response.status, dict(response.getheaders()), data
+        raise HttpError(0, "no connection")
+
+    def request_json(self, method: str, path: str, payload=None) -> dict:
+        """Send json and return the decoded json answer"""
+        body = None if payload is None else json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        status, _, data = self.request(method, path, body, headers)
+        if status != 200:
+            raise HttpError(status, data.decode("utf-8", "replace"))
+        return json.loads(data)
+
+    def local_path(self, name: str) -> str:
+        """Return the file in the working copy Houdini writes to - its directory is created"""
+        path = self._path + name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def fetch(self, name: str) -> str:
+        """
+        Bring the local copy of a file up to date with a conditional GET and return it
+        Skipped if a batched stat request has validated the file just before.
+        The local copy of a file removed on the server is removed as well
+        """
+        if self._download(name):
+            self._write_etags()
+        return self._path + name
+
+    def _download(self, name: str) -> bool:
+        """Revalidate the local copy of a file - returns True if its etag has changed"""
+        local = self._path + name
+        with self._lock:
+            etag = self._etags.get(name)
+            validated = self._validated.get(name)
+        if etag and validated and time.monotonic() - validated < VALIDATED_TTL:
+            if os.path.exists(local):
+                return False
+        headers = {"If-None-Match": etag} if etag and os.path.exists(local) else {}
+        status, response_headers, data = self.request("GET", "files/" + name, headers=headers)
+        if status == 304:
+            with self._lock:
+                self._validated[name] = time.monotonic()
+            return False
+        if status == 404:
+            with self._lock:
+                self._etags.pop(name, None)
+                self._validated.pop(name, None)
+            try:
+                os.remove(local)
+            except FileNotFoundError:
+                pass
+            return etag is not None
+        if status != 200:
+            raise HttpError(status, name)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        fileio.atomic_write(local, data)
+        with self._lock:
+            self._etags[name] = response_headers.get("ETag", "")
+            self._validated[name] = time.monotonic()
+        return True
+
+    def prefetch(self, names: list[str]) -> None:
+        """
+        Validate many files with one stat request and download the changed ones in parallel
+        Keeps a panel full of thumbnails from sending a request per file
+        """
+        stats = self.stat(names)
+        now = time.monotonic()
+        changed = []
+        with self._lock:
+            for name, entry in stats.items():
+                if entry is None:
+                    continue
+                if entry["etag"] == self._etags.get(name) and os.path.exists(self._path + name):
+                    self._validated[name] = now
+                else:
+                    changed.append(name)
+        with ThreadPoolExecutor(max_workers=POOL_SIZE) as pool:
+            downloaded = list(pool.map(self._download, changed))
+        if any(downloaded):
+            self._write_etags()
+
+    def publish(self, name: str) -> None:
+        """Upload a file written to local_path()"""
+        with open(self._path + name, "rb") as local_file:
+            data = local_file.read()
+        status, headers, answer = self.request("PUT", "files/" + name, data)
+        if status != 200:
+            raise HttpError(status, answer.decode("utf-8", "replace"))
+        with self._lock:
+            self._etags[name] = headers.get("ETag", "")
+            self._validated[name] = time.monotonic()
+        self._write_etags()
+
+    def remove(self, name: str) -> None:
+        status, _, answer = self.request("DELETE", "files/" + name)
+        if status not in (200, 404):
+            raise HttpError(status, answer.decode("utf-8", "replace"))
+        with self._lock:
+            known = self._etags.pop(name, None) is not None
+            self._validated.pop(name, None)
+        if known:
+            self._write_etags()
+        try:
+            os.remove(self._path + name)
+        except FileNotFoundError:
+            pass
+
+    def stat(self, names: list[str]) -> dict[str, dict | None]:
+        """Return size, mtime and etag per file with one request - None for missing files"""
+        if not names:
+            return {}
+        return self.request_json("POST", "stat", {"names": names})["files"]
@@ -0,0 +1,377 @@
+"""
+Manifest-based Sync between MatLib Libraries
+A manifest lists the record hash and the file sizes and hashes of every asset - comparing the
+manifests of two libraries yields the few files and records to copy or delete
+instead of rescanning and comparing every file like a plain directory sync
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from matlib.core import blob_store, database, fileio, journal, migrations
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+MANIFEST_FILE = "library.manifest"
+FORMAT_VERSION = 1
+WORKERS = 8
+
+
+def record_hash(asset: dict) -> str:
+    """Return a hash of the metadata record of an asset"""
+    raw = json.dumps(asset, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> LibraryFiles:
+    """Return the files of the library in directory with the layout of the preferences"""
+    return LibraryFiles(fileio.LibraryLayout.from_prefs(preferences, directory))
+
+
+def _scan(directory: str) -> dict[str, tuple[int, int]]:
+    """Return size and mtime of all files in directory with one listing"""
+    files = {}
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        return files
+    with entries:
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _copy_file(source: str, path: str) -> None:
+    """Copy source to path - readers never see a partly copied file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".sync.tmp"
+    shutil.copy2(source, tmp_path)
+    # Replaces instead of writing into path - it may be linked into the blob store
+    os.replace(tmp_path, path)
+
+
+def _has_library(directory: str) -> bool:
+    """Return True if directory holds a library - in any of the backends"""
+    return bool(database.find_library_file(directory)) or (
+        database.detect_backend(directory) != "json"
+    )
+
+
+def _link_assets(
+    changes: dict, source: LibraryFiles, target: LibraryFiles, source_manifest: dict
+) -> set[tuple[str, str]]:
+    """
+    Hand the files to copy over as blob store links where the source has a blob store
+    An asset is only linked if its stored manifest matches the files the plan was made from
+
+    :return: The (id, role) pairs that have been linked - the rest still has to be copied
+    :rtype: set[tuple[str, str]]
+    """
+    if not os.path.isdir(source.path + blob_store.MANIFEST_DIR):
+        return set()
+    source_store = blob_store.BlobStore(source.layout)
+    target_store = blob_store.BlobStore(target.layout)
+    roles = {}
+    for key, role in changes["copy"]:
+        roles.setdefault(key, []).append(role)
+    linked = set()
+    for key, copy_roles in roles.items():
+        files = source_manifest["assets"][key]["files"]
+        stored = source_store.manifest(key)
+        if stored is None or set(stored) != set(files):
+            continue
+        if any(stored[role]["hash"] != entry["hash"] for role, entry in files.items()):
+            continue
+        source_store.copy_asset(key, key, target_store)
+        linked.update((key, role) for role in copy_roles)
+    return linked
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class LibraryFiles:
+    """
+    The asset files and the manifest of one library directory
+    The manifest caches the hashes - a file is only hashed again if its size or mtime changed
+    """
+
+    def __init__(self, layout: fileio.LibraryLayout) -> None:
+        self._layout = layout
+        self._path = layout.path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def layout(self) -> fileio.LibraryLayout:
+        return self._layout
+
+    def asset_files(self, mat_id: str) -> dict[str, str]:
+        """Return the files of an asset keyed by their role"""
+        return self._layout.asset_files(mat_id)
+
+    def read_manifest(self) -> dict | None:
+        """Return the manifest written by the last manifest() - None if there is none"""
+        try:
+            with open(self._path + MANIFEST_FILE, encoding="utf-8") as manifest_file:
+                manifest = json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+        return manifest if manifest.get("format") == FORMAT_VERSION else None
+
+    def write_manifest(self, manifest: dict) -> None:
+        fileio.atomic_write(
+            self._path + MANIFEST_FILE,
+            json.dumps(manifest, separators=(",", ":")).encode("utf-8"),
+        )
+
+    def manifest(
+        self, workers: int = WORKERS, data: dict | None = None, store: bool = True
+    ) -> dict:
+        """
+        Build the manifest of the library and store it for the next run
+        The asset and image directories are listed once, only new or changed files are hashed
+
+        :param workers: Number of files hashed in parallel
+        :type workers: int
+        :param data: Library data - loaded from the library if None
+        :type data: dict | None
+        :param store: Write the manifest into the library - if False nothing is written,
+            the records are read without a connection (see database.read_library())
+        :type store: bool
+        :return: Manifest with "categories", "tags" and "assets" - id -> {"record", "files"},
+            files are role -> {"size", "mtime", "hash"}
+        :rtype: dict
+        """
+        if data is None and not store:
+            data = database.read_library(self._path, self._layout.asset_dir)
+        elif data is None:
+            data = database.connect(self._path).load()
+        previous = (self.read_manifest() or {}).get("assets", {})
+        listings = {
+            directory: _scan(self._path + directory) for directory in self._layout.directories
+        }
+
+        assets = {}
+        to_hash = []
+        for asset in data.get("assets", []):
+            key = journal.asset_key(asset)
+            cached = previous.get(key, {}).get("files", {})
+            files = {}
+            for role, name in self._layout.asset_names(key).items():
+                directory = name[: name.rfind("/") + 1]
+                stat = listings[directory].get(name[len(directory) :])
+                if stat is None:
+                    continue
+                entry = {"size": stat[0], "mtime": stat[1], "hash": None}
+                old = cached.get(role)
+                if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+                    entry["hash"] = old["hash"]
+                else:
+                    to_hash.append((entry, self._path + name))
+                files[role] = entry
+            assets[key] = {"record": record_hash(asset), "files": files}
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            digests = pool.map(blob_store.file_hash, [path for _, path in to_hash])
+            for (entry, _), digest in zip(to_hash, digests):
+                entry["hash"] = digest
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "revision": data.get("revision", 0),
+            "categories": list(data.get("categories", [])),
+            "tags": list(data.get("tags", [])),
+            "assets": assets,
+        }
+        if store:
+            self.write_manifest(manifest)
+        return manifest
+
+
+def plan(source: dict, target: dict) -> dict:
+    """
+    Compare two manifests and return what has to change to make target equal to source
+
+    :param source: Manifest of the library to sync from
+    :type source: dict
+    :param target: Manifest of the library to sync to
+    :type target: dict
+    :return: "copy" and "delete" as lists of [id, role], "records" and "remove" as lists of ids,
+        "categories" and "tags" as the new list or None if they are equal
+    :rtype: dict
+    """
+    result = {"copy": [], "delete": [], "records": [], "remove": []}
+    target_assets = target.get("assets", {})
+    for key, entry in source["assets"].items():
+        other = target_assets.get(key, {"record": None, "files": {}})
+        if entry["record"] != other["record"]:
+            result["records"].append(key)
+        for role, source_file in entry["files"].items():
+            target_file = other["files"].get(role)
+            if (
+                target_file is None
+                or target_file["hash"] != source_file["hash"]
+                or target_file["size"] != source_file["size"]
+            ):
+                result["copy"].append([key, role])
+        for role in other["files"]:
+            if role not in entry["files"]:
+                result["delete"].append([key, role])
+    for key, other in target_assets.items():
+        if key not in source["assets"]:
+            result["remove"].append(key)
+            result["delete"].extend([key, role] for role in other["files"])
+    for section in ("categories", "tags"):
+        same = source.get(section) == target.get(section)
+        result[section] = None if same else list(source.get(section, []))
+    return result
+
+
+def is_empty(changes: dict) -> bool:
+    """Return True if a plan has nothing to do"""
+    return not any(changes[k] for k in ("copy", "delete", "records", "remove")) and (
+        changes["categories"] is None and changes["tags"] is None
+    )
+
+
+def apply(
+    changes: dict,
+    source: LibraryFiles,
+    target: LibraryFiles,
+    source_manifest: dict,
+    workers: int = WORKERS,
+) -> None:
+    """
+    Apply a plan to the target library
+    Files are copied first and deleted last, so the records never point to missing files.
+    Assets in the blob store of the source are linked into the blob store of the target
+
+    :param changes: Plan as returned by plan()
+    :type changes: dict
+    :param source: Library to sync from
+    :type source: LibraryFiles
+    :param target: Library to sync to
+    :type target: LibraryFiles
+    :param source_manifest: Manifest of the source the plan was made from
+    :type source_manifest: dict
+    :param workers: Number of files copied or deleted in parallel
+    :type workers: int
+    """
+    linked = _link_assets(changes, source, target, source_manifest)
+    copies = [
+        (source.asset_files(key)[role], target.asset_files(key)[role])
+        for key, role in changes["copy"]
+        if (key, role) not in linked
+    ]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda pair: _copy_file(*pair), copies))
+
+    records = []
+    if changes["categories"] is not None:
+        records.append({"op": "categories", "value": changes["categories"]})
+    if changes["tags"] is not None:
+        records.append({"op": "tags", "value": changes["tags"]})
+    if changes["records"]:
+        wanted = set(changes["records"])
+        for asset in database.connect(source.path).load()["assets"]:
+            if journal.asset_key(asset) in wanted:
+                records.append({"op": "asset", "value": journal.copy_asset(asset)})
+    records.extend({"op": "remove", "id": key} for key in changes["remove"])
+    if records:
+        if not _has_library(target.path):
+            os.makedirs(target.path, exist_ok=True)
+            fileio.atomic_write(
+                target.path + database.LIBRARY_FILE,
+                fileio.encode_json(
+                    {
+                        "schema_version": migrations.SCHEMA_VERSION,
+                        "categories": [],
+                        "tags": [],
+                        "assets": [],
+                    }
+                ),
+            )
+        connection = database.connect(target.path)
+        data = connection.load()
+        updated = {
+            "categories": list(data["categories"]),
+            "tags": list(data["tags"]),
+            "assets": list(data["assets"]),
+        }
+        journal.apply(updated, records)
+        connection.set(updated)
+        connection.save()
+        connection.flush()
+
+    deletes = [target.asset_files(key)[role] for key, role in changes["delete"]]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_remove_file, deletes))
+    if os.path.isdir(target.path + blob_store.MANIFEST_DIR):
+        target_store = blob_store.BlobStore(target.layout)
+        for key in changes["remove"]:
+            target_store.remove_asset(key)
+
+    # The copied files already have known hashes - only their new mtime is needed
+    manifest = target.read_manifest() or {"assets": {}}
+    for key in changes["remove"]:
+        manifest["assets"].pop(key, None)
+    for key, role in changes["delete"]:
+        manifest["assets"].get(key, {}).get("files", {}).pop(role, None)
+    for key, role in changes["copy"]:
+        entry = dict(source_manifest["assets"][key]["files"][role])
+        entry["mtime"] = os.stat(target.asset_files(key)[role]).st_mtime_ns
+        asset = manifest["assets"].setdefault(key, {"record": None, "files": {}})
+        asset["files"][role] = entry
+    for key in changes["records"]:
+        asset = manifest["assets"].setdefault(key, {"files": {}})
+        asset["record"] = source_manifest["assets"][key]["record"]
+    for section in ("categories", "tags", "revision"):
+        manifest[section] = source_manifest.get(section)
+    manifest["format"] = FORMAT_VERSION
+    target.write_manifest(manifest)
+
+
+def sync(
+    source: LibraryFiles, target: LibraryFiles, dry_run: bool = False, workers: int = WORKERS
+) -> dict:
+    """
+    Make the target library an exact copy of the source library
+
+    :param source: Library to sync from
+    :type source: LibraryFiles
+    :param target: Library to sync to - created if it does not exist
+    :type target: LibraryFiles
+    :param dry_run: Only return the plan - nothing is written to either library
+    :type dry_run: bool
+    :param workers: Number of files hashed, copied or deleted in parallel
+    :type workers: int
+    :return: The plan, see plan()
+    :rtype: dict
+    """
+    source_manifest = source.manifest(workers, store=not dry_run)
+    if _has_library(target.path):
+        target_manifest = target.manifest(workers, store=not dry_run)
+    else:
+        target_manifest = {"assets": {}}
+    changes = plan(source_manifest, target_manifest)
+    if not dry_run and not is_empty(changes):
+        apply(changes, source, target, source_manifest, workers)
+    return changes
@@ -0,0 +1,114 @@
+"""
+Trash for the Files of removed MatLib Assets
+Removing an asset moves its .mat, .interface and image file aside so undo can bring them back.
+They are deleted for good, with the history and blob manifest of the asset,
+once no undo step of the user refers to the asset anymore
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+from typing import TYPE_CHECKING
+
+from matlib.core import blob_store, fileio, history, storage, undo
+
+if TYPE_CHECKING:
+    from matlib.prefs import prefs
+
+TRASH_EXT = ".trash"
+
+
+def trash_path(directory: str) -> str:
+    """Return the trash of the current user for the library in directory - next to the undo file"""
+    return undo.undo_path(directory)[: -len(undo.UNDO_EXT)] + TRASH_EXT + "/"
+
+
+def for_prefs(preferences: prefs.Prefs, directory: str | None = None) -> Trash:
+    """
+    Return the trash of the library in the preferences
+    Pass directory for a library other than the one in the preferences
+    """
+    return Trash(
+        fileio.LibraryLayout.from_prefs(preferences, directory),
+        storage.for_prefs(preferences, directory),
+        blob_store.for_prefs(preferences, directory),
+        history.for_prefs(preferences, directory),
+    )
+
+
+class Trash:
+    """Files of removed assets by asset id - one directory per asset with a file per role"""
+
+    def __init__(
+        self,
+        layout: fileio.LibraryLayout,
+        library: storage.FileStorage | storage.HttpStorage,
+        store: blob_store.BlobStore | None = None,
+        versions: history.AssetHistory | None = None,
+    ) -> None:
+        self._layout = layout
+        self._library = library
+        self._store = store
+        self._versions = versions
+        self._path = trash_path(layout.path)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def ids(self) -> list[str]:
+        """Ids of the assets in the trash"""
+        try:
+            return os.listdir(self._path)
+        except OSError:
+            return []
+
+    def move_asset(self, mat_id: str) -> None:
+        """Move the files of an asset into the trash - removes them from the library server too"""
+        directory = self._path + str(mat_id) + "/"
+        os.makedirs(directory, exist_ok=True)
+        for role, name in self._layout.asset_names(mat_id).items():
+            if self._library.remote:
+                # Only the server has the current file - keep a copy of it
+                source = self._library.fetch(name)
+                if os.path.exists(source):
+                    shutil.copyfile(source, directory + role)
+            else:
+                # Not fetched - that would copy the file into the read cache first
+                source = self._library.local_path(name)
+                if os.path.exists(source):
+                    os.replace(source, directory + role)
+            self._library.remove(name)
+
+    def restore_asset(self, mat_id: str) -> bool:
+        """Move the files of an asset back into the library - returns False if none are trashed"""
+        directory = self._path + str(mat_id) + "/"
+        if not os.path.isdir(directory):
+            return False
+        for role, name in self._layout.asset_names(mat_id).items():
+            if not os.path.exists(directory + role):
+                continue
+            target = self._library.local_path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(directory + role, target)
+            self._library.publish(name)
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+    def purge(self, keep: set[str] = frozenset()) -> None:
+        """
+        Delete the trashed files, history and blob manifest of every asset not in keep
+
+        :param keep: Ids of assets an undo step can still bring back
+        :type keep: set[str]
+        """
+        for mat_id in self.ids:
+            if mat_id in keep:
+                continue
+            shutil.rmtree(self._path + mat_id, ignore_errors=True)
+            if self._store:
+                self._store.remove_asset(mat_id)
+            if self._versions:
+                self._versions.remove_asset(mat_id)
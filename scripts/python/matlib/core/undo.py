@@ -0,0 +1,142 @@
+"""
+Undo Journal for the MatLib Database
+Every edit is stored as the journal records undoing and redoing it,
+in an append-only file per user next to library.json that is compacted once it grows too long.
+Changes of an asset are stored as the fields before and after the edit ("fields" records),
+Categories and Tags with the list they replace as "base" - undo only reverts what the edit changed
+"""
+
+from __future__ import annotations
+
+import getpass
+import json
+import os
+
+UNDO_EXT = ".undo"
+
+
+def undo_path(directory: str) -> str:
+    """Return the undo journal of the current user for the library in directory"""
+    try:
+        user = getpass.getuser()
+    except (KeyError, OSError):
+        user = "default"
+    return os.path.join(directory, f"library.{user}{UNDO_EXT}")
+
+
+class UndoJournal:
+    """
+    Bounded undo and redo stacks of edit steps kept on disk
+    A step is a dict with a "label" and the journal records for "undo" and "redo"
+    """
+
+    def __init__(self, path: str, max_steps: int = 50) -> None:
+        self._path = path
+        self._max_steps = max_steps
+        self._undo = []
+        self._redo = []
+        self._lines = 0
+        self._load()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def undo_label(self) -> str | None:
+        """Label of the step undo() would revert - None if there is none"""
+        return self._undo[-1]["label"] if self._undo else None
+
+    @property
+    def redo_label(self) -> str | None:
+        """Label of the step redo() would apply again - None if there is none"""
+        return self._redo[-1]["label"] if self._redo else None
+
+    def asset_ids(self) -> set[str]:
+        """Return the ids of all assets the steps on the stacks refer to"""
+        ids = set()
+        for step in self._undo + self._redo:
+            for record in step["undo"] + step["redo"]:
+                if record["op"] == "asset":
+                    ids.add(str(record["value"]["id"]))
+                elif record["op"] in ("remove", "fields"):
+                    ids.add(str(record["id"]))
+        return ids
+
+    def _load(self) -> None:
+        """Rebuild the stacks from the journal - a torn line at the end is ignored"""
+        try:
+            with open(self._path, "rb") as undo_file:
+                lines = undo_file.readlines()
+        except OSError:
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            self._lines += 1
+            if "push" in entry:
+                self._push(entry["push"])
+            elif "undo" in entry and self._undo:
+                self._redo.append(self._undo.pop())
+            elif "redo" in entry and self._redo:
+                self._undo.append(self._redo.pop())
+
+    def _push(self, step: dict) -> None:
+        self._undo.append(step)
+        self._redo = []
+        del self._undo[: -self._max_steps]
+
+    def _append(self, entry: dict) -> None:
+        if self._lines >= 4 * self._max_steps:
+            self._compact()
+        with open(self._path, "a", encoding="utf-8") as undo_file:
+            undo_file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self._lines += 1
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only the steps still on the stacks"""
+        entries = [{"push": step} for step in self._undo + self._redo[::-1]]
+        entries += [{"undo": 1}] * len(self._redo)
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as undo_file:
+            for entry in entries:
+                undo_file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self._path)
+        self._lines = len(entries)
+
+    def push(self, label: str, undo: list[dict], redo: list[dict]) -> None:
+        """
+        Store a new edit step - clears the redo stack
+
+        :param label: Short description for the user, e.g. "Rename category Metal"
+        :type label: str
+        :param undo: Journal records reverting the edit
+        :type undo: list[dict]
+        :param redo: Journal records applying the edit again
+        :type redo: list[dict]
+        """
+        if not undo and not redo:
+            return
+        step = {"label": label, "undo": undo, "redo": redo}
+        self._push(step)
+        self._append({"push": step})
+
+    def undo(self) -> dict | None:
+        """Move the newest step to the redo stack and return it - None if there is none"""
+        if not self._undo:
+            return None
+        step = self._undo.pop()
+        self._redo.append(step)
+        self._append({"undo": 1})
+        return step
+
+    def redo(self) -> dict | None:
+        """Move the newest undone step back to the undo stack and return it"""
+        if not self._redo:
+            return None
+        step = self._redo.pop()
+        self._undo.append(step)
+        self._append({"redo": 1})
+        return step
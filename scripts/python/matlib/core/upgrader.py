@@ -5,7 +5,7 @@ import shutil
 
 import hou
 
-from matlib.core import material, library
+from matlib.core import material, library, blob_store
 from matlib.prefs import prefs
 
 importlib.reload(material)
@@ -35,6 +35,8 @@ class LibraryUpgrader:
 
         self._interface_ext = ".interface"
         self._node_ext = ".mat"
+        # Content already in the library is linked instead of copied
+        self._store = blob_store.for_prefs(self._prefs)
 
         self._assets = [material.Material.from_dict(d) for d in self._data["assets"]]
         self._categories = self._data["categories"]
@@ -83,6 +85,8 @@ class LibraryUpgrader:
                 )
 
         self._materialmodel.save()
+        # Make sure the upgraded library is on disk before the user goes on
+        self._materialmodel.db.flush()
         self._materialmodel.rebuild_thumbs()
         self._materialmodel.layoutChanged.emit()
 
@@ -114,6 +118,17 @@ class LibraryUpgrader:
             self._source_asset_dir + str(curr_asset.mat_id) + self._node_ext
         )
         dest_node_file = self._dest_asset_dir + new_asset.mat_id + self._node_ext
+        if self._store:
+            print(f"MatLibUpgrader: Import {curr_asset.mat_id} as {new_asset.mat_id}")
+            self._store.import_asset(
+                new_asset.mat_id,
+                {
+                    "image": source_img_file,
+                    "interface": source_interface_file,
+                    "mat": source_node_file,
+                },
+            )
+            return
         print(f"---------------------")
         print(f"MatLibUpgrader: Copy {source_img_file} to {dest_img_file}")
         shutil.copy(source_img_file, dest_img_file)
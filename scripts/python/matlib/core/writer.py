@@ -0,0 +1,157 @@
+"""
+Background Writer for the MatLib Database
+Encodes and writes library snapshots on a dedicated thread so saving never blocks the UI
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+class Aborted(Exception):
+    """Raised by the write function to hand a snapshot back without reporting an error"""
+
+
+def _union(older: dict | None, newer: dict | None) -> dict | None:
+    """Combine the changed assets of two snapshots - the newer version of an asset wins"""
+    if older is None or newer is None:
+        return None
+    return {**older, **newer}
+
+
+class BackgroundWriter:
+    """
+    Writes library snapshots on a dedicated thread
+    Holds at most one pending snapshot - every snapshot contains the whole library, so a newer one replaces it
+    """
+
+    def __init__(
+        self,
+        write: Callable[[dict, dict | None], None],
+        name: str = "MatLibWriter",
+        failed: Callable[[], None] | None = None,
+    ) -> None:
+        """
+        :param write: Writes a snapshot and its changed assets - raise Aborted to hand it back
+        :type write: Callable[[dict, dict | None], None]
+        :param name: Name of the thread
+        :type name: str
+        :param failed: Called on the writer thread after a write failed or was aborted,
+            wait() raises the error
+        :type failed: Callable[[], None] | None
+        """
+        self._write = write
+        self._failed_callback = failed
+        self._name = name
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pending = None
+        # Changed assets of a snapshot that failed to write - carried over to the next one
+        self._failed = {}
+        self._busy = False
+        self._error = None
+        self._writes = 0
+        self._superseded = 0
+        self._last_latency = 0.0
+        self._max_latency = 0.0
+
+    def submit(self, snapshot: dict, changed: dict | None = None) -> None:
+        """
+        Queue a snapshot for writing - replaces a snapshot that has not been started yet
+
+        :param snapshot: Library data
+        :type snapshot: dict
+        :param changed: Assets of the snapshot edited since the previous one keyed by id,
+            None if unknown. Those of a replaced or failed snapshot are carried over -
+            unchanged assets are the same objects in consecutive snapshots
+        :type changed: dict | None
+        """
+        with self._condition:
+            carried = self._failed
+            if self._pending is not None:
+                self._superseded += 1
+                carried = _union(carried, self._pending[1])
+            self._failed = {}
+            self._pending = (snapshot, _union(carried, changed))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def wait(self) -> None:
+        """
+        Block until the pending snapshot has been written
+        Raises the error of a failed write once
+        """
+        with self._condition:
+            while self._pending is not None or self._busy:
+                self._condition.wait()
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                (snapshot, changed), self._pending = self._pending, None
+                self._busy = True
+
+            start = time.perf_counter()
+            error = None
+            try:
+                self._write(snapshot, changed)
+            except Aborted as abort:
+                error = abort
+            except BaseException as write_error:
+                print(f"MatLib: Writing the library failed - {write_error}")
+                error = write_error
+            latency = time.perf_counter() - start
+
+            with self._condition:
+                self._busy = False
+                self._writes += 1
+                self._last_latency = latency
+                self._max_latency = max(self._max_latency, latency)
+                if error is not None:
+                    self._error = error
+                    # The next snapshot has to write these assets as well
+                    if self._pending is not None:
+                        self._pending = (self._pending[0], _union(changed, self._pending[1]))
+                    else:
+                        self._failed = _union(changed, self._failed)
+                self._condition.notify_all()
+            if error is not None and self._failed_callback is not None:
+                self._failed_callback()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of snapshots waiting or being written (0 to 2)"""
+        with self._condition:
+            return int(self._pending is not None) + int(self._busy)
+
+    @property
+    def writes(self) -> int:
+        """Number of snapshots written"""
+        return self._writes
+
+    @property
+    def superseded(self) -> int:
+        """Number of snapshots replaced by a newer one before they were written"""
+        return self._superseded
+
+    @property
+    def last_latency(self) -> float:
+        """Seconds the last write took"""
+        return self._last_latency
+
+    @property
+    def max_latency(self) -> float:
+        """Seconds the slowest write took"""
+        return self._max_latency
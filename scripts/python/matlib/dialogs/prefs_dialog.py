@@ -47,6 +47,13 @@ class PrefsDialog(QtWidgets.QDialog):
 
         self._combo_ballmode.currentIndexChanged.connect(self.set_ballmode)
 
+        self._combo_format = self.ui.findChild(QtWidgets.QComboBox, "combo_format")
+        self._combo_format.addItem("json (readable)", "json")
+        self._combo_format.addItem("json (compact)", "compact")
+        self._combo_format.addItem("json.gz (gzip)", "gzip")
+        self._combo_format.addItem("json.xz (xz)", "xz")
+        self._combo_format.currentIndexChanged.connect(self.set_library_format)
+
         self.cbx_render_on_import = self.ui.findChild(
             QtWidgets.QCheckBox, "cbx_renderOnImport"
         )
@@ -154,6 +161,14 @@ class PrefsDialog(QtWidgets.QDialog):
         """
         self._prefs.ballmode = self._combo_ballmode.currentIndex()
 
+    def set_library_format(self):
+        """
+        Set the on-disk Format of the library - applied on the next save
+
+        :param self: Description
+        """
+        self._prefs.library_format = self._combo_format.currentData()
+
     def set_render_on_import(self):
         """
         Set if Thumbnails should be rendered on import to MatLib
@@ -192,6 +207,9 @@ class PrefsDialog(QtWidgets.QDialog):
         self.line_rendersamples.setValue(self.rendersamples)
 
         self._combo_ballmode.setCurrentIndex(self.ballmode)
+        self._combo_format.setCurrentIndex(
+            max(self._combo_format.findData(self._prefs.library_format), 0)
+        )
 
         self.cbx_render_on_import.setChecked(self.render_on_import)
 
@@ -10,7 +10,15 @@ from PySide6 import QtWidgets, QtGui, QtCore, QtUiTools
 import hou
 
 from matlib.panel import dragdrop_widgets
-from matlib.core import library, category, multifilterproxy_model, upgrader
+from matlib.core import (
+    library,
+    category,
+    multifilterproxy_model,
+    upgrader,
+    database,
+    integrity,
+    pack,
+)
 from matlib.dialogs import (
     about_dialog,
     prefs_dialog,
@@ -52,6 +60,8 @@ class MatLibPanel(QtWidgets.QWidget):
             self.category_model = None
 
     def setup(self):
+        # Created first so the library is streamed in - the Categories come with the first chunk
+        self.material_model = library.MaterialLibrary(stream=True)
         self.category_model = category.Categories()
         self.category_sorted_model = QtCore.QSortFilterProxyModel()
         self.category_sorted_model.setSourceModel(self.category_model)
@@ -59,13 +69,14 @@ class MatLibPanel(QtWidgets.QWidget):
         self.category_sorted_model.setSortRole(self.category_model.CatSortRole)
         self.category_sorted_model.sort(0)
 
-        self.material_model = library.MaterialLibrary()
         self.material_sorted_model = multifilterproxy_model.MultiFilterProxyModel()
         self.material_sorted_model.setSourceModel(self.material_model)
         self.material_sorted_model.setSortCaseSensitivity(QtCore.Qt.CaseInsensitive)
         self.material_sorted_model.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
         self.material_sorted_model.sort(0)
         self.material_sorted_model.setDynamicSortFilter(False)  # Improves Performance
+        self.material_model.loading_finished.connect(self.material_sorted_model.invalidate)
+        self.material_model.merge_conflicts.connect(self.report_conflicts)
         self.material_selection_model = QtCore.QItemSelectionModel(
             self.material_sorted_model
         )
@@ -79,6 +90,33 @@ class MatLibPanel(QtWidgets.QWidget):
         self.filter_renderer()
         self.click_slider.setValue(self.prefs.thumbsize)
         self.slide()
+        self.report_recovery()
+
+    def report_recovery(self) -> None:
+        """Tell the user if the library had to be recovered from a backup on load"""
+        recovered = self.material_model.db.recovered
+        if recovered:
+            hou.ui.displayMessage(  # type: ignore
+                f"library.json could not be read. The library has been recovered from {recovered}"
+            )
+
+    def report_conflicts(self, conflicts: list[dict]) -> None:
+        """Tell the user which edits of another session have been overridden on merge"""
+        lines = []
+        for conflict in conflicts[:20]:
+            if conflict["field"] is None:
+                lines.append(f"{conflict['name']}: removed in one session, changed in the other")
+            else:
+                lines.append(
+                    f"{conflict['name']}: {conflict['field']} - kept {conflict['ours']!r}, "
+                    f"other session set {conflict['theirs']!r}"
+                )
+        if len(conflicts) > 20:
+            lines.append(f"... and {len(conflicts) - 20} more")
+        hou.ui.displayMessage(  # type: ignore
+            "Another session has changed the same materials. Your changes have been kept",
+            details="\n".join(lines),
+        )
 
     def open(self) -> None:
         """Open the currently in preferences specified library"""
@@ -92,7 +130,7 @@ class MatLibPanel(QtWidgets.QWidget):
         """Load the currently in preferences specified library
         Copies necessary data to the target directory if not created yet"""
         new_folder = False
-        if not os.path.exists(self.prefs.dir + "/library.json"):
+        if not database.find_library_file(self.prefs.dir):
             oldpath = (
                 hou.getenv("EGMATLIB") + "/scripts/python/matlib/res/def/library.json"
             )
@@ -116,14 +154,12 @@ class MatLibPanel(QtWidgets.QWidget):
             if not self.material_model:
                 self.setup()
 
-            self.material_model.layoutAboutToBeChanged.emit()
-            self.category_model.layoutAboutToBeChanged.emit()
-
-            self.category_model.switch_model_data()
+            # The models signal their own changes - unchanged libraries are skipped
+            # The material model goes first so a new library is streamed in
             self.material_model.switch_model_data()
+            self.category_model.switch_model_data()
             self.click_slider.setValue(self.prefs.thumbsize)
-            self.category_model.layoutChanged.emit()
-            self.material_model.layoutChanged.emit()
+            self.report_recovery()
 
     def toggle_catview(self) -> None:
         """Show and Hide the Category View via Menu"""
@@ -172,6 +208,14 @@ class MatLibPanel(QtWidgets.QWidget):
 
         self.action_cleanup_db = self.ui.findChild(QtGui.QAction, "action_cleanup_db")
         self.action_cleanup_db.triggered.connect(self.cleanup_db)
+        self.action_check_integrity = self.ui.findChild(
+            QtGui.QAction, "action_check_integrity"
+        )
+        self.action_check_integrity.triggered.connect(self.check_integrity)
+        self.action_undo = self.ui.findChild(QtGui.QAction, "action_undo")
+        self.action_undo.triggered.connect(self.undo)
+        self.action_redo = self.ui.findChild(QtGui.QAction, "action_redo")
+        self.action_redo.triggered.connect(self.redo)
         self.action_open_folder = self.ui.findChild(QtGui.QAction, "action_open_folder")
         self.action_open_folder.triggered.connect(self.open_usdlib_folder)
 
@@ -188,6 +232,10 @@ class MatLibPanel(QtWidgets.QWidget):
             QtGui.QAction, "action_import_lib_v1"
         )
         self.action_import_lib_v1.triggered.connect(self.import_lib_v1)
+        self.action_export_pack = self.ui.findChild(QtGui.QAction, "action_export_pack")
+        self.action_export_pack.triggered.connect(self.export_pack)
+        self.action_import_pack = self.ui.findChild(QtGui.QAction, "action_import_pack")
+        self.action_import_pack.triggered.connect(self.import_pack)
 
         # Overwrite the widgets for Drag and Drop in dragdrop_widgets.py
         self.centralwidget = self.ui.centralwidget
@@ -361,6 +409,47 @@ class MatLibPanel(QtWidgets.QWidget):
             return
         self.material_model.cleanup_db()
 
+    def check_integrity(self) -> None:
+        """Verify the files of the library and report corrupt, missing and orphan files"""
+        if not self.material_model:
+            hou.ui.displayMessage("Please open a library first")  # type: ignore
+            return
+        self.material_model.save()
+        self.material_model.db.flush()
+        checker = integrity.for_prefs(self.prefs, self.material_model.db.path)
+        with hou.InterruptableOperation("Checking Library Integrity"):
+            report = checker.verify(data=self.material_model.db.load())
+        path = checker.write_report(report)
+        lines = [f"{c['path']}: {c['problem']}" for c in report["corrupt"]]
+        lines += [f"{m['path']}: missing" for m in report["missing"]]
+        lines += [f"{o}: orphan" for o in report["orphan"]]
+        hou.ui.displayMessage(  # type: ignore
+            f"{report['files']} files checked, {report['read']} read. "
+            f"{len(report['corrupt'])} corrupt, {len(report['missing'])} missing, "
+            f"{len(report['orphan'])} orphan files. The report has been written to {path}",
+            details="\n".join(lines[:200]),
+        )
+
+    def undo(self) -> None:
+        """Revert the last edit of the library made by this user"""
+        if not self.material_model:
+            return
+        label = self.material_model.undo()
+        if label is None:
+            hou.ui.displayMessage("Nothing to undo")  # type: ignore
+            return
+        self.update_details_view()
+
+    def redo(self) -> None:
+        """Apply the last undone edit of the library again"""
+        if not self.material_model:
+            return
+        label = self.material_model.redo()
+        if label is None:
+            hou.ui.displayMessage("Nothing to redo")  # type: ignore
+            return
+        self.update_details_view()
+
     def import_lib_v1(self) -> None:
 
         start_directory = self.prefs.dir
@@ -376,6 +465,47 @@ class MatLibPanel(QtWidgets.QWidget):
         else:
             hou.ui.displayMessage("Invalid Path. Please try again.")
 
+    def export_pack(self) -> None:
+        """Export the selected assets - or the whole library - into a .matlibpack file"""
+        if not self.material_model:
+            hou.ui.displayMessage("Please open a library first")  # type: ignore
+            return
+        path = hou.ui.selectFile(  # type: ignore
+            self.prefs.dir, "Export Pack", pattern="*" + pack.PACK_EXT
+        )
+        path = hou.expandString(path)
+        if not path:
+            return
+        if not path.endswith(pack.PACK_EXT):
+            path += pack.PACK_EXT
+        ids = [
+            self.material_model.assets[self.material_sorted_model.mapToSource(index).row()].mat_id
+            for index in self.material_selection_model.selectedIndexes()
+        ]
+        self.material_model.save()
+        self.material_model.db.flush()
+        assets = pack.select_assets(self.material_model.db.load(), ids=ids) if ids else None
+        count = pack.for_prefs(self.prefs).export(path, assets)
+        hou.ui.displayMessage(f"{count} assets have been exported to {path}")  # type: ignore
+
+    def import_pack(self) -> None:
+        """Merge the assets of a .matlibpack file into the library"""
+        if not self.material_model:
+            hou.ui.displayMessage("Please open a library first")  # type: ignore
+            return
+        path = hou.ui.selectFile(  # type: ignore
+            self.prefs.dir, "Import Pack", pattern="*" + pack.PACK_EXT
+        )
+        path = hou.expandString(path)
+        if not os.path.isfile(path):
+            return
+        try:
+            added, _ = pack.for_prefs(self.prefs).import_pack(path)
+        except (OSError, ValueError) as error:
+            hou.ui.displayMessage(f"The pack could not be imported: {error}")  # type: ignore
+            return
+        hou.ui.displayMessage(f"{added} new assets have been imported")  # type: ignore
+
     def open_usdlib_folder(self) -> None:
         """Open the Library Folder in the System explorer"""
         if not self.material_model:
@@ -414,14 +544,11 @@ class MatLibPanel(QtWidgets.QWidget):
         for index in self.cat_list.selectedIndexes():
             if index.data(QtCore.Qt.ItemDataRole.DisplayRole) == "All":
                 return
-            self.material_model.remove_category(
-                index.data(QtCore.Qt.ItemDataRole.DisplayRole)
-            )
+            # The material model follows via the change notification of the database
             self.category_model.remove_category(
                 index.data(QtCore.Qt.ItemDataRole.DisplayRole)
             )
 
-        self.material_model.save()
         self.material_model.layoutChanged.emit()
 
         self.category_model.layoutChanged.emit()
@@ -438,14 +565,10 @@ class MatLibPanel(QtWidgets.QWidget):
             if index.data(QtCore.Qt.ItemDataRole.DisplayRole) == "All":
                 return
 
-            self.material_model.rename_category(
-                index.data(QtCore.Qt.ItemDataRole.DisplayRole), cat
-            )
             self.category_model.rename_category(
                 index.data(QtCore.Qt.ItemDataRole.DisplayRole), cat
             )
 
-        self.material_model.save()
         self.material_model.layoutChanged.emit()
         self.category_model.layoutChanged.emit()
 
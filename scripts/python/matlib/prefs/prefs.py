@@ -21,6 +21,19 @@ class Prefs:
         self._renderer_arnold_enabled = False
         self._renderer_redshift_enabled = False
         self._renderer_octane_enabled = False
+        self._journal = False
+        self._backend = "json"
+        self._backups = 3
+        self._save_delay = 1000
+        self._library_format = "json"
+        self._background_save = True
+        self._binary_snapshot = True
+        self._blob_store = False
+        self._history_revisions = 10
+        self._undo_steps = 50
+        self._read_cache = ""
+        self._read_cache_size = 2048
+        self._server_url = ""
 
     def save(self) -> None:
         """
@@ -47,6 +60,19 @@ class Prefs:
         self.data["renderer_octane"] = self._renderer_octane_enabled
         self.data["renderer_arnold"] = self._renderer_arnold_enabled
         self.data["ballmode"] = self._ballmode
+        self.data["journal"] = self._journal
+        self.data["backend"] = self._backend
+        self.data["backups"] = self._backups
+        self.data["save_delay"] = self._save_delay
+        self.data["library_format"] = self._library_format
+        self.data["background_save"] = self._background_save
+        self.data["binary_snapshot"] = self._binary_snapshot
+        self.data["blob_store"] = self._blob_store
+        self.data["history_revisions"] = self._history_revisions
+        self.data["undo_steps"] = self._undo_steps
+        self.data["read_cache"] = self._read_cache
+        self.data["read_cache_size"] = self._read_cache_size
+        self.data["server_url"] = self._server_url
 
         with open(self.path + ("/settings.json"), "w", encoding="utf-8") as lib_json:
             json.dump(self.data, lib_json, indent=4)
@@ -73,6 +99,19 @@ class Prefs:
             self._renderer_arnold_enabled = data["renderer_arnold"]
             self._rendersamples = data["rendersamples"]
             self._ballmode = data["ballmode"]
+            self._journal = data.get("journal", False)
+            self._backend = data.get("backend", "json")
+            self._backups = data.get("backups", 3)
+            self._save_delay = data.get("save_delay", 1000)
+            self._library_format = data.get("library_format", "json")
+            self._background_save = data.get("background_save", True)
+            self._binary_snapshot = data.get("binary_snapshot", True)
+            self._blob_store = data.get("blob_store", False)
+            self._history_revisions = data.get("history_revisions", 10)
+            self._undo_steps = data.get("undo_steps", 50)
+            self._read_cache = data.get("read_cache", "")
+            self._read_cache_size = data.get("read_cache_size", 2048)
+            self._server_url = data.get("server_url", "")
 
             if os.path.exists(self._directory):
                 return True
@@ -131,6 +170,110 @@ class Prefs:
     def ballmode(self, val: int) -> None:
         self._ballmode = val
 
+    @property
+    def journal(self) -> bool:
+        return self._journal
+
+    @journal.setter
+    def journal(self, val: bool) -> None:
+        self._journal = val
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+    @backend.setter
+    def backend(self, val: str) -> None:
+        self._backend = val
+
+    @property
+    def backups(self) -> int:
+        return self._backups
+
+    @backups.setter
+    def backups(self, val: int) -> None:
+        self._backups = val
+
+    @property
+    def save_delay(self) -> int:
+        return self._save_delay
+
+    @save_delay.setter
+    def save_delay(self, val: int) -> None:
+        self._save_delay = val
+
+    @property
+    def library_format(self) -> str:
+        return self._library_format
+
+    @library_format.setter
+    def library_format(self, val: str) -> None:
+        self._library_format = val
+
+    @property
+    def background_save(self) -> bool:
+        return self._background_save
+
+    @background_save.setter
+    def background_save(self, val: bool) -> None:
+        self._background_save = val
+
+    @property
+    def binary_snapshot(self) -> bool:
+        return self._binary_snapshot
+
+    @binary_snapshot.setter
+    def binary_snapshot(self, val: bool) -> None:
+        self._binary_snapshot = val
+
+    @property
+    def blob_store(self) -> bool:
+        return self._blob_store
+
+    @blob_store.setter
+    def blob_store(self, val: bool) -> None:
+        self._blob_store = val
+
+    @property
+    def history_revisions(self) -> int:
+        return self._history_revisions
+
+    @history_revisions.setter
+    def history_revisions(self, val: int) -> None:
+        self._history_revisions = val
+
+    @property
+    def undo_steps(self) -> int:
+        return self._undo_steps
+
+    @undo_steps.setter
+    def undo_steps(self, val: int) -> None:
+        self._undo_steps = val
+
+    @property
+    def read_cache(self) -> str:
+        return self._read_cache
+
+    @read_cache.setter
+    def read_cache(self, val: str) -> None:
+        self._read_cache = val
+
+    @property
+    def read_cache_size(self) -> int:
+        return self._read_cache_size
+
+    @read_cache_size.setter
+    def read_cache_size(self, val: int) -> None:
+        self._read_cache_size = val
+
+    @property
+    def server_url(self) -> str:
+        return self._server_url
+
+    @server_url.setter
+    def server_url(self, val: str) -> None:
+        self._server_url = val
+
     @property
     def thumbsize(self) -> int:
         return self._thumbsize
@@ -8,7 +8,7 @@ import hou
 import importlib
 
 from matlib.render import thumbs
-from matlib.core import material
+from matlib.core import material, blob_store, history, storage
 from matlib.prefs import prefs
 from matlib.helpers import helpers
 
@@ -20,8 +20,10 @@ class NodeHandler:
     Handles all Node Interaction with Houdini
     """
 
-    def __init__(self, preferences: prefs.Prefs) -> None:
+    def __init__(self, preferences: prefs.Prefs, directory: str | None = None) -> None:
         self._preferences = preferences
+        # Library the files are written to and read from - the one in the preferences by default
+        self._dir = os.path.join(directory or preferences.dir, "")
         self._builder_node = hou.node("/stage")
         self._builder = 0
         self._renderer = ""
@@ -107,11 +109,8 @@ class NodeHandler:
     def import_asset_to_scene(self, mat: material.Material) -> None:
         """Import a Material to the Nework Editor/Scene"""
 
-        parms_file_name = (
-            self._preferences.dir
-            + self._preferences.asset_dir
-            + mat.mat_id
-            + ".interface"
+        parms_file_name = storage.for_prefs(self._preferences, self._dir).fetch(
+            self._preferences.asset_dir + mat.mat_id + ".interface"
         )
 
         self.update_context()
@@ -293,11 +292,8 @@ class NodeHandler:
         :param self: Description
         :param mat: Description
         """
-        file_name = (
-            self._preferences.dir
-            + self._preferences.asset_dir
-            + mat.mat_id
-            + self._preferences.ext
+        file_name = storage.for_prefs(self._preferences, self._dir).fetch(
+            self._preferences.asset_dir + mat.mat_id + self._preferences.ext
         )
         try:
             self._builder_node.loadItemsFromFile(file_name, ignore_load_warnings=False)
@@ -315,6 +311,12 @@ class NodeHandler:
             hou.ui.displayMessage("Please set $OCIO first")  # type: ignore
             return False
         val = False
+        store = blob_store.for_prefs(self._preferences, self._dir)
+        if store:
+            # The files are rewritten in place - other assets sharing their content must not change
+            store.detach_asset(asset_id)
+        versions = history.for_prefs(self._preferences, self._dir) if update else None
+        previous = versions.read_files(asset_id) if versions else None
 
         if "Redshift" in self._renderer:
             with hou.InterruptableOperation(
@@ -349,19 +351,37 @@ class NodeHandler:
                     val = self.save_node_mtlx(node, asset_id, update)
         else:
             hou.ui.displayMessage("Selected Node is not a Material Builder")  # type: ignore
+        if val and versions:
+            versions.add_revision(asset_id, previous)
+        if val and store:
+            store.add_asset(asset_id)
+        if val:
+            self._publish(asset_id)
         return val
 
+    def _publish(self, asset_id: str) -> None:
+        """Hand the files written by save_node to the storage backend, e.g. upload them"""
+        library = storage.for_prefs(self._preferences, self._dir)
+        names = (
+            self._preferences.asset_dir + str(asset_id) + self._preferences.ext,
+            self._preferences.asset_dir + str(asset_id) + ".interface",
+            self._preferences.img_dir + str(asset_id) + self._preferences.img_ext,
+        )
+        for name in names:
+            if os.path.exists(library.local_path(name)):
+                library.publish(name)
+
     def save_node_collect(self, node: hou.Node, asset_id: str, update: bool) -> bool:
         """Saves the attached network from a collect node to disk - does not add to library"""
         # Filepath where to save stuff
         file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + self._preferences.ext
         )
         parms_file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + ".interface"
@@ -387,21 +407,21 @@ class NodeHandler:
             if not self._preferences.render_on_import:
                 return True
 
-        thumber = thumbs.ThumbNailRenderer(self._preferences)
+        thumber = thumbs.ThumbNailRenderer(self._preferences, directory=self._dir)
         return thumber.create_thumb_mtlx(nodetree, asset_id)
 
     def save_node_mtlx(self, node: hou.Node, asset_id: str, update: bool) -> bool:
         """Saves the MtlX node to disk - does not add to library"""
         # Filepath where to save stuff
         file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + asset_id
             + self._preferences.ext
         )
 
         parms_file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + asset_id
             + ".interface"
@@ -422,14 +442,14 @@ class NodeHandler:
             if not self._preferences.render_on_import:
                 return True
 
-        thumber = thumbs.ThumbNailRenderer(self._preferences)
+        thumber = thumbs.ThumbNailRenderer(self._preferences, directory=self._dir)
         return thumber.create_thumb_mtlx(node, asset_id)
 
     def save_node_mantra(self, node: hou.Node, asset_id: str, update: bool) -> bool:
         """Saves the Mantra node to disk - does not add to library"""
         # Filepath where to save stuff
         file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + self._preferences.ext
@@ -446,7 +466,7 @@ class NodeHandler:
 
         # interface-stuff
         parms_file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + ".interface"
@@ -467,14 +487,14 @@ class NodeHandler:
             if not self._preferences.render_on_import:
                 return True
 
-        thumber = thumbs.ThumbNailRenderer(self._preferences)
+        thumber = thumbs.ThumbNailRenderer(self._preferences, directory=self._dir)
         return thumber.create_thumb_mantra(node, asset_id)
 
     def save_node_redshift(self, node: hou.Node, asset_id: str, update: bool) -> bool:
         """Saves the Redshift node to disk - does not add to library"""
         # Filepath where to save stuff
         file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + self._preferences.ext
@@ -482,7 +502,7 @@ class NodeHandler:
 
         # interface-stuff
         parms_file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + ".interface"
@@ -500,7 +520,7 @@ class NodeHandler:
             if not self._preferences.render_on_import:
                 return True
 
-        thumber = thumbs.ThumbNailRenderer(self._preferences)
+        thumber = thumbs.ThumbNailRenderer(self._preferences, directory=self._dir)
         return thumber.create_thumb_redshift(node, asset_id)
 
     def save_node_octane(self, node: hou.Node, asset_id: str, update: bool) -> bool:
@@ -520,7 +540,7 @@ class NodeHandler:
 
         # Filepath where to save stuff
         file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + self._preferences.ext
@@ -528,7 +548,7 @@ class NodeHandler:
 
         # interface-stuff
         parms_file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + ".interface"
@@ -544,20 +564,20 @@ class NodeHandler:
         if not update:
             if not self._preferences.render_on_import:
                 return True
-        thumber = thumbs.ThumbNailRenderer(self._preferences)
+        thumber = thumbs.ThumbNailRenderer(self._preferences, directory=self._dir)
         return thumber.create_thumb_octane(node, asset_id)
 
     def save_node_arnold(self, node: hou.Node, asset_id: str, update: bool) -> bool:
         """Saves the Arnold node to disk - does not add to library"""
         file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + self._preferences.ext
         )
 
         parms_file_name = (
-            self._preferences.dir
+            self._dir
             + self._preferences.asset_dir
             + str(asset_id)
             + ".interface"
@@ -574,5 +594,5 @@ class NodeHandler:
             if not self._preferences.render_on_import:
                 return True
 
-        thumber = thumbs.ThumbNailRenderer(self._preferences)
+        thumber = thumbs.ThumbNailRenderer(self._preferences, directory=self._dir)
         return thumber.create_thumb_arnold(node, asset_id)
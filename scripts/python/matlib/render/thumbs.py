@@ -14,15 +14,20 @@ importlib.reload(thumbnail_scene)
 
 class ThumbNailRenderer:
     def __init__(
-        self, preferences: prefs.Prefs, mat: material.Material | None = None
+        self,
+        preferences: prefs.Prefs,
+        mat: material.Material | None = None,
+        directory: str | None = None,
     ) -> None:
         self._mat = mat
         self._preferences = preferences
         self._builder = None
         self._preferences.load()
+        # Library the thumbnails are written to - the one in the preferences by default
+        self._dir = os.path.join(directory or self._preferences.dir, "")
 
     def create_thumbnail(self) -> None:
-        node_handler = nodes.NodeHandler(self._preferences)
+        node_handler = nodes.NodeHandler(self._preferences, self._dir)
         if self._mat:
             node_handler.import_asset_to_scene(self._mat)
 
@@ -47,7 +52,7 @@ class ThumbNailRenderer:
     def create_thumb_mtlx(self, node: hou.Node, asset_id: str) -> bool:
         # Build path
         path = (
-            self._preferences.dir + self._preferences.img_dir + str(asset_id) + ".exr"
+            self._dir + self._preferences.img_dir + str(asset_id) + ".exr"
         )
 
         # Create Thumbnail
@@ -198,7 +203,7 @@ class ThumbNailRenderer:
             cop_out.setInput(0, cop_vop)
 
         newpath = (
-            self._preferences.dir
+            self._dir
             + self._preferences.img_dir
             + str(asset_id)
             + self._preferences.img_ext
@@ -222,7 +227,7 @@ class ThumbNailRenderer:
         thumb.parm("mat").set(node.path())
 
         # Build path
-        path = self._preferences.dir + self._preferences.img_dir + str(asset_id)
+        path = self._dir + self._preferences.img_dir + str(asset_id)
 
         #  Set Renderpreferences and Object Exclusions for Thumbnail Rendering
         thumb.parm("path").set(path + ".exr")
@@ -251,7 +256,7 @@ class ThumbNailRenderer:
 
         # Build path
         path = (
-            self._preferences.dir
+            self._dir
             + self._preferences.img_dir
             + str(asset_id)
             + self._preferences.img_ext
@@ -279,7 +284,7 @@ class ThumbNailRenderer:
         thumb.parm("mat").set(node.path())
         # Build path
         path = (
-            self._preferences.dir
+            self._dir
             + self._preferences.img_dir
             + str(asset_id)
             + self._preferences.img_ext
@@ -308,7 +313,7 @@ class ThumbNailRenderer:
         thumb.parm("mat").set(node.path())
 
         # Build path
-        path = self._preferences.dir + self._preferences.img_dir + str(asset_id)
+        path = self._dir + self._preferences.img_dir + str(asset_id)
 
         #  Set Rendersettings and Object Exclusions for Thumbnail Rendering
         thumb.parm("path").set(path + ".exr")
@@ -0,0 +1,146 @@
+"""
+Benchmarks for the MatLib Database on-disk formats and for encoding saves
+Run with hython -m matlib.utils.benchmark [asset_count] [directory]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from matlib.core import fileio, journal
+
+
+def synthetic_library(count: int) -> dict:
+    """
+    Build library data with the given number of synthetic assets
+
+    :param count: Number of assets
+    :type count: int
+    :return: Library data in the layout of library.json
+    :rtype: dict
+    """
+    categories = [f"Category{c}" for c in range(40)]
+    tags = [f"tag{t}" for t in range(200)]
+    assets = []
+    for i in range(count):
+        assets.append(
+            {
+                "id": str(138000000000000000 + i),
+                "name": f"Material_{i:06d}",
+                "categories": [categories[i % len(categories)]],
+                "tags": [tags[i % len(tags)], tags[(i * 7) % len(tags)]],
+                "favorite": i % 13 == 0,
+                "date": "2024-05-17 14:23:11",
+                "renderer": ("MaterialX", "Redshift", "Mantra")[i % 3],
+                "usd": 1,
+                "builder": 0,
+            }
+        )
+    return {"categories": ["_All"] + categories, "tags": tags, "assets": assets}
+
+
+def _best_of(runs: int, func) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_formats(count: int, directory: str, runs: int = 3) -> list[tuple]:
+    """
+    Measure save and load latency and size on disk for every format in fileio.FORMATS
+
+    :param count: Number of synthetic assets
+    :type count: int
+    :param directory: Directory to write the test files to
+    :type directory: str
+    :param runs: The best of this many runs is reported
+    :type runs: int
+    :return: Rows of (format, save seconds, load seconds, bytes)
+    :rtype: list[tuple]
+    """
+    data = synthetic_library(count)
+    results = []
+    for file_format in fileio.FORMATS:
+        path = fileio.format_path(os.path.join(directory, "library.json"), file_format)
+        save = _best_of(
+            runs,
+            lambda: fileio.atomic_write(path, fileio.encode_json(data, file_format)),
+        )
+        load = _best_of(runs, lambda: fileio.load_json(path))
+        results.append((file_format, save, load, os.path.getsize(path)))
+        os.remove(path)
+    return results
+
+
+def bench_saves(
+    count: int = 50000, changed: tuple[int, ...] = (1, 10, 100, 1000, 10000), runs: int = 3
+) -> list[tuple]:
+    """
+    Measure the CPU time of encoding library.json for a save after a few assets changed -
+    everything re-encoded against the fragment cache, which only encodes the changed assets
+
+    :param count: Number of synthetic assets
+    :type count: int
+    :param changed: Numbers of changed assets to measure
+    :type changed: tuple[int, ...]
+    :param runs: The best of this many runs is reported
+    :type runs: int
+    :return: Rows of (changed assets, full encode seconds, fragment encode seconds,
+        diff seconds) - the diff compares only the assets the edit methods have marked
+    :rtype: list[tuple]
+    """
+    data = synthetic_library(count)
+    persisted = journal.snapshot(data)
+    cache = fileio.FragmentCache()
+    cache.encode(data)
+    results = []
+    for number in changed:
+        number = min(number, count)
+
+        def edit():
+            for asset in data["assets"][:number]:
+                asset["favorite"] = not asset["favorite"]
+
+        full = _best_of(runs, lambda: fileio.encode_json(data))
+        fragments = float("inf")
+        diff = float("inf")
+        for _ in range(runs):
+            edit()
+            edited = {journal.asset_key(a): a for a in data["assets"][:number]}
+            start = time.process_time()
+            records = journal.diff(persisted, data, edited)
+            diff = min(diff, time.process_time() - start)
+            start = time.process_time()
+            journal.update_snapshot(persisted, records)
+            cache.invalidate(journal.asset_key(r["value"]) for r in records)
+            raw = cache.encode(data)
+            fragments = min(fragments, time.process_time() - start)
+        if raw != fileio.encode_json(data):
+            raise AssertionError("MatLib: Spliced fragments differ from the full encode")
+        results.append((number, full, fragments, diff))
+    return results
+
+
+def main(argv: list[str]) -> None:
+    count = int(argv[1]) if len(argv) > 1 else 40000
+    directory = argv[2] if len(argv) > 2 else tempfile.mkdtemp(prefix="matlib_bench_")
+
+    print(f"MatLib: Library formats with {count} assets in {directory}")
+    print(f"{'format':<10}{'save ms':>10}{'load ms':>10}{'MB':>10}")
+    for file_format, save, load, size in bench_formats(count, directory):
+        print(
+            f"{file_format:<10}{save * 1000:>10.1f}{load * 1000:>10.1f}{size / 1e6:>10.2f}"
+        )
+
+    print(f"MatLib: Encoding saves of {count} assets")
+    print(f"{'changed':<10}{'full ms':>10}{'cached ms':>10}{'diff ms':>10}")
+    for changed, full, fragments, diff in bench_saves(count):
+        print(f"{changed:<10}{full * 1000:>10.1f}{fragments * 1000:>10.1f}{diff * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
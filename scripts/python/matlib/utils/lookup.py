@@ -0,0 +1,88 @@
+"""
+Headless Asset Lookup for Farm and Batch Sessions
+Run with hython -m matlib.utils.lookup library_dir name [name ...] [--id]
+Prints the matching asset records as json - exits with 1 if a name was not found
+"""
+
+import json
+import os
+import sys
+
+from matlib.core import binary_snapshot, database
+
+
+def find_assets(directory: str, name: str) -> list[dict]:
+    """
+    Return all assets with the given name - case insensitive
+    Reads library.snapshot if it is current and falls back to parsing the library otherwise
+
+    :param directory: Library directory
+    :type directory: str
+    :param name: Asset name
+    :type name: str
+    :return: Matching assets in library order
+    :rtype: list[dict]
+    """
+    directory = os.path.join(directory, "")
+    snapshot = binary_snapshot.open_snapshot(directory)
+    if snapshot:
+        with snapshot:
+            return snapshot.find(name)
+    key = name.casefold()
+    return [
+        asset
+        for asset in database.read_library(directory)["assets"]
+        if str(asset.get("name", "")).casefold() == key
+    ]
+
+
+def get_asset(directory: str, mat_id: str) -> dict | None:
+    """
+    Return the asset with the given id - None if there is none
+    Reads library.snapshot if it is current and falls back to parsing the library otherwise
+
+    :param directory: Library directory
+    :type directory: str
+    :param mat_id: Asset id
+    :type mat_id: str
+    :return: The asset record
+    :rtype: dict | None
+    """
+    directory = os.path.join(directory, "")
+    snapshot = binary_snapshot.open_snapshot(directory)
+    if snapshot:
+        with snapshot:
+            return snapshot.get(mat_id)
+    for asset in database.read_library(directory)["assets"]:
+        if str(asset["id"]) == str(mat_id):
+            return asset
+    return None
+
+
+def main(argv: list[str]) -> int:
+    args = argv[1:]
+    by_id = "--id" in args
+    if by_id:
+        args.remove("--id")
+    if len(args) < 2:
+        print(__doc__.strip().splitlines()[1])
+        return 2
+
+    found = []
+    missing = 0
+    for key in args[1:]:
+        if by_id:
+            asset = get_asset(args[0], key)
+            assets = [asset] if asset else []
+        else:
+            assets = find_assets(args[0], key)
+        if not assets:
+            missing += 1
+            print(f"MatLib: {key} not found in {args[0]}", file=sys.stderr)
+        found.extend(assets)
+    print(json.dumps(found, indent=4))
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
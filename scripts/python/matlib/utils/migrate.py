@@ -0,0 +1,64 @@
+"""
+Headless Schema Migration for many MatLib Libraries in one batch
+Run with hython -m matlib.utils.migrate library_dir [library_dir ...]
+"""
+
+import os
+import sys
+
+from matlib.core import database, migrations
+
+
+def migrate_library(path: str) -> tuple[int, int]:
+    """
+    Upgrade the library file in path to the current schema and write it back in its format
+    The previous file is kept as the newest backup generation, e.g. library.json.xz.1
+
+    :param path: Library directory
+    :type path: str
+    :return: Schema version before and after
+    :rtype: tuple[int, int]
+    """
+    path = os.path.join(path, "")
+    if not database.find_library_file(path):
+        raise FileNotFoundError(f"MatLib: No library file in {path}")
+    connection = database.DatabaseConnector(path)
+    data = connection.load()
+    connection.close()
+    return connection.loaded_schema, migrations.version(data)
+
+
+def migrate_libraries(paths: list[str]) -> dict[str, tuple[int, int] | Exception]:
+    """
+    Migrate all given libraries - a broken library does not stop the batch
+
+    :param paths: Library directories
+    :type paths: list[str]
+    :return: Versions before and after or the error per library
+    :rtype: dict[str, tuple[int, int] | Exception]
+    """
+    results = {}
+    for path in paths:
+        try:
+            results[path] = migrate_library(path)
+        except (OSError, ValueError) as error:
+            results[path] = error
+    return results
+
+
+def main(argv: list[str]) -> int:
+    results = migrate_libraries(argv[1:])
+    failed = 0
+    for path, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"MatLib: {path} failed - {result}")
+        elif result[0] == result[1]:
+            print(f"MatLib: {path} is up to date (schema {result[1]})")
+        else:
+            print(f"MatLib: {path} migrated from schema {result[0]} to {result[1]}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
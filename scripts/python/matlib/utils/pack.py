@@ -0,0 +1,57 @@
+"""
+Headless Export and Import of MatLib Packs
+Run with hython -m matlib.utils.pack
+    export library_dir file.matlibpack [--category C] [--tag T] [--id ID]
+    import file.matlibpack library_dir [--overwrite]
+    list file.matlibpack
+    extract file.matlibpack asset_id directory
+"""
+
+import sys
+
+from matlib.core import database, fileio, pack
+
+
+def _options(args: list[str], name: str) -> list[str]:
+    """Remove all occurrences of an option from args and return their values"""
+    values = []
+    while name in args:
+        at = args.index(name)
+        values.append(args[at + 1])
+        del args[at : at + 2]
+    return values
+
+
+def main(argv: list[str]) -> int:
+    args = argv[1:]
+    command = args.pop(0) if args else ""
+    if command == "export" and len(args) >= 2:
+        categories = _options(args, "--category")
+        tags = _options(args, "--tag")
+        ids = _options(args, "--id")
+        packer = pack.LibraryPacker(fileio.LibraryLayout(args[0]))
+        assets = pack.select_assets(database.connect(args[0]).load(), categories, tags, ids)
+        count = packer.export(args[1], assets)
+        print(f"MatLib: Exported {count} assets to {args[1]}")
+    elif command == "import" and len(args) >= 2:
+        overwrite = "--overwrite" in args
+        packer = pack.LibraryPacker(fileio.LibraryLayout(args[1]))
+        added, replaced = packer.import_pack(args[0], overwrite)
+        database.connect(args[1]).flush()
+        print(f"MatLib: Imported {added} new and replaced {replaced} assets from {args[0]}")
+    elif command == "list" and len(args) == 1:
+        with pack.PackReader(args[0]) as reader:
+            for asset in reader.records()["assets"]:
+                print(f"{asset['id']}\t{asset.get('name', '')}\t{', '.join(asset['categories'])}")
+    elif command == "extract" and len(args) == 3:
+        with pack.PackReader(args[0]) as reader:
+            for path in reader.extract_asset(args[1], args[2]):
+                print(f"MatLib: Extracted {path}")
+    else:
+        print(__doc__.strip().split("\n", 1)[1])
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,43 @@
+"""
+Serve a MatLib Library over HTTP to Sessions using the http Backend
+Run with hython -m matlib.utils.serve library_dir [--host HOST] [--port N] [--verbose]
+"""
+
+import sys
+
+from matlib.core import library_server
+
+
+def main(argv: list[str]) -> int:
+    args = argv[1:]
+    verbose = "--verbose" in args
+    if verbose:
+        args.remove("--verbose")
+    host = "127.0.0.1"
+    if "--host" in args:
+        at = args.index("--host")
+        host = args[at + 1]
+        del args[at : at + 2]
+    port = library_server.DEFAULT_PORT
+    if "--port" in args:
+        at = args.index("--port")
+        port = int(args[at + 1])
+        del args[at : at + 2]
+    if len(args) != 1:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+
+    server = library_server.LibraryServer(args[0], host, port, verbose)
+    print(f"MatLib: Serving {server.root} at {server.url} - stop with Ctrl+C")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.connection.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,44 @@
+"""
+Headless Sync of a MatLib Library to another Directory, e.g. a site copy or a local SSD cache
+Run with hython -m matlib.utils.sync source_dir target_dir [--dry-run] [--workers N]
+"""
+
+import sys
+import time
+
+from matlib.core import fileio, sync
+
+
+def main(argv: list[str]) -> int:
+    args = argv[1:]
+    dry_run = "--dry-run" in args
+    if dry_run:
+        args.remove("--dry-run")
+    workers = sync.WORKERS
+    if "--workers" in args:
+        at = args.index("--workers")
+        workers = int(args[at + 1])
+        del args[at : at + 2]
+    if len(args) != 2:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+
+    start = time.perf_counter()
+    changes = sync.sync(
+        sync.LibraryFiles(fileio.LibraryLayout(args[0])),
+        sync.LibraryFiles(fileio.LibraryLayout(args[1])),
+        dry_run,
+        workers,
+    )
+    action = "Would sync" if dry_run else "Synced"
+    print(
+        f"MatLib: {action} {args[0]} to {args[1]} - "
+        f"{len(changes['copy'])} files copied, {len(changes['delete'])} files deleted, "
+        f"{len(changes['records'])} records updated, {len(changes['remove'])} records removed "
+        f"in {time.perf_counter() - start:.2f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
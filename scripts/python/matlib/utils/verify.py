@@ -0,0 +1,37 @@
+"""
+Headless Integrity Check of MatLib Libraries
+Run with hython -m matlib.utils.verify library_dir [--full] [--workers N] [--report file.json]
+Prints the json report - exits with 1 if corrupt or missing files were found
+"""
+
+import json
+import sys
+
+from matlib.core import fileio, integrity
+
+
+def main(argv: list[str]) -> int:
+    args = argv[1:]
+    full = "--full" in args
+    if full:
+        args.remove("--full")
+    options = {"--workers": str(integrity.WORKERS), "--report": ""}
+    for option in options:
+        if option in args:
+            at = args.index(option)
+            options[option] = args[at + 1]
+            del args[at : at + 2]
+    if len(args) != 1:
+        print(__doc__.strip().splitlines()[1])
+        return 2
+
+    checker = integrity.IntegrityChecker(fileio.LibraryLayout(args[0]))
+    report = checker.verify(full, int(options["--workers"]))
+    if options["--report"]:
+        checker.write_report(report, options["--report"])
+    print(json.dumps(report, indent=4))
+    return 1 if report["corrupt"] or report["missing"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,127 @@
+"""
+Shared Fixtures for the MatLib Tests
+The tests cover the core modules and run without Houdini: python -m pytest tests
+"""
+
+import json
+import os
+import sys
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, "scripts", "python")
+sys.path.insert(0, SCRIPTS)
+
+# matlib/__init__.py imports the panel, which needs hou - register the package without running it
+if "matlib" not in sys.modules:
+    _package = types.ModuleType("matlib")
+    _package.__path__ = [os.path.join(SCRIPTS, "matlib")]
+    sys.modules["matlib"] = _package
+
+from matlib.core import database, migrations  # noqa: E402
+
+
+def make_assets(count: int) -> list[dict]:
+    """Return assets as stored in library.json"""
+    return [
+        {
+            "id": str(1000 + i),
+            "name": f"mat{i}",
+            "categories": ["Metal"],
+            "tags": ["a"],
+            "favorite": False,
+            "date": "2024-01-01 00:00:00",
+            "renderer": "MaterialX",
+            "usd": 1,
+            "builder": 0,
+        }
+        for i in range(count)
+    ]
+
+
+def write_library(directory: str, count: int) -> str:
+    """Create a library with count assets and their files - returns the path ending in a slash"""
+    directory = os.path.join(directory, "")
+    os.makedirs(directory + "mat", exist_ok=True)
+    os.makedirs(directory + "img", exist_ok=True)
+    assets = make_assets(count)
+    for asset in assets:
+        for ext in (".mat", ".interface"):
+            with open(directory + "mat/" + asset["id"] + ext, "w", encoding="utf-8") as f:
+                f.write(asset["id"])
+    data = {
+        "schema_version": migrations.SCHEMA_VERSION,
+        "categories": ["_All", "Metal"],
+        "tags": ["a"],
+        "assets": assets,
+    }
+    with open(directory + database.LIBRARY_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    return directory
+
+
+def read_library(library: str) -> dict:
+    """Return library.json as written to disk"""
+    with open(library + database.LIBRARY_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def rewrite_library(library: str, data: dict) -> None:
+    """Replace library.json like another session would"""
+    # A newer mtime and another size, even on file systems with coarse timestamps
+    data["padding"] = "x" * 64
+    with open(library + database.LIBRARY_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    stat = os.stat(library + database.LIBRARY_FILE)
+    os.utime(library + database.LIBRARY_FILE, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.fixture(autouse=True)
+def _fresh_connections():
+    """Every test gets its own connections - they are cached per library path"""
+    database._connections.clear()
+    yield
+    for connection in list(database._connections.values()):
+        connection.close()
+    database._connections.clear()
+
+
+@pytest.fixture
+def qapp():
+    """A Qt application - connections write on the writer thread and coalesce saves with a timer"""
+    from PySide6 import QtCore
+
+    return QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+
+
+@pytest.fixture
+def library(tmp_path) -> str:
+    """A library with five assets"""
+    return write_library(str(tmp_path / "lib"), 5)
+
+
+@pytest.fixture
+def preferences(library) -> types.SimpleNamespace:
+    """The storage related preferences of settings.json pointing at the library fixture"""
+    return types.SimpleNamespace(
+        dir=library,
+        asset_dir="mat/",
+        img_dir="img/",
+        ext=".mat",
+        img_ext=".png",
+        journal=False,
+        backend="json",
+        backups=3,
+        save_delay=0,
+        library_format="json",
+        background_save=False,
+        binary_snapshot=False,
+        blob_store=False,
+        history_revisions=10,
+        undo_steps=50,
+        read_cache="",
+        read_cache_size=2048,
+        server_url="",
+    )
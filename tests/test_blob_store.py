@@ -0,0 +1,112 @@
+"""
+Tests for the content-addressed blob store of core/blob_store.py
+"""
+
+import os
+
+from conftest import write_library
+from matlib.core import blob_store, fileio
+
+
+def _write(path: str, content: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def _read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def _blobs(store: blob_store.BlobStore) -> list[str]:
+    directory = store.path + blob_store.BLOB_DIR
+    return sorted(
+        entry.name
+        for bucket in os.scandir(directory)
+        if len(bucket.name) == 2
+        for entry in os.scandir(bucket.path)
+    )
+
+
+def _store(library: str) -> blob_store.BlobStore:
+    return blob_store.BlobStore(fileio.LibraryLayout(library))
+
+
+def test_identical_files_are_stored_once(library):
+    store = _store(library)
+    _write(library + "mat/1000.mat", "shared")
+    _write(library + "mat/1001.mat", "shared")
+
+    first = store.add_asset("1000")
+    second = store.add_asset("1001")
+
+    assert first["mat"] == second["mat"] == {"hash": first["mat"]["hash"], "size": 6}
+    assert store.manifest("1001") == second
+    blob = store.blob_path(first["mat"]["hash"])
+    assert os.path.samefile(blob, library + "mat/1000.mat")
+    assert os.path.samefile(blob, library + "mat/1001.mat")
+    # mat + the two different .interface files
+    assert len(_blobs(store)) == 3
+    assert _read(library + "mat/1001.mat") == "shared"
+
+
+def test_detach_gives_an_asset_its_own_copy(library):
+    store = _store(library)
+    _write(library + "mat/1000.mat", "shared")
+    _write(library + "mat/1001.mat", "shared")
+    store.add_asset("1000")
+    store.add_asset("1001")
+
+    store.detach_asset("1000")
+    _write(library + "mat/1000.mat", "edited")
+
+    assert _read(library + "mat/1001.mat") == "shared"
+    assert _read(store.blob_path(store.manifest("1000")["mat"]["hash"])) == "shared"
+
+
+def test_import_only_links_content_the_library_has(tmp_path, library):
+    store = _store(library)
+    store.add_asset("1000")
+    other = write_library(str(tmp_path / "v1"), 3)
+    _write(other + "mat/1002.mat", "new")
+
+    files = store.import_asset(
+        "2000", {"mat": other + "mat/1002.mat", "interface": other + "mat/1000.interface"}
+    )
+
+    assert os.path.samefile(library + "mat/2000.interface", library + "mat/1000.interface")
+    assert os.path.samefile(library + "mat/2000.mat", store.blob_path(files["mat"]["hash"]))
+    assert not os.path.samefile(library + "mat/2000.mat", other + "mat/1002.mat")
+    assert _read(library + "mat/2000.mat") == "new"
+    assert len(_blobs(store)) == 2
+
+
+def test_copy_asset_links_the_files_into_another_library(tmp_path, library):
+    store = _store(library)
+    store.add_asset("1001")
+    target = _store(write_library(str(tmp_path / "target"), 0))
+
+    assert target.copy_asset("1001", "1") is False
+    assert store.copy_asset("1001", "7", target)
+
+    assert target.manifest("7") == store.manifest("1001")
+    assert os.path.samefile(target.layout.asset_files("7")["mat"], library + "mat/1001.mat")
+
+
+def test_collect_garbage_removes_only_unused_blobs(library):
+    store = _store(library)
+    _write(library + "mat/1000.mat", "shared")
+    _write(library + "mat/1001.mat", "shared")
+    for mat_id in ("1000", "1001", "1002"):
+        store.add_asset(mat_id)
+    kept = store.manifest("1001")
+    unused = store.manifest("1002")
+
+    store.remove_asset("1000")
+    store.remove_asset("1002")
+    assert store.manifest("1002") is None
+
+    assert store.collect_garbage() == (2, 8)
+    assert _blobs(store) == sorted(entry["hash"] for entry in kept.values())
+    assert not any(os.path.exists(store.blob_path(e["hash"])) for e in unused.values())
+    assert store.collect_garbage() == (0, 0)
@@ -0,0 +1,70 @@
+"""
+Tests for the coalesced saving of the DatabaseConnector in core/database.py
+"""
+
+from PySide6 import QtCore
+
+from conftest import read_library, write_library
+from matlib.core import database
+
+
+def _connect(preferences, library: str, save_delay: int) -> database.DatabaseConnector:
+    preferences.save_delay = save_delay
+    connection = database.connect(library)
+    connection.configure(preferences)
+    connection.load()
+    return connection
+
+
+def _rename_all(connection: database.DatabaseConnector, prefix: str) -> None:
+    for asset in list(connection.load()["assets"]):
+        connection.update_asset(dict(asset, name=prefix + asset["id"]))
+
+
+def test_without_a_delay_every_edit_is_written(qapp, preferences, library):
+    connection = _connect(preferences, library, 0)
+    _rename_all(connection, "now")
+
+    assert connection.writes_requested == connection.writes_performed == 5
+    assert not connection.dirty
+    assert read_library(library)["assets"][4]["name"] == "now1004"
+
+
+def test_a_burst_of_edits_is_written_once_on_flush(qapp, preferences, library):
+    connection = _connect(preferences, library, 60000)
+    before = read_library(library)
+    _rename_all(connection, "burst")
+    connection.save()
+
+    assert connection.dirty
+    assert (connection.writes_requested, connection.writes_performed) == (6, 0)
+    assert read_library(library) == before
+
+    connection.flush()
+    assert connection.writes_performed == 1
+    assert not connection.dirty
+    assert [a["name"] for a in read_library(library)["assets"]][:2] == ["burst1000", "burst1001"]
+
+
+def test_edits_are_written_once_the_library_is_quiet(qapp, preferences, library):
+    connection = _connect(preferences, library, 20)
+    _rename_all(connection, "quiet")
+    assert connection.writes_performed == 0
+
+    loop = QtCore.QEventLoop()
+    QtCore.QTimer.singleShot(200, loop.quit)
+    loop.exec()
+
+    assert connection.writes_performed == 1
+    assert read_library(library)["assets"][0]["name"] == "quiet1000"
+
+
+def test_flush_all_writes_every_open_library(qapp, tmp_path, preferences, library):
+    other = write_library(str(tmp_path / "other"), 2)
+    connections = [_connect(preferences, path, 60000) for path in (library, other)]
+    for connection in connections:
+        _rename_all(connection, "all")
+
+    database.flush_all()
+    assert [c.writes_performed for c in connections] == [1, 1]
+    assert read_library(other)["assets"][1]["name"] == "all1001"
@@ -0,0 +1,20 @@
+"""
+Tests for the per-library connections of core/database.py
+"""
+
+from conftest import write_library
+from matlib.core import database
+
+
+def test_connect_normalizes_the_path(library):
+    connection = database.connect(library.rstrip("/"))
+    assert connection.path == library
+    assert database.connect(library) is connection
+    assert len(connection.load()["assets"]) == 5
+
+
+def test_connections_of_different_libraries_are_independent(tmp_path, library):
+    other = write_library(str(tmp_path / "other"), 2)
+    assert database.connect(other) is not database.connect(library)
+    assert len(database.connect(other).load()["assets"]) == 2
+    assert len(database.connect(library).load()["assets"]) == 5
@@ -0,0 +1,75 @@
+"""
+Tests for the change events of core/events.py published by the DatabaseConnector
+"""
+
+from conftest import read_library, rewrite_library
+from matlib.core import database, events
+
+
+class Recorder:
+    """Collects the published event lists - the bus only keeps a weak reference"""
+
+    def __init__(self, connection: database.DatabaseConnector) -> None:
+        self.received = []
+        connection.subscribe(self.on_changes)
+
+    def on_changes(self, changes: list[events.Event]) -> None:
+        self.received.append([(c.kind, c.key, c.source) for c in changes])
+
+
+def test_edits_publish_typed_events(library):
+    connection = database.connect(library)
+    data = connection.load()
+    recorder = Recorder(connection)
+    model = object()
+
+    connection.update_asset(dict(data["assets"][0], name="changed"), model)
+    connection.remove_asset("1001")
+    connection.add_categories(["Wood", "Metal"])
+
+    assert recorder.received == [
+        [(events.ASSET_CHANGED, "1000", model)],
+        [(events.ASSET_REMOVED, "1001", None)],
+        [(events.CATEGORY_ADDED, "Wood", None)],
+    ]
+
+
+def test_transaction_delivers_its_events_in_one_list(library):
+    connection = database.connect(library)
+    data = connection.load()
+    recorder = Recorder(connection)
+
+    with connection.transaction():
+        connection.update_asset(dict(data["assets"][0], name="changed"))
+        connection.remove_asset("1001")
+        assert recorder.received == []
+
+    assert [[kind for kind, _, _ in changes] for changes in recorder.received] == [
+        [events.ASSET_CHANGED, events.ASSET_REMOVED]
+    ]
+
+
+def test_reload_publishes_reloaded_if_the_library_changed(library):
+    connection = database.connect(library)
+    connection.load()
+    recorder = Recorder(connection)
+    model = object()
+
+    connection.reload(model)
+    assert recorder.received == []
+
+    data = read_library(library)
+    data["assets"][0]["name"] = "other session"
+    rewrite_library(library, data)
+    assert connection.reload(model)["assets"][0]["name"] == "other session"
+    assert recorder.received == [[(events.RELOADED, "", model)]]
+
+
+def test_deleted_subscribers_are_dropped(library):
+    connection = database.connect(library)
+    data = connection.load()
+    recorder = Recorder(connection)
+    del recorder
+
+    connection.update_asset(dict(data["assets"][0], name="changed"))
+    assert not connection.in_use
@@ -0,0 +1,70 @@
+"""
+Tests for the atomic writes and backup recovery of core/fileio.py
+"""
+
+import json
+import os
+
+import pytest
+
+from matlib.core import fileio
+
+
+def _write(path: str, data: dict, backups: int = 3) -> None:
+    fileio.atomic_write(path, json.dumps(data).encode("utf-8"), backups)
+
+
+def test_atomic_write_keeps_backup_generations(tmp_path):
+    path = str(tmp_path / "library.json")
+    for revision in range(5):
+        _write(path, {"revision": revision})
+
+    assert fileio.load_json(path) == ({"revision": 4}, None)
+    for generation in (1, 2, 3):
+        with open(fileio.backup_path(path, generation), encoding="utf-8") as f:
+            assert json.load(f) == {"revision": 4 - generation}
+    assert not os.path.exists(fileio.backup_path(path, 4))
+
+
+def test_atomic_write_leaves_no_temporary_files(tmp_path):
+    path = str(tmp_path / "library.json")
+    _write(path, {"revision": 1}, backups=0)
+    assert os.listdir(tmp_path) == ["library.json"]
+
+
+def test_load_json_recovers_from_newest_parseable_backup(tmp_path):
+    path = str(tmp_path / "library.json")
+    for revision in range(3):
+        _write(path, {"revision": revision})
+    # A truncated file and a broken first backup
+    with open(path, "wb") as f:
+        f.write(b'{"revision": 2, "assets": [')
+    with open(fileio.backup_path(path, 1), "wb") as f:
+        f.write(b"")
+
+    data, recovered = fileio.load_json(path, backups=3)
+    assert data == {"revision": 0}
+    assert recovered == fileio.backup_path(path, 2)
+
+
+def test_load_json_ignores_backups_when_not_asked(tmp_path):
+    path = str(tmp_path / "library.json")
+    _write(path, {"revision": 0})
+    _write(path, {"revision": 1})
+    with open(path, "wb") as f:
+        f.write(b"{")
+    with pytest.raises(ValueError):
+        fileio.load_json(path)
+
+
+def test_load_json_raises_first_error_if_nothing_is_readable(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        fileio.load_json(str(tmp_path / "library.json"), backups=3)
+
+
+@pytest.mark.parametrize("file_format", list(fileio.FORMATS))
+def test_load_json_detects_compressed_backups(tmp_path, file_format):
+    path = str(tmp_path / "library.json")
+    fileio.atomic_write(path, fileio.encode_json({"revision": 0}, file_format), 1)
+    fileio.atomic_write(path, b"not json", 1)
+    assert fileio.load_json(path, backups=1)[0] == {"revision": 0}
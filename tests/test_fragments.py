@@ -0,0 +1,51 @@
+"""
+Tests for saves that only diff and encode the edited assets
+"""
+
+from conftest import make_assets, read_library, write_library
+from matlib.core import database, fileio, journal
+
+
+def test_save_writes_only_the_edited_asset(library, monkeypatch):
+    connection = database.connect(library)
+    data = connection.load()
+    compared = []
+    diff = journal.diff
+
+    def spy(base, current, changed=None):
+        compared.append(None if changed is None else sorted(changed))
+        return diff(base, current, changed)
+
+    monkeypatch.setattr(journal, "diff", spy)
+    connection.update_asset(dict(data["assets"][2], favorite=True))
+    connection.flush()
+
+    assert compared == [["1002"]]
+    assert read_library(library)["assets"][2]["favorite"] is True
+
+
+def _library(count: int = 3) -> dict:
+    return {"categories": ["_All", "Metal"], "tags": ["a"], "assets": make_assets(count)}
+
+
+def test_diff_compares_only_the_changed_assets():
+    base = journal.snapshot(_library())
+    data = _library()
+    data["assets"][0]["name"] = "unmarked"
+    data["assets"][1]["name"] = "marked"
+
+    records = journal.diff(base, data, {"1001": data["assets"][1], "1002": None})
+    assert records == [
+        {"op": "asset", "value": data["assets"][1]},
+        {"op": "remove", "id": "1002"},
+    ]
+
+
+def test_fragment_cache_matches_a_full_encode(tmp_path):
+    data = read_library(write_library(str(tmp_path / "lib"), 20))
+    cache = fileio.FragmentCache()
+    for file_format in fileio.FORMATS:
+        assert cache.encode(data, file_format) == fileio.encode_json(data, file_format)
+    data["assets"][3]["name"] = "changed"
+    cache.invalidate(["1003"])
+    assert cache.encode(data) == fileio.encode_json(data)
@@ -0,0 +1,103 @@
+"""
+Tests for the version history of the asset files in core/history.py
+"""
+
+import os
+
+import pytest
+
+from matlib.core import fileio, history
+
+PNG_HEADER = b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR"
+
+
+def _save(versions: history.AssetHistory, files: dict[str, bytes]) -> int:
+    """Overwrite the files of asset 1000 like saving over it and keep the previous ones"""
+    previous = versions.read_files("1000")
+    for role, path in versions.asset_files("1000").items():
+        with open(path, "wb") as f:
+            f.write(files[role])
+    return versions.add_revision("1000", previous)
+
+
+def _files(step: int) -> dict[str, bytes]:
+    lines = b"".join(b"node%d parm %d\n" % (i, step if i == 5 else 0) for i in range(50))
+    return {
+        "mat": lines,
+        "interface": b"interface %d\n" % step,
+        "image": PNG_HEADER + bytes([step]) * 64,
+    }
+
+
+@pytest.fixture
+def versions(library) -> history.AssetHistory:
+    layout = fileio.LibraryLayout(library)
+    saved = history.AssetHistory(layout, max_revisions=3)
+    _save(saved, _files(0))
+    return saved
+
+
+def _delta_files(library: str) -> dict[str, tuple]:
+    """Return inode and content of every delta - a rewritten delta gets a new inode"""
+    directory = library + history.HISTORY_DIR + "1000/"
+    found = {}
+    for name in os.listdir(directory):
+        if name.endswith(history.DELTA_EXT):
+            with open(directory + name, "rb") as f:
+                found[name] = (os.fstat(f.fileno()).st_ino, f.read())
+    return found
+
+
+def test_delta_round_trip():
+    old = b"a\nb\nc\nd\n"
+    current = b"a\nB\nc\nd\ne\n"
+    assert history.apply_delta(history.encode_delta(old, current), current) == old
+    assert history.apply_delta(history.encode_delta(old, b""), b"anything") == old
+
+
+def test_binary_files_are_stored_whole():
+    old = PNG_HEADER + b"\x01" * 64
+    assert history.is_binary(old)
+    assert not history.is_binary(b"node parm\n")
+    assert history.apply_delta(history.encode_delta(old, b""), b"other base") == old
+
+
+def test_every_revision_can_be_restored(versions, library):
+    for step in (1, 2):
+        _save(versions, _files(step))
+    # The files written by write_library(), then the first two saves
+    assert [e["revision"] for e in versions.revisions("1000")] == [3, 2, 1]
+
+    versions.restore("1000", 1)
+    restored = versions.read_files("1000")
+    assert (restored["mat"], restored["interface"]) == (b"1000", b"1000")
+    # The restore kept the replaced files as revision 4 and dropped revision 1
+    assert [e["revision"] for e in versions.revisions("1000")] == [4, 3, 2]
+    versions.restore("1000", 2)
+    assert versions.read_files("1000") == _files(0)
+
+
+def test_adding_a_revision_leaves_the_older_ones_untouched(versions, library):
+    _save(versions, _files(1))
+    before = _delta_files(library)
+
+    _save(versions, _files(2))
+    after = _delta_files(library)
+    assert {name: after[name] for name in before} == before
+    assert len(after) == len(before) + 3
+
+
+def test_the_oldest_revision_is_dropped_at_the_cap(versions, library):
+    for step in (1, 2, 3, 4):
+        _save(versions, _files(step))
+
+    assert [e["revision"] for e in versions.revisions("1000")] == [5, 4, 3]
+    assert not any(name.startswith(("1.", "2.")) for name in _delta_files(library))
+    versions.restore("1000", 3)
+    assert versions.read_files("1000") == _files(1)
+
+
+def test_unchanged_files_add_no_revision(versions):
+    assert _save(versions, _files(0)) == 0
+    with pytest.raises(KeyError):
+        versions.restore("1000", 9)
@@ -0,0 +1,97 @@
+"""
+Tests for the integrity check of the asset files in core/integrity.py
+"""
+
+import os
+import struct
+import zlib
+
+from matlib.core import database, fileio, integrity, shard_store
+
+
+def _chunk(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+PNG = (
+    integrity.PNG_SIGNATURE
+    + _chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+    + _chunk(b"IEND", b"")
+)
+
+
+def _with_images(library: str) -> str:
+    for mat_id in ("1000", "1001", "1002", "1003", "1004"):
+        with open(library + "img/" + mat_id + ".png", "wb") as f:
+            f.write(PNG)
+    return library
+
+
+def _verify(library: str, full: bool = False) -> dict:
+    return integrity.IntegrityChecker(fileio.LibraryLayout(library)).verify(full, workers=2)
+
+
+def test_complete_library_has_no_problems(library):
+    report = _verify(_with_images(library))
+    assert (report["corrupt"], report["missing"], report["orphan"]) == ([], [], [])
+    assert report["files"] == report["read"] == 15
+
+
+def test_corrupt_missing_and_orphan_files_are_reported(library):
+    _with_images(library)
+    with open(library + "img/1000.png", "wb") as f:
+        f.write(PNG[:-6])
+    with open(library + "mat/1001.mat", "wb") as f:
+        f.write(b"node" + b"\x00" * 32)
+    os.remove(library + "mat/1002.interface")
+    with open(library + "mat/9999.mat", "w", encoding="utf-8") as f:
+        f.write("stray")
+
+    report = _verify(library)
+    assert {(c["id"], c["role"]) for c in report["corrupt"]} == {
+        ("1000", "image"),
+        ("1001", "mat"),
+    }
+    assert [(m["id"], m["role"]) for m in report["missing"]] == [("1002", "interface")]
+    assert report["orphan"] == [library + "mat/9999.mat"]
+
+
+def test_checksums_are_cached_until_a_file_changes(library):
+    _with_images(library)
+    _verify(library)
+    assert _verify(library)["read"] == 0
+
+    with open(library + "mat/1003.mat", "w", encoding="utf-8") as f:
+        f.write("changed content")
+    assert _verify(library)["read"] == 1
+    assert _verify(library, full=True)["read"] == 15
+
+
+def test_content_changed_behind_the_cache_is_found_by_a_full_run(library):
+    _with_images(library)
+    _verify(library)
+    path = library + "mat/1003.mat"
+    stat = os.stat(path)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("9999")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert _verify(library)["corrupt"] == []
+    problems = [c["problem"] for c in _verify(library, full=True)["corrupt"]]
+    assert problems == ["content changed without a new size or mtime"]
+
+
+def test_sidecars_of_the_sharded_backend_are_no_orphans(preferences, library):
+    _with_images(library)
+    preferences.backend = "sharded"
+    connection = database.connect(library)
+    connection.configure(preferences)
+    connection.load()
+    connection.close()
+    assert os.path.exists(library + "mat/1000" + shard_store.SIDECAR_EXT)
+    with open(library + "mat/9999" + shard_store.SIDECAR_EXT, "w", encoding="utf-8") as f:
+        f.write("{}")
+
+    report = _verify(library)
+    assert (report["corrupt"], report["missing"]) == ([], [])
+    assert report["orphan"] == [library + "mat/9999" + shard_store.SIDECAR_EXT]
@@ -0,0 +1,85 @@
+"""
+Tests for the journal records, replay and three-way merge of core/journal.py
+"""
+
+import os
+
+from conftest import make_assets, read_library
+from matlib.core import database, journal
+
+
+def _library(count: int = 3) -> dict:
+    return {"categories": ["_All", "Metal"], "tags": ["a"], "assets": make_assets(count)}
+
+
+def test_replay_applies_appended_records(tmp_path):
+    data = _library()
+    records = [
+        {"op": "asset", "value": dict(data["assets"][0], name="renamed")},
+        {"op": "remove", "id": "1001"},
+        {"op": "tags", "value": ["a", "b"]},
+    ]
+    log = journal.Journal(str(tmp_path))
+    log.append(records[:2])
+    log.append(records[2:])
+
+    replayed = _library()
+    assert journal.Journal(str(tmp_path)).replay(replayed) == 3
+    assert [a["id"] for a in replayed["assets"]] == ["1000", "1002"]
+    assert replayed["assets"][0]["name"] == "renamed"
+    assert replayed["tags"] == ["a", "b"]
+
+
+def test_replay_cuts_off_a_torn_record(tmp_path):
+    log = journal.Journal(str(tmp_path))
+    log.append([{"op": "tags", "value": ["a", "b"]}])
+    good = os.path.getsize(log.path)
+    with open(log.path, "ab") as f:
+        f.write(b'{"op": "tags", "val')
+
+    data = _library()
+    replay = journal.Journal(str(tmp_path))
+    assert replay.replay(data) == 1
+    assert data["tags"] == ["a", "b"]
+    assert os.path.getsize(log.path) == good
+
+
+def test_diff_and_apply_round_trip():
+    base = _library()
+    data = _library()
+    data["assets"][1]["favorite"] = True
+    del data["assets"][2]
+    data["assets"].append(make_assets(4)[3])
+    data["categories"].append("Wood")
+
+    records = journal.diff(journal.snapshot(base), data)
+    journal.apply(base, records)
+    assert base == data
+
+
+def test_journaled_saves_append_and_load_replays(preferences, library):
+    preferences.journal = True
+    connection = database.connect(library)
+    connection.configure(preferences)
+    data = connection.load()
+    before = read_library(library)
+
+    connection.update_asset(dict(data["assets"][0], name="journaled"))
+    connection.flush()
+
+    assert read_library(library) == before
+    assert os.path.exists(library + journal.JOURNAL_FILE)
+    database._connections.clear()
+    assert database.connect(library).load()["assets"][0]["name"] == "journaled"
+
+
+def test_checkpoint_folds_the_journal_into_library_json(preferences, library):
+    preferences.journal = True
+    connection = database.connect(library)
+    connection.configure(preferences)
+    data = connection.load()
+    connection.update_asset(dict(data["assets"][0], name="journaled"))
+    connection.checkpoint()
+
+    assert not os.path.exists(library + journal.JOURNAL_FILE)
+    assert read_library(library)["assets"][0]["name"] == "journaled"
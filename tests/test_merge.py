@@ -0,0 +1,66 @@
+"""
+Tests for the three-way merge of concurrent library edits in core/journal.py
+"""
+
+from conftest import make_assets, read_library, rewrite_library
+from matlib.core import database, journal
+
+
+def _library(count: int = 3) -> dict:
+    return {"categories": ["_All", "Metal"], "tags": ["a"], "assets": make_assets(count)}
+
+
+def test_merge_keeps_fields_changed_on_either_side():
+    base = _library()
+    ours = _library()
+    theirs = _library()
+    ours["assets"][0]["favorite"] = True
+    theirs["assets"][0]["name"] = "theirs"
+    ours["assets"][1]["tags"] = ["a", "ours"]
+    theirs["assets"][1]["tags"] = ["a", "theirs"]
+
+    conflicts = []
+    merged = journal.merge(journal.snapshot(base), ours, theirs, conflicts)
+    assert conflicts == []
+    assert merged["assets"][0]["favorite"] is True
+    assert merged["assets"][0]["name"] == "theirs"
+    assert merged["assets"][1]["tags"] == ["a", "theirs", "ours"]
+
+
+def test_merge_reports_conflicts_and_keeps_our_value():
+    base = _library()
+    ours = _library()
+    theirs = _library()
+    ours["assets"][0]["name"] = "ours"
+    theirs["assets"][0]["name"] = "theirs"
+    ours["assets"][1]["favorite"] = True
+    theirs["assets"] = [a for a in theirs["assets"] if a["id"] != "1001"]
+
+    conflicts = []
+    merged = journal.merge(journal.snapshot(base), ours, theirs, conflicts)
+    assert {(c["id"], c["field"]) for c in conflicts} == {("1000", "name"), ("1001", None)}
+    names = {a["id"]: a["name"] for a in merged["assets"]}
+    assert names["1000"] == "ours"
+    # Our change brings the removed asset back
+    assert "1001" in names
+
+
+def test_merge_list_applies_our_additions_and_removals():
+    assert journal.merge_list(["a", "b"], ["a", "c"], ["a", "b", "d"]) == ["a", "d", "c"]
+
+
+def test_save_merges_edits_of_another_session(library):
+    connection = database.connect(library)
+    data = connection.load()
+    theirs = read_library(library)
+    theirs["revision"] = 7
+    theirs["assets"][0]["name"] = "theirs"
+    rewrite_library(library, theirs)
+
+    connection.update_asset(dict(data["assets"][1], favorite=True))
+    connection.flush()
+
+    written = read_library(library)
+    assert written["assets"][0]["name"] == "theirs"
+    assert written["assets"][1]["favorite"] is True
+    assert written["revision"] == 8
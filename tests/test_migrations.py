@@ -0,0 +1,83 @@
+"""
+Tests for the schema migrations of core/migrations.py and the batch migration of utils/migrate.py
+"""
+
+import json
+import os
+
+from conftest import read_library, write_library
+from matlib.core import database, migrations
+from matlib.utils import migrate
+
+
+def _unversioned(library: str) -> dict:
+    """Rewrite the library like MatLib wrote it before library.json carried a schema_version"""
+    data = read_library(library)
+    del data["schema_version"]
+    data["assets"][0]["id"] = int(data["assets"][0]["id"])
+    data["assets"][1]["renderer"] = "MatX"
+    del data["assets"][2]["tags"]
+    del data["assets"][2]["favorite"]
+    with open(library + database.LIBRARY_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return data
+
+
+def test_migrate_completes_unversioned_data(library):
+    data = _unversioned(library)
+
+    assert migrations.version(data) == migrations.UNVERSIONED
+    assert migrations.migrate(data)
+    assert next(iter(data)) == "schema_version"
+    assert migrations.is_current(data)
+    assert data["assets"][0]["id"] == "1000"
+    assert data["assets"][1]["renderer"] == "MaterialX"
+    assert data["assets"][2]["tags"] == []
+    assert data["assets"][2]["favorite"] is False
+
+
+def test_current_and_newer_data_is_left_alone(library):
+    data = read_library(library)
+    assert not migrations.migrate(data)
+    assert data == read_library(library)
+
+    data["schema_version"] = migrations.SCHEMA_VERSION + 1
+    newer = json.loads(json.dumps(data))
+    assert not migrations.migrate(data)
+    assert data == newer
+
+
+def test_load_writes_the_migrated_library_back(library):
+    _unversioned(library)
+    connection = database.connect(library)
+    data = connection.load()
+
+    assert connection.loaded_schema == migrations.UNVERSIONED
+    assert read_library(library)["schema_version"] == migrations.SCHEMA_VERSION
+    assert read_library(library)["assets"] == data["assets"]
+
+
+def test_load_of_a_current_library_writes_nothing(library):
+    inode = os.stat(library + database.LIBRARY_FILE).st_ino
+    connection = database.connect(library)
+    connection.load()
+
+    assert connection.loaded_schema == migrations.SCHEMA_VERSION
+    assert os.stat(library + database.LIBRARY_FILE).st_ino == inode
+    assert not os.path.exists(library + database.LIBRARY_FILE + ".1")
+
+
+def test_migrate_libraries_runs_the_whole_batch(tmp_path):
+    old = write_library(str(tmp_path / "old"), 3)
+    _unversioned(old)
+    current = write_library(str(tmp_path / "current"), 2)
+    missing = str(tmp_path / "missing")
+
+    results = migrate.migrate_libraries([old, missing, current])
+
+    assert results[old] == (migrations.UNVERSIONED, migrations.SCHEMA_VERSION)
+    assert isinstance(results[missing], FileNotFoundError)
+    assert results[current] == (migrations.SCHEMA_VERSION, migrations.SCHEMA_VERSION)
+    assert read_library(old)["schema_version"] == migrations.SCHEMA_VERSION
+    assert migrate.main(["migrate", old, current]) == 0
+    assert migrate.main(["migrate", missing]) == 1
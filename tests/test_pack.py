@@ -0,0 +1,79 @@
+"""
+Tests for the name validation of asset packs in core/pack.py
+"""
+
+import json
+import os
+
+import pytest
+
+from matlib.core import database, fileio, pack
+
+
+@pytest.mark.parametrize("mat_id", ["1000", 1000, "a-b_c"])
+def test_check_id_accepts_plain_ids(mat_id):
+    assert pack.check_id(mat_id) == str(mat_id)
+
+
+@pytest.mark.parametrize("mat_id", ["", ".", "..", "../x", "a/b", "a\\b", "c:x", "a\0b"])
+def test_check_id_rejects_ids_leaving_the_library(mat_id):
+    with pytest.raises(ValueError):
+        pack.check_id(mat_id)
+
+
+@pytest.mark.parametrize("name", ["mat/1000.mat", "img/1000.png", "assets/sub/1000.mat"])
+def test_check_name_accepts_relative_names(name):
+    assert pack.check_name(name) == name
+
+
+@pytest.mark.parametrize(
+    "name", ["", "/etc/1000.mat", "../1000.mat", "mat/../../1000.mat", "..\\1000.mat", "c:/x"]
+)
+def test_check_name_rejects_names_leaving_the_library(name):
+    with pytest.raises(ValueError):
+        pack.check_name(name)
+
+
+def _pack(path: str, mat_id: str, files: list[tuple[str, str]]) -> str:
+    records = {
+        "categories": [],
+        "tags": [],
+        "assets": [{"id": mat_id, "name": "packed", "categories": [], "tags": []}],
+    }
+    with pack.PackWriter(path) as writer:
+        writer.add(pack.RECORDS_ENTRY, json.dumps(records).encode("utf-8"))
+        for name, role in files:
+            writer.add(name, b"packed", mat_id, role)
+    return path
+
+
+@pytest.mark.parametrize(
+    "mat_id, files",
+    [
+        ("../../x", [("mat/../../x.mat", "mat")]),
+        ("7", [("../../etc/7.mat", "mat")]),
+        ("7", [("/tmp/7.mat", "mat")]),
+        ("7", [("mat/8.mat", "mat")]),
+        ("7", [("mat/7.mat", "script")]),
+    ],
+)
+def test_import_rejects_packs_writing_outside_the_asset(tmp_path, library, mat_id, files):
+    path = _pack(str(tmp_path / "evil.matlibpack"), mat_id, files)
+    before = sorted(os.listdir(library + "mat"))
+
+    with pytest.raises(ValueError):
+        pack.LibraryPacker(fileio.LibraryLayout(library)).import_pack(path)
+    with pack.PackReader(path) as reader, pytest.raises(ValueError):
+        reader.extract_asset(mat_id, str(tmp_path / "extracted"))
+
+    assert sorted(os.listdir(library + "mat")) == before
+    assert not os.path.exists(str(tmp_path / "extracted"))
+    assert not any(os.path.exists(str(tmp_path / n)) for n in ("x.mat", "7.mat"))
+
+
+def test_import_writes_files_with_the_layout_of_the_library(tmp_path, library):
+    path = _pack(str(tmp_path / "site.matlibpack"), "7", [("assets/7.mat", "mat")])
+
+    assert pack.LibraryPacker(fileio.LibraryLayout(library)).import_pack(path) == (1, 0)
+    assert os.path.exists(library + "mat/7.mat")
+    assert "7" in {a["id"] for a in database.connect(library).load()["assets"]}
@@ -0,0 +1,87 @@
+"""
+Tests for the local read cache of core/read_cache.py and its use by the trash
+"""
+
+import os
+
+from matlib.core import fileio, read_cache, storage, trash
+
+
+def _write(path: str, content: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def _cache(tmp_path, library: str, max_bytes: int = 2 << 30) -> read_cache.ReadCache:
+    return read_cache.ReadCache(str(tmp_path / "cache"), library, max_bytes)
+
+
+def test_fetch_copies_a_file_once_until_it_changes(tmp_path, library):
+    cache = _cache(tmp_path, library)
+    local = cache.fetch(library + "mat/1000.mat")
+    assert local.startswith(cache.path)
+    assert open(local, encoding="utf-8").read() == "1000"
+
+    os.remove(local)
+    # Unchanged on the share - the index is trusted
+    assert cache.fetch(library + "mat/1000.mat") == local
+    assert not os.path.exists(local)
+
+    _write(library + "mat/1000.mat", "changed")
+    assert open(cache.fetch(library + "mat/1000.mat"), encoding="utf-8").read() == "changed"
+
+
+def test_files_outside_the_library_and_missing_files_are_not_cached(tmp_path, library):
+    cache = _cache(tmp_path, library)
+    outside = str(tmp_path / "outside.mat")
+    _write(outside, "outside")
+
+    assert cache.fetch(outside) == outside
+    assert cache.fetch(library + "mat/missing.mat") == library + "mat/missing.mat"
+    assert cache.size == 0
+
+
+def test_least_recently_used_files_are_evicted(tmp_path, library):
+    cache = _cache(tmp_path, library, max_bytes=8)
+    first = cache.fetch(library + "mat/1000.mat")
+    second = cache.fetch(library + "mat/1001.mat")
+    cache.fetch(library + "mat/1000.mat")
+    cache.fetch(library + "mat/1002.mat")
+
+    assert cache.size == 8
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+
+
+def test_index_survives_a_restart(tmp_path, library):
+    cache = _cache(tmp_path, library)
+    local = cache.fetch(library + "mat/1000.mat")
+    cache.save_index()
+
+    restarted = _cache(tmp_path, library)
+    assert restarted.size == cache.size
+    os.remove(local)
+    assert restarted.fetch(library + "mat/1000.mat") == local
+
+
+def test_refresh_answers_reads_from_one_listing(tmp_path, library):
+    cache = _cache(tmp_path, library)
+    cache.refresh([library + "mat"])
+    _write(library + "mat/9999.mat", "added after the listing")
+
+    assert cache.fetch(library + "mat/9999.mat") == library + "mat/9999.mat"
+    assert cache.fetch(library + "mat/1000.mat").startswith(cache.path)
+
+
+def test_trash_moves_files_without_caching_them(tmp_path, library):
+    cache = _cache(tmp_path, library)
+    files = storage.FileStorage(library, cache)
+    bin_ = trash.Trash(fileio.LibraryLayout(library), files)
+
+    bin_.move_asset("1000")
+
+    assert cache.size == 0
+    assert not os.path.exists(library + "mat/1000.mat")
+    assert open(bin_.path + "1000/mat", encoding="utf-8").read() == "1000"
+    assert bin_.restore_asset("1000")
+    assert open(library + "mat/1000.mat", encoding="utf-8").read() == "1000"
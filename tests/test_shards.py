@@ -0,0 +1,97 @@
+"""
+Tests for the sharded backend of core/shard_store.py
+"""
+
+import json
+import os
+
+from conftest import read_library
+from matlib.core import database, shard_store
+
+
+def _store(library: str) -> shard_store.ShardStore:
+    return shard_store.ShardStore(library, "mat/", library + database.LOCK_FILE)
+
+
+def _sharded(preferences, library: str) -> database.DatabaseConnector:
+    preferences.backend = "sharded"
+    connection = database.connect(library)
+    connection.configure(preferences)
+    connection.load()
+    return connection
+
+
+def test_import_json_splits_the_library_into_sidecars(library):
+    data = read_library(library)
+    store = shard_store.import_json(
+        library + database.LIBRARY_FILE, library, "mat/", library + database.LOCK_FILE
+    )
+
+    with open(library + shard_store.INDEX_FILE, encoding="utf-8") as f:
+        index = json.load(f)
+    assert index["assets"] == [a["id"] for a in data["assets"]]
+    assert index["categories"] == data["categories"]
+    for asset in data["assets"]:
+        with open(store.sidecar_path(asset["id"]), encoding="utf-8") as f:
+            assert json.load(f) == asset
+    assert store.read_all()["assets"] == data["assets"]
+
+
+def test_first_load_with_the_sharded_backend_imports_the_library(preferences, library):
+    data = read_library(library)
+    connection = _sharded(preferences, library)
+
+    assert database.detect_backend(library) == "sharded"
+    assert connection.load()["assets"] == data["assets"]
+
+
+def test_an_edit_only_rewrites_its_sidecar(preferences, library):
+    connection = _sharded(preferences, library)
+    data = connection.load()
+    files = [library + shard_store.INDEX_FILE] + [
+        library + "mat/" + a["id"] + shard_store.SIDECAR_EXT for a in data["assets"]
+    ]
+    inodes = {path: os.stat(path).st_ino for path in files}
+
+    connection.update_asset(dict(data["assets"][2], name="edited"))
+    connection.flush()
+
+    changed = [path for path in files if os.stat(path).st_ino != inodes[path]]
+    assert changed == [library + "mat/1002" + shard_store.SIDECAR_EXT]
+    assert _store(library).read_all()["assets"][2]["name"] == "edited"
+
+
+def test_sessions_editing_different_assets_merge(library):
+    shard_store.import_json(
+        library + database.LIBRARY_FILE, library, "mat/", library + database.LOCK_FILE
+    )
+    ours = _store(library)
+    theirs = _store(library)
+    data = ours.read_all()
+    theirs.read_all()
+
+    ours.apply([{"op": "asset", "value": dict(data["assets"][0], name="ours")}])
+    theirs.apply([{"op": "asset", "value": dict(data["assets"][1], name="theirs")}])
+    theirs.apply([{"op": "tags", "value": ["a", "theirs"]}])
+    ours.apply([{"op": "remove", "id": "1004"}])
+
+    merged = _store(library).read_all()
+    assert [a["name"] for a in merged["assets"]] == ["ours", "theirs", "mat2", "mat3"]
+    assert merged["tags"] == ["a", "theirs"]
+    assert not os.path.exists(ours.sidecar_path("1004"))
+
+
+def test_read_all_only_parses_changed_sidecars(library):
+    store = shard_store.import_json(
+        library + database.LIBRARY_FILE, library, "mat/", library + database.LOCK_FILE
+    )
+    first = store.read_all()
+    other = _store(library)
+    other.read_all()
+    other.apply([{"op": "asset", "value": dict(first["assets"][3], name="changed")}])
+    cached = store._cache["1000"][1]
+
+    second = store.read_all()
+    assert second["assets"][3]["name"] == "changed"
+    assert store._cache["1000"][1] is cached
+    assert second["assets"][:3] == first["assets"][:3]
@@ -0,0 +1,70 @@
+"""
+Tests for the binary snapshot of core/binary_snapshot.py and its lookup in utils/lookup.py
+"""
+
+import os
+
+from conftest import make_assets, read_library, rewrite_library
+from matlib.core import binary_snapshot, database
+from matlib.utils import lookup
+
+
+def _compile(preferences, library: str) -> dict:
+    preferences.binary_snapshot = True
+    connection = database.connect(library)
+    connection.configure(preferences)
+    data = connection.load()
+    connection.update_asset(dict(data["assets"][1], name="Copper", favorite=True))
+    connection.flush()
+    return data
+
+
+def test_snapshot_round_trips_the_records(preferences, library):
+    data = _compile(preferences, library)
+
+    with binary_snapshot.open_snapshot(library) as snapshot:
+        assert len(snapshot) == len(data["assets"])
+        assert snapshot.categories == data["categories"]
+        assert snapshot.tags == data["tags"]
+        for asset in data["assets"]:
+            assert snapshot.get(asset["id"]) == {k: asset[k] for k in make_assets(1)[0]}
+        assert snapshot.find("copper") == [snapshot.get("1001")]
+        assert snapshot.find("missing") == []
+        assert snapshot.get("missing") is None
+
+
+def test_snapshot_of_a_changed_library_is_not_opened(preferences, library):
+    _compile(preferences, library)
+    database._connections.clear()
+    data = read_library(library)
+    data["assets"][1]["name"] = "Brass"
+    rewrite_library(library, data)
+
+    assert binary_snapshot.open_snapshot(library) is None
+    assert lookup.find_assets(library, "copper") == []
+    assert lookup.find_assets(library, "BRASS")[0]["id"] == "1001"
+    assert lookup.get_asset(library, "1001")["name"] == "Brass"
+
+
+def test_lookup_reads_a_current_snapshot_without_parsing(preferences, library, monkeypatch):
+    _compile(preferences, library)
+
+    def parse(*args, **kwargs):
+        raise AssertionError("the library was parsed")
+
+    monkeypatch.setattr(database, "read_library", parse)
+    assert [a["id"] for a in lookup.find_assets(library, "COPPER")] == ["1001"]
+    assert lookup.get_asset(library, "1003")["name"] == "mat3"
+    assert lookup.get_asset(library, "missing") is None
+
+
+def test_snapshot_is_only_compiled_if_enabled(preferences, library):
+    connection = database.connect(library)
+    connection.update_asset(dict(connection.load()["assets"][0], name="unconfigured"))
+    connection.flush()
+    assert not os.path.exists(library + binary_snapshot.SNAPSHOT_FILE)
+
+    connection.configure(preferences)
+    connection.update_asset(dict(connection.load()["assets"][0], name="disabled"))
+    connection.flush()
+    assert not os.path.exists(library + binary_snapshot.SNAPSHOT_FILE)
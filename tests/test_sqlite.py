@@ -0,0 +1,105 @@
+"""
+Tests for the SQLite backend of core/sqlite_store.py and the lazy rows of core/material.py
+"""
+
+import pytest
+
+from conftest import make_assets, read_library
+from matlib.core import database, material, sqlite_store
+
+
+def _assets() -> list[dict]:
+    assets = make_assets(6)
+    assets[1].update(name="Copper", categories=["Metal", "Wood"], favorite=True)
+    assets[2].update(tags=["b"], renderer="Redshift")
+    assets[3].update(categories=[], tags=[], renderer="Mantra", favorite=True)
+    return assets
+
+
+@pytest.fixture
+def store(tmp_path):
+    opened = sqlite_store.SQLiteStore(str(tmp_path / sqlite_store.SQLITE_FILE))
+    data = {"categories": ["_All", "Metal", "Wood"], "tags": ["a", "b"], "assets": _assets()}
+    opened.write_all(data)
+    yield opened
+    opened.close()
+
+
+def test_import_json_keeps_the_library(library):
+    store = sqlite_store.import_json(
+        library + database.LIBRARY_FILE, library + sqlite_store.SQLITE_FILE
+    )
+    try:
+        assert store.read_all() == read_library(library)
+        assert store.count() == 5
+    finally:
+        store.close()
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {"category": "metal"},
+        {"category": "Wood"},
+        {"tag": "B"},
+        {"renderer": "shift"},
+        {"favorite": True},
+        {"favorite": False, "category": "Metal"},
+        {"name": "mat"},
+        {"name": "COP"},
+    ],
+)
+def test_query_matches_a_scan_of_the_loaded_data(store, library, filters):
+    scanned = database.connect(library)
+    scanned.set({"assets": _assets()})
+
+    assert store.query(**filters) == scanned.query(**filters)
+    assert store.query(**filters)
+
+
+def test_category_and_tag_filters_are_index_lookups(store):
+    plans = [
+        " ".join(str(c) for c in row)
+        for sql in (
+            "SELECT asset_id FROM asset_categories WHERE category = 'Metal' COLLATE NOCASE",
+            "SELECT asset_id FROM asset_tags WHERE tag = 'a' COLLATE NOCASE",
+        )
+        for row in store._conn.execute("EXPLAIN QUERY PLAN " + sql)
+    ]
+    assert all("USING" in plan and "INDEX" in plan for plan in plans)
+
+
+def test_edits_are_written_to_the_store(preferences, library):
+    preferences.backend = "sqlite"
+    connection = database.connect(library)
+    connection.configure(preferences)
+    data = connection.load()
+    connection.update_asset(dict(data["assets"][0], name="stored", categories=["Wood"]))
+    connection.remove_asset("1004")
+    connection.flush()
+    connection.close()
+
+    store = sqlite_store.SQLiteStore(library + sqlite_store.SQLITE_FILE)
+    try:
+        assert [a["id"] for a in store.query(category="wood")] == ["1000"]
+        assert store.count() == 4
+        assert store.read_all()["assets"][0]["name"] == "stored"
+    finally:
+        store.close()
+
+
+def test_material_rows_are_built_on_first_access():
+    assets = _assets()
+    rows = material.MaterialRows(assets)
+
+    assert rows.ids() == [a["id"] for a in assets]
+    assert rows.favorite(1) and not rows.favorite(0)
+    assert all(isinstance(item, dict) for item in list.__iter__(rows))
+
+    assert rows[1].name == "Copper"
+    assert rows[1] is rows[1]
+    assert [type(item) for item in list.__iter__(rows)].count(material.Material) == 1
+    assert rows.record(2) is assets[2]
+    assert rows.record(1) == assets[1]
+    assert [m.mat_id for m in rows[4:]] == ["1004", "1005"]
+    assert [m.name for m in rows] == [a["name"] for a in assets]
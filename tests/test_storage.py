@@ -0,0 +1,74 @@
+"""
+Tests for the storage backends of core/storage.py and the library server they talk to
+"""
+
+import os
+
+import pytest
+
+from conftest import write_library
+from matlib.core import database, library_server, storage, trash
+
+
+def test_configure_binds_storage_and_trash_to_the_connection(tmp_path, preferences):
+    other = write_library(str(tmp_path / "other"), 3)
+    connection = database.connect(other)
+    connection.configure(preferences)
+
+    assert preferences.dir != other
+    assert connection._storage.path == other
+    assert connection.trash.path == trash.trash_path(other)
+    assert storage.for_prefs(preferences, other).path == other
+    assert storage.for_prefs(preferences).path == preferences.dir
+
+
+@pytest.fixture
+def server(library):
+    """A library server for the library fixture on a free port"""
+    served = library_server.LibraryServer(library, port=0)
+    served.start()
+    yield served
+    served.stop()
+
+
+def test_fetch_removes_the_local_copy_of_a_file_removed_on_the_server(tmp_path, server, library):
+    client = storage.HttpStorage(server.url, str(tmp_path / "copy"))
+    local = client.fetch("mat/1000.mat")
+    assert open(local, encoding="utf-8").read() == "1000"
+
+    os.remove(library + "mat/1000.mat")
+    client._validated.clear()
+    assert client.fetch("mat/1000.mat") == local
+    assert not os.path.exists(local)
+    assert "mat/1000.mat" not in storage.HttpStorage(server.url, str(tmp_path / "copy"))._etags
+
+
+def test_fetch_persists_etags_for_the_next_session(tmp_path, server):
+    client = storage.HttpStorage(server.url, str(tmp_path / "copy"))
+    client.fetch("mat/1001.mat")
+
+    restarted = storage.HttpStorage(server.url, str(tmp_path / "copy"))
+    assert restarted._etags["mat/1001.mat"] == client._etags["mat/1001.mat"]
+    status, _, _ = restarted.request(
+        "GET", "files/mat/1001.mat", headers={"If-None-Match": restarted._etags["mat/1001.mat"]}
+    )
+    assert status == 304
+
+
+@pytest.mark.parametrize("backend", ["sqlite", "sharded"])
+def test_server_signature_follows_writes_of_store_backends(preferences, library, backend):
+    preferences.backend = backend
+    session = database.DatabaseConnector(library)
+    session.configure(preferences)
+    session.load()
+    served = library_server.LibraryServer(library, port=0)
+    before = served.signature()
+    assert served.signature() == before
+
+    session.update_asset(dict(session.load()["assets"][2], name="other session"))
+    session.flush()
+    session.close()
+
+    assert served.signature() != before
+    assert served.library()[1].count(b"other session") == 1
+    served.server_close()
@@ -0,0 +1,31 @@
+"""
+Tests for streaming a library chunk by chunk with DatabaseConnector.load_chunks()
+"""
+
+from conftest import read_library, rewrite_library, write_library
+from matlib.core import database
+
+
+def test_load_chunks_streams_all_assets(tmp_path):
+    library = write_library(str(tmp_path / "lib"), 250)
+    connection = database.connect(library)
+    chunks = list(connection.load_chunks(100))
+    assert [len(c) for c in chunks] == [100, 100, 50]
+    assert len(connection.load()["assets"]) == 250
+
+
+def test_load_chunks_reloads_a_library_changed_while_streaming(tmp_path):
+    library = write_library(str(tmp_path / "lib"), 250)
+    connection = database.connect(library)
+    chunks = connection.load_chunks(100)
+    next(chunks)
+
+    data = read_library(library)
+    data["assets"] = data["assets"][:120]
+    rewrite_library(library, data)
+    for _ in chunks:
+        pass
+
+    assert len(connection.load()["assets"]) == 120
+    # Nothing is reported as changed on disk after the reload
+    assert connection.reload() is connection.load()
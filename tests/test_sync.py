@@ -0,0 +1,86 @@
+"""
+Tests for the manifest-based sync between libraries of core/sync.py
+"""
+
+import hashlib
+import json
+import os
+
+import pytest
+
+from conftest import read_library, write_library
+from matlib.core import database, fileio, journal, migrations, sync
+
+
+def _files(directory: str) -> dict[str, str]:
+    """Return the hash of every file below directory by relative path"""
+    found = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                found[os.path.relpath(path, directory)] = hashlib.sha1(f.read()).hexdigest()
+    return found
+
+
+def _library_files(directory: str) -> sync.LibraryFiles:
+    return sync.LibraryFiles(fileio.LibraryLayout(directory))
+
+
+def test_sync_copies_records_and_files(tmp_path, library):
+    target = str(tmp_path / "site") + "/"
+    changes = sync.sync(_library_files(library), _library_files(target))
+
+    assert len(changes["records"]) == 5
+    assert read_library(target)["assets"] == read_library(library)["assets"]
+    assert os.path.exists(target + "mat/1003.interface")
+    assert sync.is_empty(sync.sync(_library_files(library), _library_files(target)))
+
+
+def test_sync_removes_assets_missing_in_the_source(tmp_path, library):
+    target = write_library(str(tmp_path / "site"), 7)
+    sync.sync(_library_files(library), _library_files(target))
+
+    assert len(read_library(target)["assets"]) == 5
+    assert not os.path.exists(target + "mat/1006.mat")
+
+
+def _old_schema_with_journal(library: str) -> None:
+    data = read_library(library)
+    data.pop("schema_version")
+    with open(library + database.LIBRARY_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    journal.Journal(library).append([{"op": "tags", "value": ["a", "b"]}])
+    with open(library + journal.JOURNAL_FILE, "ab") as f:
+        f.write(b'{"op": "torn')
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite", "sharded"])
+def test_dry_run_leaves_both_libraries_untouched(tmp_path, preferences, backend):
+    source = write_library(str(tmp_path / "lib"), 5)
+    target = write_library(str(tmp_path / "site"), 3)
+    if backend == "json":
+        _old_schema_with_journal(source)
+    else:
+        preferences.backend = backend
+        connection = database.connect(source)
+        connection.configure(preferences)
+        connection.load()
+        connection.close()
+        database._connections.clear()
+    before = (_files(source), _files(target))
+
+    changes = sync.sync(_library_files(source), _library_files(target), dry_run=True)
+
+    assert changes["records"] == ["1003", "1004"]
+    assert (_files(source), _files(target)) == before
+
+
+def test_read_library_migrates_in_memory_only(library):
+    _old_schema_with_journal(library)
+    raw = open(library + database.LIBRARY_FILE, "rb").read()
+
+    data = database.read_library(library)
+    assert data["schema_version"] == migrations.SCHEMA_VERSION
+    assert data["tags"] == ["a", "b"]
+    assert open(library + database.LIBRARY_FILE, "rb").read() == raw
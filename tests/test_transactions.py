@@ -0,0 +1,95 @@
+"""
+Tests for grouping edits with DatabaseConnector.transaction()
+"""
+
+import pytest
+
+from conftest import read_library
+from matlib.core import database, events
+
+
+class Recorder:
+    """Collects the kinds of the published events - the bus only keeps a weak reference"""
+
+    def __init__(self) -> None:
+        self.received = []
+
+    def on_changes(self, changes: list[events.Event]) -> None:
+        self.received.append([c.kind for c in changes])
+
+
+def _connection(preferences, library: str) -> database.DatabaseConnector:
+    connection = database.connect(library)
+    connection.configure(preferences)
+    connection.load()
+    return connection
+
+
+def test_edits_inside_a_transaction_are_written_once(preferences, library):
+    connection = _connection(preferences, library)
+    data = connection.load()
+
+    with connection.transaction():
+        assert connection.in_transaction
+        for asset in data["assets"]:
+            connection.update_asset(dict(asset, favorite=True))
+        connection.remove_asset("1004")
+        assert connection.writes_performed == 0
+        assert read_library(library)["assets"][0]["favorite"] is False
+
+    assert not connection.in_transaction
+    assert (connection.writes_requested, connection.writes_performed) == (1, 1)
+    written = read_library(library)["assets"]
+    assert [a["id"] for a in written] == ["1000", "1001", "1002", "1003"]
+    assert all(a["favorite"] for a in written)
+
+
+def test_nested_transactions_write_when_the_outermost_ends(preferences, library):
+    connection = _connection(preferences, library)
+    data = connection.load()
+
+    with connection.transaction():
+        with connection.transaction():
+            connection.update_asset(dict(data["assets"][0], name="inner"))
+        assert connection.in_transaction
+        assert connection.writes_performed == 0
+        connection.update_asset(dict(data["assets"][1], name="outer"))
+
+    assert connection.writes_performed == 1
+    assert [a["name"] for a in read_library(library)["assets"][:2]] == ["inner", "outer"]
+
+
+def test_an_exception_rolls_the_transaction_back(preferences, library):
+    connection = _connection(preferences, library)
+    data = connection.load()
+    before = read_library(library)
+    recorder = Recorder()
+    connection.subscribe(recorder.on_changes)
+    with pytest.raises(RuntimeError):
+        with connection.transaction():
+            connection.update_asset(dict(data["assets"][0], name="rolled back"))
+            connection.remove_asset("1001")
+            connection.add_categories(["Wood"])
+            raise RuntimeError("import failed")
+
+    assert not connection.in_transaction
+    assert connection.load() is data
+    assert data["assets"] == before["assets"]
+    assert data["categories"] == before["categories"]
+    assert recorder.received == [[events.RELOADED]]
+    connection.flush()
+    assert connection.writes_performed == 0
+    assert read_library(library) == before
+
+
+def test_a_transaction_is_one_undo_step(preferences, library):
+    connection = _connection(preferences, library)
+    data = connection.load()
+
+    with connection.transaction():
+        connection.update_asset(dict(data["assets"][0], name="first"))
+        connection.update_asset(dict(data["assets"][1], name="second"))
+
+    assert connection.undo()
+    assert [a["name"] for a in read_library(library)["assets"][:2]] == ["mat0", "mat1"]
+    assert connection.undo() is None
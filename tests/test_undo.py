@@ -0,0 +1,22 @@
+"""
+Tests for undo and redo of library edits and the trash of removed asset files
+"""
+
+import os
+
+from conftest import read_library
+from matlib.core import database
+
+
+def test_removed_asset_files_are_trashed_and_restored_by_undo(preferences, library):
+    connection = database.connect(library)
+    connection.configure(preferences)
+    connection.load()
+
+    connection.trash.move_asset("1001")
+    connection.remove_asset("1001")
+    assert not os.path.exists(library + "mat/1001.mat")
+
+    connection.undo()
+    assert os.path.exists(library + "mat/1001.mat")
+    assert "1001" in {a["id"] for a in read_library(library)["assets"]}
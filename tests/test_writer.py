@@ -0,0 +1,135 @@
+"""
+Tests for writing library snapshots on the background writer thread of core/writer.py
+"""
+
+import errno
+import threading
+
+import pytest
+
+from conftest import read_library
+from matlib.core import database, fileio, writer
+
+
+def test_newer_snapshots_replace_pending_ones_and_carry_their_changes():
+    started = threading.Event()
+    release = threading.Event()
+    written = []
+
+    def write(snapshot, changed):
+        written.append((snapshot["n"], changed))
+        started.set()
+        release.wait(5)
+
+    background = writer.BackgroundWriter(write)
+    background.submit({"n": 0}, {"a": 0})
+    assert started.wait(5)
+    background.submit({"n": 1}, {"b": 1})
+    background.submit({"n": 2}, {"c": 2})
+    release.set()
+    background.wait()
+
+    assert written == [(0, {"a": 0}), (2, {"b": 1, "c": 2})]
+    assert background.superseded == 1
+    assert background.queue_depth == 0
+
+
+def test_failed_writes_are_raised_once_and_carried_over():
+    calls = []
+    failures = []
+
+    def write(snapshot, changed):
+        calls.append(changed)
+        if len(calls) == 1:
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+    background = writer.BackgroundWriter(write, failed=lambda: failures.append(True))
+    background.submit({}, {"a": 0})
+    with pytest.raises(OSError):
+        background.wait()
+    background.wait()
+    assert failures == [True]
+
+    background.submit({}, {"b": 1})
+    background.wait()
+    assert calls[-1] == {"a": 0, "b": 1}
+
+
+def test_aborted_writes_are_handed_back_without_a_message(capsys):
+    def write(snapshot, changed):
+        raise writer.Aborted()
+
+    background = writer.BackgroundWriter(write)
+    background.submit({}, None)
+    with pytest.raises(writer.Aborted):
+        background.wait()
+    assert capsys.readouterr().out == ""
+
+
+def _disk_full(*args, **kwargs):
+    raise OSError(errno.ENOSPC, "No space left on device")
+
+
+def _configure(connection: database.DatabaseConnector, preferences) -> None:
+    # Saves wait for flush() - the test decides when the writer thread runs
+    preferences.background_save = True
+    preferences.save_delay = 60000
+    connection.configure(preferences)
+
+
+def test_failed_background_write_is_written_by_flush(qapp, preferences, library, monkeypatch):
+    connection = database.connect(library)
+    _configure(connection, preferences)
+    data = connection.load()
+    atomic_write = fileio.atomic_write
+
+    monkeypatch.setattr(fileio, "atomic_write", _disk_full)
+    connection.update_asset(dict(data["assets"][1], name="edited"))
+    with pytest.raises(OSError):
+        connection.flush()
+    assert read_library(library)["assets"][1]["name"] == "mat1"
+
+    monkeypatch.setattr(fileio, "atomic_write", atomic_write)
+    connection.flush()
+    assert read_library(library)["assets"][1]["name"] == "edited"
+
+
+def test_failure_reported_to_the_ui_thread_keeps_the_edit(
+    qapp, preferences, library, monkeypatch
+):
+    connection = database.connect(library)
+    _configure(connection, preferences)
+    data = connection.load()
+    atomic_write = fileio.atomic_write
+    monkeypatch.setattr(fileio, "atomic_write", _disk_full)
+
+    connection.update_asset(dict(data["assets"][2], favorite=True))
+    connection._submit()
+    while connection.queue_depth:
+        qapp.processEvents()
+    # The writer thread relays the failure - the data is pending again
+    qapp.processEvents()
+    assert connection._dirty
+
+    monkeypatch.setattr(fileio, "atomic_write", atomic_write)
+    connection.close()
+    assert read_library(library)["assets"][2]["favorite"] is True
+
+
+def test_snapshot_written_by_another_session_is_merged(qapp, preferences, library):
+    connection = database.connect(library)
+    _configure(connection, preferences)
+    data = connection.load()
+
+    other = database.DatabaseConnector(library)
+    theirs = other.load()
+    theirs["assets"][0]["name"] = "theirs"
+    other._background = False
+    other.save()
+    other.flush()
+
+    connection.update_asset(dict(data["assets"][3], name="ours"))
+    connection.flush()
+    written = read_library(library)
+    assert written["assets"][0]["name"] == "theirs"
+    assert written["assets"][3]["name"] == "ours"